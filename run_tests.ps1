@@ -1 +1,4 @@
-python -m unittest discover -s "tests/ai" -p "*_tests.py" -v
\ No newline at end of file
+python -m unittest discover -s "tests/ai" -p "*_tests.py" -v
+python -m unittest discover -s "tests/db" -p "*_tests.py" -v
+python -m unittest discover -s "tests/utilities" -p "*_tests.py" -v
+python -m unittest discover -s "tests/documents" -p "*_tests.py" -v
\ No newline at end of file
@@ -154,8 +154,7 @@ class GenericToolsAgent(BaseSingleActionAgent):
             if hasattr(tool_results, "dict"):
                 tool_results = tool_results.dict()
 
-            self.conversation_manager.conversations_helper.add_tool_call_results(
-                conversation_id=self.conversation_manager.conversation_id,
+            self.conversation_manager.add_tool_call_results(
                 tool_name=intermediate_steps[-1][0].tool,
                 tool_arguments=json.dumps(intermediate_steps[-1][0].tool_input),
                 tool_results=tool_results,
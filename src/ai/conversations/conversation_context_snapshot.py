@@ -0,0 +1,45 @@
+import threading
+from typing import Callable, Dict
+
+
+class ConversationContextSnapshot:
+    """The prompt fragments for one conversation turn.
+
+    Every agent step (planning, tool use, answering) includes the same context in its prompt,
+    so each fragment is rendered the first time it is asked for and then served from memory
+    until the turn ends or something that changes it (e.g. a tool call) invalidates it.
+    """
+
+    SYSTEM = "system"
+    LOADED_DOCUMENTS = "loaded_documents"
+    SELECTED_REPOSITORY = "selected_repository"
+    PREVIOUS_TOOL_CALLS = "previous_tool_calls"
+    CHAT_HISTORY = "chat_history"
+    USER_SETTINGS = "user_settings"
+
+    def __init__(self, renderers: Dict[str, Callable[[], str]]):
+        """Creates a new snapshot.
+
+        Args:
+            renderers (dict): Map of fragment name -> function that renders the fragment.
+        """
+        self._renderers = renderers
+        self._fragments = {}
+        self._lock = threading.RLock()
+
+    def get(self, fragment_name: str) -> str:
+        with self._lock:
+            if fragment_name not in self._fragments:
+                self._fragments[fragment_name] = self._renderers[fragment_name]()
+
+            return self._fragments[fragment_name]
+
+    def invalidate(self, *fragment_names: str) -> None:
+        """Discards the given fragments, or all of them if none are given, so they are rendered again."""
+        with self._lock:
+            if not fragment_names:
+                self._fragments.clear()
+                return
+
+            for fragment_name in fragment_names:
+                self._fragments.pop(fragment_name, None)
@@ -3,6 +3,9 @@ from typing import List, Union
 from uuid import UUID
 
 from src.ai.agents.general.generic_tool import GenericTool
+from src.ai.conversations.conversation_context_snapshot import (
+    ConversationContextSnapshot,
+)
 from src.ai.utilities.system_info import get_system_information
 from src.db.models.code import Code
 
@@ -33,6 +36,7 @@ class ConversationManager:
         user_email: str,
         prompt_manager: PromptManager,
         max_conversation_history_tokens: int = 1000,
+        conversation_history_model_name: str = None,
         uses_conversation_history: bool = True,
         collection_id: int = None,
         selected_repository: CodeRepositoryModel = None,
@@ -51,6 +55,19 @@ class ConversationManager:
 
         self.prompt_manager = prompt_manager
         self.tool_kwargs = tool_kwargs
+
+        # The prompt fragments for the current turn, see refresh_context_snapshot
+        self.context_snapshot = ConversationContextSnapshot(
+            {
+                ConversationContextSnapshot.SYSTEM: self._render_system_prompt,
+                ConversationContextSnapshot.LOADED_DOCUMENTS: self._render_loaded_documents_prompt,
+                ConversationContextSnapshot.SELECTED_REPOSITORY: self._render_selected_repository_prompt,
+                ConversationContextSnapshot.PREVIOUS_TOOL_CALLS: self._render_previous_tool_calls_prompt,
+                ConversationContextSnapshot.CHAT_HISTORY: self._render_chat_history_prompt,
+                ConversationContextSnapshot.USER_SETTINGS: self._render_user_settings_prompt,
+            }
+        )
+
         self.collection_id = collection_id
 
         if selected_repository is not None:
@@ -96,11 +113,44 @@ class ConversationManager:
                 # Create the conversation memory
                 if uses_conversation_history:
                     self._create_default_conversation_memory(
-                        max_conversation_history_tokens
+                        max_conversation_history_tokens,
+                        conversation_history_model_name,
                     )
             else:
                 self.conversation_token_buffer_memory = override_memory
 
+    @property
+    def collection_id(self):
+        return self._collection_id
+
+    @collection_id.setter
+    def collection_id(self, collection_id: int):
+        self._collection_id = collection_id
+        self.context_snapshot.invalidate(ConversationContextSnapshot.LOADED_DOCUMENTS)
+
+    def refresh_context_snapshot(self):
+        """Discards the prompt fragments from the previous turn, they are rendered again when next used."""
+        self.context_snapshot.invalidate()
+
+    def add_tool_call_results(
+        self,
+        tool_name: str,
+        tool_arguments: str,
+        tool_results,
+        include_in_conversation: bool = False,
+    ):
+        self.conversations_helper.add_tool_call_results(
+            conversation_id=self.conversation_id,
+            tool_name=tool_name,
+            tool_arguments=tool_arguments,
+            tool_results=tool_results,
+            include_in_conversation=include_in_conversation,
+        )
+
+        self.context_snapshot.invalidate(
+            ConversationContextSnapshot.PREVIOUS_TOOL_CALLS
+        )
+
     def set_conversation_summary(self, summary: str):
         """Sets the conversation summary to the specified summary."""
 
@@ -117,6 +167,10 @@ class ConversationManager:
             self.conversation_id, repository.id if repository is not None else -1
         )
 
+        self.context_snapshot.invalidate(
+            ConversationContextSnapshot.SELECTED_REPOSITORY
+        )
+
     def get_selected_repository(self) -> CodeRepositoryModel:
         """Gets the selected repository, if any, for the current conversation."""
 
@@ -128,6 +182,11 @@ class ConversationManager:
         return None
 
     def get_previous_tool_calls_prompt(self):
+        return self.context_snapshot.get(
+            ConversationContextSnapshot.PREVIOUS_TOOL_CALLS
+        )
+
+    def _render_previous_tool_calls_prompt(self):
         previous_tool_calls = self._get_previous_tool_call_headers()
 
         if previous_tool_calls and len(previous_tool_calls) > 0:
@@ -142,6 +201,9 @@ class ConversationManager:
         return previous_tool_calls_prompt
 
     def get_user_settings_prompt(self):
+        return self.context_snapshot.get(ConversationContextSnapshot.USER_SETTINGS)
+
+    def _render_user_settings_prompt(self):
         settings_prompt = ""
 
         get_user_settings_enabled = self.user_settings_helper.get_user_setting(
@@ -162,6 +224,10 @@ class ConversationManager:
 
         return settings_prompt
 
+    def preload_user_settings(self):
+        """Loads all of the user's settings in one query, so the reads during a request are served from memory."""
+        self.user_settings_helper.preload_user_settings(self.user_id)
+
     def get_all_user_settings(self) -> List[UserSettingModel]:
         return self.user_settings_helper.get_user_settings(
             user_id=self.user_id, available_for_llm=True
@@ -178,13 +244,19 @@ class ConversationManager:
         )
 
     def set_user_setting(self, setting_name: str, setting_value: str) -> None:
-        return self.user_settings_helper.add_update_user_setting(
+        self.user_settings_helper.add_update_user_setting(
             user_id=self.user_id,
             setting_name=setting_name,
             setting_value=setting_value,
             available_for_llm=True,
         )
 
+        # Settings can enable tools that change the previous tool calls prompt, too
+        self.context_snapshot.invalidate(
+            ConversationContextSnapshot.USER_SETTINGS,
+            ConversationContextSnapshot.PREVIOUS_TOOL_CALLS,
+        )
+
     def get_available_tool_descriptions(self, tools: List[GenericTool]):
         tool_strings = []
         for tool in tools:
@@ -242,6 +314,11 @@ class ConversationManager:
         return "\n----\n".join(tool_call_list)
 
     def get_selected_repository_prompt(self):
+        return self.context_snapshot.get(
+            ConversationContextSnapshot.SELECTED_REPOSITORY
+        )
+
+    def _render_selected_repository_prompt(self):
         selected_repo = self.get_selected_repository()
 
         if selected_repo:
@@ -272,7 +349,7 @@ class ConversationManager:
         ]
 
     def get_loaded_documents_count(self):
-        """Gets the loaded documents for the specified collection."""
+        """Gets the number of loaded documents in the specified collection."""
 
         if self.collection_id is None:
             logging.warning(
@@ -280,7 +357,7 @@ class ConversationManager:
             )
             return 0
 
-        return len(self.documents_helper.get_files_in_collection(self.collection_id))
+        return self.documents_helper.get_file_count_in_collection(self.collection_id)
 
     def get_loaded_documents_for_reference(self):
         """Gets the loaded documents for the specified collection."""
@@ -315,6 +392,9 @@ class ConversationManager:
         ]
 
     def get_loaded_documents_prompt(self):
+        return self.context_snapshot.get(ConversationContextSnapshot.LOADED_DOCUMENTS)
+
+    def _render_loaded_documents_prompt(self):
         loaded_documents = self.get_loaded_documents_for_reference()
 
         if loaded_documents:
@@ -332,6 +412,9 @@ class ConversationManager:
         return self.conversations_helper.get_conversation(self.conversation_id)
 
     def get_chat_history_prompt(self):
+        return self.context_snapshot.get(ConversationContextSnapshot.CHAT_HISTORY)
+
+    def _render_chat_history_prompt(self):
         chat_history = self._get_chat_history()
 
         if chat_history and len(chat_history) > 0:
@@ -349,6 +432,9 @@ class ConversationManager:
         return self.conversation_token_buffer_memory.buffer_as_str
 
     def get_system_prompt(self):
+        return self.context_snapshot.get(ConversationContextSnapshot.SYSTEM)
+
+    def _render_system_prompt(self):
         system_prompt = self.prompt_manager.get_prompt_by_template_name(
             "SYSTEM_TEMPLATE",
         ).format(
@@ -382,7 +468,9 @@ class ConversationManager:
                 f"Interaction ID: {self.conversation_id} already exists for user {user_id}, needs summary: {self.conversation_needs_summary}"
             )
 
-    def _create_default_conversation_memory(self, max_conversation_history_tokens):
+    def _create_default_conversation_memory(
+        self, max_conversation_history_tokens, model_name: str = None
+    ):
         """Creates the conversation memory for the conversation."""
 
         self.postgres_chat_message_history = PostgresChatMessageHistory(
@@ -399,6 +487,10 @@ class ConversationManager:
             max_token_limit=max_conversation_history_tokens,
         )
 
+        # Count the history tokens with the tokenizer for the model it is sent to
+        if model_name:
+            self.conversation_token_buffer_memory.model_name = model_name
+
         self.conversation_token_buffer_memory.human_prefix = (
             f"{self.user_name} ({self.user_email})"
         )
@@ -1,7 +1,6 @@
 import json
 import logging
 from uuid import UUID
-from typing import List
 
 from langchain.agents import AgentExecutor
 from src.ai.prompts.prompt_models.code_details_extraction import (
@@ -16,12 +15,7 @@ from src.ai.prompts.prompt_models.conversational import (
     ConversationalInput,
     ConversationalOutput,
 )
-from src.ai.prompts.prompt_models.document_summary import (
-    DocumentChunkSummaryInput,
-    DocumentSummaryOutput,
-)
 from src.ai.prompts.prompt_models.question_generation import (
-    QuestionGenerationInput,
     QuestionGenerationOutput,
 )
 from src.ai.prompts.query_helper import QueryHelper
@@ -31,12 +25,13 @@ from src.configuration.model_configuration import (
 )
 from src.ai.conversations.conversation_manager import ConversationManager
 from src.ai.utilities.llm_helper import get_llm
+from src.ai.utilities.document_enrichment import DocumentEnrichment
+from src.ai.utilities.enrichment_engine import EnrichmentEngine
 from src.ai.prompts.prompt_manager import PromptManager
 from src.ai.utilities.system_info import get_system_information
 from src.ai.agents.general.generic_tools_agent import GenericToolsAgent
 from src.db.models.user_settings import UserSettings
 from src.db.models.users import Users
-from src.tools.documents.document_tool import DocumentTool
 from src.ai.tools.tool_manager import ToolManager
 
 
@@ -105,12 +100,18 @@ class RetrievalAugmentedGenerationAI:
             user_email=user_email,
             prompt_manager=self.prompt_manager,
             max_conversation_history_tokens=self.jarvis_ai_model_configuration.max_conversation_history_tokens,
+            conversation_history_model_name=self.jarvis_ai_model_configuration.model,
             uses_conversation_history=self.jarvis_ai_model_configuration.uses_conversation_history,
             override_memory=override_memory,
         )
 
         self.query_helper = QueryHelper(prompt_manager=self.prompt_manager)
 
+        # The LLM calls used when ingesting files, shared with the ingestion workers
+        self.document_enrichment = DocumentEnrichment(
+            self.file_ingestion_model_configuration, self.prompt_manager
+        )
+
         # Initialize the tool manager and load the available tools
         self.tool_manager = ToolManager(
             configuration=self.configuration,
@@ -149,6 +150,10 @@ class RetrievalAugmentedGenerationAI:
         kwargs: dict = {},
         ai_mode: str = None,
     ):
+        # Refresh the user's settings and the prompt context once, the rest of the request reads them from memory
+        self.conversation_manager.preload_user_settings()
+        self.conversation_manager.refresh_context_snapshot()
+
         # Set the document collection id on the conversation manager
         self.conversation_manager.collection_id = collection_id
 
@@ -186,6 +191,7 @@ class RetrievalAugmentedGenerationAI:
         self.conversation_manager.conversation_token_buffer_memory.save_context(
             inputs={"input": query}, outputs={"output": output}
         )
+        self.conversation_manager.refresh_context_snapshot()
 
         logging.debug(output)
         logging.debug("Added results to chat memory")
@@ -312,59 +318,24 @@ class RetrievalAugmentedGenerationAI:
         self,
         chunk_text: str,
     ) -> str:
-        llm = get_llm(
-            self.file_ingestion_model_configuration,
-            tags=["generate_detailed_document_chunk_summary"],
-            streaming=False,
-        )
+        return self.document_enrichment.summarize_chunk(chunk_text)
 
-        input_object = DocumentChunkSummaryInput(chunk_text=chunk_text)
-
-        result = self.query_helper.query_llm(
-            llm=llm,
-            prompt_template_name="DETAILED_DOCUMENT_CHUNK_SUMMARY_TEMPLATE",
-            input_class_instance=input_object,
-            output_class_type=DocumentSummaryOutput,
-        )
-
-        return result.summary
+    # Used by the Jarvis UI to run the ingestion LLM calls concurrently
+    def create_enrichment_engine(self) -> EnrichmentEngine:
+        return self.document_enrichment.create_enrichment_engine()
 
     # Required by the Jarvis UI when generating questions for ingested files
     def create_summary_and_chunk_questions(
         self, text: str, number_of_questions: int = 5
-    ) -> List:
-        llm = get_llm(
-            self.file_ingestion_model_configuration,
-            tags=["generate_chunk_questions"],
-            streaming=False,
-        )
-
-        input_object = QuestionGenerationInput(
-            document_text=text, number_of_questions=number_of_questions
-        )
-
-        result = self.query_helper.query_llm(
-            llm=llm,
-            prompt_template_name="CHUNK_QUESTIONS_TEMPLATE",
-            input_class_instance=input_object,
-            output_class_type=QuestionGenerationOutput,
+    ) -> QuestionGenerationOutput:
+        return self.document_enrichment.create_summary_and_chunk_questions(
+            text, number_of_questions=number_of_questions
         )
 
-        return result
-
     def generate_detailed_document_summary(
         self,
         file_id: int,
     ) -> str:
-        llm = get_llm(
-            self.file_ingestion_model_configuration,
-            tags=["retrieval-augmented-generation-ai"],
-            streaming=False,
-        )
-
-        document_tool = DocumentTool(self.configuration, self.conversation_manager)
-        document_summary = document_tool.summarize_entire_document_with_llm(
-            llm, file_id
+        return self.document_enrichment.summarize_file(
+            file_id, enrichment_engine=self.create_enrichment_engine()
         )
-
-        return document_summary
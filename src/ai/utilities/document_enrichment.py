@@ -0,0 +1,162 @@
+from src.ai.prompts.prompt_manager import PromptManager
+from src.ai.prompts.prompt_models.document_summary import (
+    DocumentChunkSummaryInput,
+    DocumentSummaryOutput,
+    DocumentSummaryRefineInput,
+)
+from src.ai.prompts.prompt_models.question_generation import (
+    QuestionGenerationInput,
+    QuestionGenerationOutput,
+)
+from src.ai.prompts.query_helper import QueryHelper
+from src.ai.utilities.enrichment_engine import (
+    EnrichmentEngine,
+    create_enrichment_engine,
+)
+from src.ai.utilities.llm_helper import get_llm
+from src.configuration.model_configuration import ModelConfiguration
+from src.db.models.documents import Documents
+
+
+class DocumentEnrichment:
+    """The LLM calls that enrich ingested documents- chunk questions, chunk summaries, and whole document summaries.
+
+    Shared by the UI ingestion (RAGAI), the ingestion workers (IngestionAI), and the Summarize Entire Document tool.
+    """
+
+    def __init__(
+        self,
+        model_configuration: ModelConfiguration,
+        prompt_manager: PromptManager = None,
+    ):
+        if isinstance(model_configuration, dict):
+            model_configuration = ModelConfiguration(**model_configuration)
+
+        self.model_configuration = model_configuration
+        self.prompt_manager = prompt_manager or PromptManager(
+            llm_type=model_configuration.llm_type
+        )
+        self.query_helper = QueryHelper(self.prompt_manager)
+
+    def create_enrichment_engine(self) -> EnrichmentEngine:
+        return create_enrichment_engine(self.model_configuration)
+
+    def create_summary_and_chunk_questions(
+        self, text: str, number_of_questions: int = 5
+    ) -> QuestionGenerationOutput:
+        llm = get_llm(
+            self.model_configuration,
+            tags=["generate_chunk_questions"],
+            streaming=False,
+        )
+
+        input_object = QuestionGenerationInput(
+            document_text=text, number_of_questions=number_of_questions
+        )
+
+        return self.query_helper.query_llm(
+            llm=llm,
+            prompt_template_name="CHUNK_QUESTIONS_TEMPLATE",
+            input_class_instance=input_object,
+            output_class_type=QuestionGenerationOutput,
+        )
+
+    def summarize_chunk(self, chunk_text: str, llm=None) -> str:
+        if llm is None:
+            llm = get_llm(
+                self.model_configuration,
+                tags=["generate_detailed_document_chunk_summary"],
+                streaming=False,
+            )
+
+        input_object = DocumentChunkSummaryInput(chunk_text=chunk_text)
+
+        result = self.query_helper.query_llm(
+            llm=llm,
+            prompt_template_name="DETAILED_DOCUMENT_CHUNK_SUMMARY_TEMPLATE",
+            input_class_instance=input_object,
+            output_class_type=DocumentSummaryOutput,
+        )
+
+        return result.summary
+
+    def summarize_file(
+        self,
+        file_id: int,
+        llm=None,
+        enrichment_engine: EnrichmentEngine = None,
+    ) -> str:
+        """Summarizes a file by refining a summary over its chunks, and stores it on the file.
+
+        Args:
+            file_id (int): The file to summarize
+            llm: The LLM to use, defaults to one from the model configuration
+            enrichment_engine (EnrichmentEngine): If given, the missing chunk summaries are created concurrently with it
+        """
+        if llm is None:
+            llm = get_llm(
+                self.model_configuration,
+                tags=["retrieval-augmented-generation-ai"],
+                streaming=False,
+            )
+
+        documents = Documents()
+        file = documents.get_file(file_id)
+
+        # Is there a summary already?  If so, return that instead of re-running the summarization.
+        if file.file_summary and file.file_summary != "":
+            return file.file_summary
+
+        document_chunks = documents.get_document_chunks_by_file_id(
+            target_file_id=file_id
+        )
+
+        # The chunk summaries don't depend on each other, so if we were given an engine, create the missing ones concurrently-
+        # only the refine step has to go through the chunks one at a time
+        if enrichment_engine:
+            unsummarized_chunks = [
+                c for c in document_chunks if not c.document_text_has_summary
+            ]
+            chunk_summaries = enrichment_engine.map(
+                lambda chunk: self.summarize_chunk(chunk.document_text, llm=llm),
+                unsummarized_chunks,
+                estimate_tokens=lambda chunk: enrichment_engine.estimate_tokens(
+                    chunk.document_text
+                ),
+            )
+
+            for chunk, chunk_summary in zip(unsummarized_chunks, chunk_summaries):
+                documents.set_document_text_summary(
+                    chunk.id, chunk_summary, file.collection_id
+                )
+                chunk.document_text_summary = chunk_summary
+                chunk.document_text_has_summary = True
+
+        existing_summary = "No summary yet!"
+
+        for chunk in document_chunks:
+            if not chunk.document_text_has_summary:
+                chunk_summary = self.summarize_chunk(chunk.document_text, llm=llm)
+                documents.set_document_text_summary(
+                    chunk.id, chunk_summary, file.collection_id
+                )
+
+            result = self.query_helper.query_llm(
+                llm=llm,
+                prompt_template_name="DOCUMENT_REFINE_TEMPLATE",
+                input_class_instance=DocumentSummaryRefineInput(
+                    text=chunk.document_text, existing_summary=existing_summary
+                ),
+                output_class_type=DocumentSummaryOutput,
+            )
+
+            existing_summary = result.summary
+
+        # Put the summary into the DB so we don't have to re-run this.
+        documents.update_file_summary_and_class(
+            file_id=file.id,
+            summary=existing_summary,
+            classification=file.file_classification,
+        )
+
+        return existing_summary
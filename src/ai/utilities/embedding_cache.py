@@ -0,0 +1,277 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Union
+
+from src.utilities.configuration_utilities import get_app_configuration
+
+# A two-tier cache for embeddings: a bounded in-process LRU in front of a table in Postgres.
+# Entries are keyed by (embedding model, instruction, sha256 of the text), so the same text
+# embedded with a different model or instruction is cached separately.
+# The database tier also counts the stored documents using each entry (see Documents), and only
+# evicts entries no document uses- so text that is already in any collection is never embedded again.
+
+DEFAULT_EMBEDDING_CACHE_CONFIGURATION = {
+    "enabled": True,
+    "max_memory_entries": 10000,
+    "database_enabled": True,
+    "max_database_entries": 1000000,
+    # How many database writes to allow between checks for eviction
+    "database_eviction_interval": 1000,
+}
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCacheStatistics:
+    def __init__(self):
+        self.memory_hits = 0
+        self.database_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.database_evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.database_hits + self.misses
+
+        if lookups == 0:
+            return 0.0
+
+        return (self.memory_hits + self.database_hits) / lookups
+
+    def to_dict(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "database_hits": self.database_hits,
+            "misses": self.misses,
+            "memory_evictions": self.memory_evictions,
+            "database_evictions": self.database_evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_memory_entries: int = DEFAULT_EMBEDDING_CACHE_CONFIGURATION[
+            "max_memory_entries"
+        ],
+        database_enabled: bool = DEFAULT_EMBEDDING_CACHE_CONFIGURATION[
+            "database_enabled"
+        ],
+        max_database_entries: int = DEFAULT_EMBEDDING_CACHE_CONFIGURATION[
+            "max_database_entries"
+        ],
+        database_eviction_interval: int = DEFAULT_EMBEDDING_CACHE_CONFIGURATION[
+            "database_eviction_interval"
+        ],
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.database_enabled = database_enabled
+        self.max_database_entries = max_database_entries
+        self.database_eviction_interval = database_eviction_interval
+
+        self.statistics = EmbeddingCacheStatistics()
+
+        self._memory_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._database_writes = 0
+        self._database_store = None
+
+    @property
+    def database_store(self):
+        if self._database_store is None:
+            # Imported here to avoid pulling in the database when only the memory tier is used
+            from src.db.models.embedding_cache import EmbeddingCacheStore
+
+            self._database_store = EmbeddingCacheStore()
+
+        return self._database_store
+
+    def get(
+        self, model_name: str, instruction: str, text: str
+    ) -> Union[List[float], None]:
+        return self.get_many(model_name, instruction, [text])[0]
+
+    def get_many(
+        self, model_name: str, instruction: str, texts: List[str]
+    ) -> List[Union[List[float], None]]:
+        """Looks up the embeddings for the texts, returning None for any that aren't cached"""
+        instruction = instruction or ""
+        text_hashes = [get_text_hash(text) for text in texts]
+        embeddings = [None] * len(texts)
+
+        with self._lock:
+            for index, text_hash in enumerate(text_hashes):
+                key = (model_name, instruction, text_hash)
+                embedding = self._memory_cache.get(key, None)
+
+                if embedding is not None:
+                    self._memory_cache.move_to_end(key)
+                    self.statistics.memory_hits += 1
+                    embeddings[index] = embedding
+
+        missing_hashes = list(
+            dict.fromkeys(
+                text_hashes[index]
+                for index, embedding in enumerate(embeddings)
+                if embedding is None
+            )
+        )
+
+        database_embeddings = {}
+        if self.database_enabled and missing_hashes:
+            try:
+                database_embeddings = self.database_store.get_embeddings(
+                    model_name, instruction, missing_hashes
+                )
+            except Exception as e:
+                logging.warning(f"Could not read from the embedding cache: {e}")
+
+        for index, text_hash in enumerate(text_hashes):
+            if embeddings[index] is not None:
+                continue
+
+            embedding = database_embeddings.get(text_hash, None)
+
+            with self._lock:
+                if embedding is not None:
+                    self.statistics.database_hits += 1
+                else:
+                    self.statistics.misses += 1
+
+            if embedding is not None:
+                self._put_memory((model_name, instruction, text_hash), embedding)
+                embeddings[index] = embedding
+
+        return embeddings
+
+    def put(
+        self, model_name: str, instruction: str, text: str, embedding: List[float]
+    ) -> None:
+        self.put_many(model_name, instruction, [text], [embedding])
+
+    def put_many(
+        self,
+        model_name: str,
+        instruction: str,
+        texts: List[str],
+        embeddings: List[List[float]],
+    ) -> None:
+        instruction = instruction or ""
+        hashed_embeddings = {
+            get_text_hash(text): embedding for text, embedding in zip(texts, embeddings)
+        }
+
+        for text_hash, embedding in hashed_embeddings.items():
+            self._put_memory((model_name, instruction, text_hash), embedding)
+
+        if self.database_enabled and hashed_embeddings:
+            try:
+                self.database_store.add_embeddings(
+                    model_name, instruction, hashed_embeddings
+                )
+                self._evict_database_if_needed(len(hashed_embeddings))
+            except Exception as e:
+                logging.warning(f"Could not write to the embedding cache: {e}")
+
+    def add_references(self, model_name: str, instruction: str, texts: List[str]) -> None:
+        """Records that stored documents use the embeddings of the texts, so they aren't evicted"""
+        self._update_reference_counts(model_name, instruction, texts, 1)
+
+    def remove_references(
+        self, model_name: str, instruction: str, texts: List[str]
+    ) -> None:
+        """Records that stored documents no longer use the embeddings of the texts"""
+        self._update_reference_counts(model_name, instruction, texts, -1)
+
+    def _update_reference_counts(
+        self, model_name: str, instruction: str, texts: List[str], change: int
+    ) -> None:
+        if not self.database_enabled or not texts:
+            return
+
+        text_hash_counts = {}
+        for text in texts:
+            text_hash = get_text_hash(text)
+            text_hash_counts[text_hash] = text_hash_counts.get(text_hash, 0) + change
+
+        try:
+            self.database_store.update_reference_counts(
+                model_name, instruction or "", text_hash_counts
+            )
+        except Exception as e:
+            logging.warning(f"Could not update the embedding cache references: {e}")
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory_cache.clear()
+
+    def _put_memory(self, key: tuple, embedding: List[float]) -> None:
+        with self._lock:
+            self._memory_cache[key] = embedding
+            self._memory_cache.move_to_end(key)
+
+            while len(self._memory_cache) > self.max_memory_entries:
+                self._memory_cache.popitem(last=False)
+                self.statistics.memory_evictions += 1
+
+    def _evict_database_if_needed(self, writes: int) -> None:
+        with self._lock:
+            self._database_writes += writes
+
+            if self._database_writes < self.database_eviction_interval:
+                return
+
+            self._database_writes = 0
+
+        evicted = self.database_store.evict_least_recently_used(
+            self.max_database_entries
+        )
+
+        with self._lock:
+            self.statistics.database_evictions += evicted
+
+
+_embedding_cache = None
+_embedding_cache_loaded = False
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Union[EmbeddingCache, None]:
+    """Gets the process-wide embedding cache, or None if it has been disabled in the configuration"""
+    global _embedding_cache, _embedding_cache_loaded
+
+    with _embedding_cache_lock:
+        if not _embedding_cache_loaded:
+            _embedding_cache_loaded = True
+
+            configuration = dict(DEFAULT_EMBEDDING_CACHE_CONFIGURATION)
+            configuration.update(
+                get_app_configuration()["jarvis_ai"].get("embedding_cache", {})
+            )
+
+            if configuration["enabled"]:
+                _embedding_cache = EmbeddingCache(
+                    max_memory_entries=configuration["max_memory_entries"],
+                    database_enabled=configuration["database_enabled"],
+                    max_database_entries=configuration["max_database_entries"],
+                    database_eviction_interval=configuration[
+                        "database_eviction_interval"
+                    ],
+                )
+
+        return _embedding_cache
+
+
+def get_embedding_cache_statistics() -> dict:
+    embedding_cache = get_embedding_cache()
+
+    if embedding_cache is None:
+        return {}
+
+    return embedding_cache.statistics.to_dict()
@@ -1,27 +1,95 @@
 import openai
+
+from typing import List
 import src.utilities.configuration_utilities as configuration_utilities
 
-from src.utilities.configuration_utilities import get_app_configuration
+from src.utilities.configuration_utilities import (
+    get_app_configuration,
+    get_app_configuration_state,
+)
+from src.ai.utilities.embedding_cache import get_embedding_cache
+
+# The number of texts to send to the embedding model in one request, unless configured per model.
+# OpenAI accepts up to 2048 inputs per request.
+DEFAULT_EMBEDDING_BATCH_SIZE = 256
 
-local_embeddings_model = None
+# Embeddings shortened to fewer dimensions (for models with "supports_dimensions") can't be compared with the
+# full size ones, so they are treated as their own model, named e.g. text-embedding-3-large@1024
+DIMENSIONS_SEPARATOR = "@"
 
 
 def get_local_embeddings_model(model_name):
-    from InstructorEmbedding import INSTRUCTOR
+    from src.ai.utilities.local_embeddings import get_local_embedding_model
+
+    model_config = configuration_utilities.get_app_configuration()["jarvis_ai"][
+        "embedding_models"
+    ].get(model_name, None)
+
+    if not model_config:
+        raise Exception(f"Unknown model name {model_name}")
+
+    return get_local_embedding_model(model_name, model_config)
+
+
+def get_embedding_model_name(embedding_name: str, dimensions: int = None) -> str:
+    """Gets the model name for an embedding name, shortened to the given dimensions if they are set"""
+    model_name = get_app_configuration()["jarvis_ai"]["embedding_models"][
+        "available"
+    ].get(embedding_name, None)
+
+    if not model_name:
+        raise Exception(f"Unknown embedding name {embedding_name}")
 
-    global local_embeddings_model
+    return get_shortened_embedding_model_name(model_name, dimensions)
 
-    if not local_embeddings_model:
-        model_config = configuration_utilities.get_app_configuration()["jarvis_ai"][
-            "embedding_models"
-        ].get(model_name, None)
 
-        if not model_config:
-            raise Exception(f"Unknown model name {model_name}")
+def get_shortened_embedding_model_name(model_name: str, dimensions: int = None) -> str:
+    if not dimensions:
+        return model_name
 
-        local_embeddings_model = INSTRUCTOR(model_config["path"])
+    model_dimensions = get_embedding_dimensions(model_name)
 
-    return local_embeddings_model
+    if int(dimensions) == model_dimensions:
+        return model_name
+
+    embedding_config = get_app_configuration()["jarvis_ai"]["embedding_models"][
+        model_name
+    ]
+
+    if not embedding_config.get("supports_dimensions", False):
+        raise Exception(f"{model_name} embeddings can't be shortened")
+
+    if not 0 < int(dimensions) < model_dimensions:
+        raise Exception(
+            f"{model_name} embeddings can only be shortened to fewer than {model_dimensions} dimensions"
+        )
+
+    return f"{model_name}{DIMENSIONS_SEPARATOR}{int(dimensions)}"
+
+
+def split_embedding_model_name(model_name: str):
+    """Splits a (possibly shortened) model name into the configured model name and the shortened dimensions (or None)"""
+    base_model_name, separator, dimensions = model_name.rpartition(
+        DIMENSIONS_SEPARATOR
+    )
+
+    if separator and dimensions.isdigit():
+        return base_model_name, int(dimensions)
+
+    return model_name, None
+
+
+def get_embedding_dimensions(model_name: str) -> int:
+    model_name, shortened_dimensions = split_embedding_model_name(model_name)
+
+    dimensions = get_app_configuration_state().embedding_model_dimensions.get(
+        model_name, None
+    )
+
+    if not dimensions:
+        raise Exception(f"Unknown model name {model_name}")
+
+    return shortened_dimensions or dimensions
 
 
 def get_embedding_by_name(
@@ -29,53 +97,131 @@ def get_embedding_by_name(
     embedding_name: str,
     instruction: str = None,
 ):
-    model_name = get_app_configuration()["jarvis_ai"]["embedding_models"][
-        "available"
-    ].get(embedding_name, None)
-
-    if not model_name:
-        raise Exception(f"Unknown embedding name {embedding_name}")
+    model_name = get_embedding_model_name(embedding_name)
 
     return get_embedding_by_model(
         text=text, model_name=model_name, instruction=instruction
     )
 
 
-def find_key_by_value(d, value):
-    for key, val in d.items():
-        if val == value:
-            return key
-    return None
+def get_embedding_by_model(text: str, model_name: str, instruction: str = None):
+    return get_embeddings_by_model(
+        texts=[text], model_name=model_name, instruction=instruction
+    )[0]
 
 
-def get_embedding_by_model(text: str, model_name: str, instruction: str = None):
+def get_embeddings_by_name(
+    texts: List[str],
+    embedding_name: str,
+    instruction: str = None,
+) -> List[List[float]]:
+    model_name = get_embedding_model_name(embedding_name)
 
-    available_models = get_app_configuration()["jarvis_ai"]["embedding_models"][
-        "available"
-    ]
+    return get_embeddings_by_model(
+        texts=texts, model_name=model_name, instruction=instruction
+    )
+
+
+def get_embeddings_by_model(
+    texts: List[str], model_name: str, instruction: str = None
+) -> List[List[float]]:
+    """Gets the embeddings for many texts, sending the ones that aren't cached to the model in batches.
+
+    Args:
+        texts (List[str]): The texts to embed.
+        model_name (str): The embedding model name, e.g. text-embedding-3-small.
+        instruction (str, optional): The instruction, for models that use one (e.g. INSTRUCTOR).
+
+    Returns:
+        List[List[float]]: The embeddings, in the same order as the texts.
+    """
+    embeddings = [None] * len(texts)
+
+    embedding_cache = get_embedding_cache()
+
+    if embedding_cache is not None:
+        cached_embeddings = embedding_cache.get_many(model_name, instruction, texts)
+        for index, embedding in enumerate(cached_embeddings):
+            embeddings[index] = embedding
 
-    key = find_key_by_value(available_models, model_name)
+    missing_indexes = [index for index, e in enumerate(embeddings) if e is None]
+
+    if missing_indexes:
+        # Only embed each distinct text once
+        missing_texts = list(dict.fromkeys(texts[index] for index in missing_indexes))
+
+        created_embeddings = dict(
+            zip(
+                missing_texts,
+                _create_embeddings(
+                    texts=missing_texts,
+                    model_name=model_name,
+                    instruction=instruction,
+                ),
+            )
+        )
+
+        for index in missing_indexes:
+            embeddings[index] = created_embeddings[texts[index]]
+
+        if embedding_cache is not None:
+            embedding_cache.put_many(
+                model_name,
+                instruction,
+                list(created_embeddings.keys()),
+                list(created_embeddings.values()),
+            )
+
+    return embeddings
+
+
+def _create_embeddings(
+    texts: List[str], model_name: str, instruction: str = None
+) -> List[List[float]]:
+    model_name, dimensions = split_embedding_model_name(model_name)
+
+    app_configuration = get_app_configuration_state()
+
+    key = app_configuration.embedding_model_keys.get(model_name, None)
 
     if not key:
         raise Exception(f"Unknown model name {model_name}")
 
-    embedding_config = get_app_configuration()["jarvis_ai"]["embedding_models"][
+    embedding_config = app_configuration.data["jarvis_ai"]["embedding_models"][
         model_name
     ]
 
+    batch_size = embedding_config.get("batch_size", DEFAULT_EMBEDDING_BATCH_SIZE)
+
+    embeddings = []
+
     # You're special, OpenAI
     if key.lower().startswith("openai"):
-        embedding = openai.embeddings.create(
-            input=text,
-            model=model_name,
-            #dimensions=embedding_config["dimensions"], Not all models support this
-        )
-
-        return embedding.data[0].embedding
+        # Only the models that support it (text-embedding-3-*) accept dimensions
+        options = {"dimensions": dimensions} if dimensions else {}
+
+        for batch_start in range(0, len(texts), batch_size):
+            response = openai.embeddings.create(
+                input=texts[batch_start : batch_start + batch_size],
+                model=model_name,
+                **options,
+            )
+
+            # The results aren't guaranteed to be in the same order as the input
+            embeddings.extend(
+                e.embedding for e in sorted(response.data, key=lambda d: d.index)
+            )
     else:
         model = get_local_embeddings_model(model_name)
 
-        return [
-            m.item()
-            for m in model.encode([[instruction, text]], convert_to_numpy=False)[0]
-        ]
+        # One conversion of the whole array, rather than per element
+        embeddings.extend(
+            model.encode(
+                texts,
+                instruction=instruction,
+                batch_size=batch_size,
+                dimensions=dimensions,
+            ).tolist()
+        )
+
+    return embeddings
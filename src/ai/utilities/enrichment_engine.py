@@ -0,0 +1,226 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+
+import openai
+
+from src.configuration.model_configuration import ModelConfiguration
+from src.utilities.configuration_utilities import get_app_configuration
+from src.utilities.rate_limiter import TokenBucketRateLimiter
+from src.utilities.token_helper import num_tokens_from_string
+
+# Runs independent LLM calls (e.g. chunk summaries and questions during ingestion) concurrently.
+# Calls are rate limited per model with a token bucket using the requests/tokens per minute from
+# the model configuration, failed calls are retried with exponential backoff, and the results
+# are returned in the same order as the inputs.
+#
+# Only transient failures (rate limits, timeouts, connection problems and server errors) are
+# retried- anything else (e.g. a bad request, or a response that can't be parsed) is raised
+# straight away, since retrying it would just fail the same way.
+
+DEFAULT_ENRICHMENT_CONFIGURATION = {
+    "max_concurrent_requests": 4,
+    "max_retries": 5,
+    "initial_backoff_seconds": 2.0,
+    "max_backoff_seconds": 60.0,
+}
+
+# HTTP status codes worth retrying, in addition to the 5xx server errors
+TRANSIENT_STATUS_CODES = {408, 409, 429}
+
+# Allowance for the prompt template around the text in an enrichment call
+PROMPT_TEMPLATE_TOKENS = 500
+
+# Every engine for the same model shares one rate limiter, since the limits are per model
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_enrichment_configuration() -> dict:
+    configuration = dict(DEFAULT_ENRICHMENT_CONFIGURATION)
+    configuration.update(get_app_configuration()["jarvis_ai"].get("enrichment", {}))
+
+    return configuration
+
+
+def get_rate_limiter(model_configuration: ModelConfiguration) -> TokenBucketRateLimiter:
+    """Gets the shared rate limiter for a model, or None if the model configuration has no limits"""
+    if (
+        not model_configuration.requests_per_minute
+        and not model_configuration.tokens_per_minute
+    ):
+        return None
+
+    key = (
+        model_configuration.llm_type,
+        model_configuration.model,
+        model_configuration.requests_per_minute,
+        model_configuration.tokens_per_minute,
+    )
+
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = TokenBucketRateLimiter(
+                requests_per_minute=model_configuration.requests_per_minute,
+                tokens_per_minute=model_configuration.tokens_per_minute,
+            )
+
+        return _rate_limiters[key]
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed call might succeed if it is retried"""
+    if isinstance(
+        error,
+        (
+            TimeoutError,
+            ConnectionError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+        ),
+    ):
+        return True
+
+    status_code = getattr(error, "status_code", None)
+
+    return isinstance(status_code, int) and (
+        status_code in TRANSIENT_STATUS_CODES or status_code >= 500
+    )
+
+
+def estimate_call_tokens(text: str, model_configuration: ModelConfiguration) -> int:
+    """Estimates the tokens a call about the text will count against the tokens per minute limit.
+
+    Providers count the requested completion tokens (max_tokens) against the limit, not the tokens actually generated.
+    """
+    prompt_tokens = num_tokens_from_string(text, model_configuration.model)
+
+    return (
+        prompt_tokens
+        + PROMPT_TEMPLATE_TOKENS
+        + max(model_configuration.max_completion_tokens, 0)
+    )
+
+
+class EnrichmentEngine:
+    def __init__(
+        self,
+        max_concurrent_requests: int = DEFAULT_ENRICHMENT_CONFIGURATION[
+            "max_concurrent_requests"
+        ],
+        rate_limiter: TokenBucketRateLimiter = None,
+        model_configuration: ModelConfiguration = None,
+        max_retries: int = DEFAULT_ENRICHMENT_CONFIGURATION["max_retries"],
+        initial_backoff_seconds: float = DEFAULT_ENRICHMENT_CONFIGURATION[
+            "initial_backoff_seconds"
+        ],
+        max_backoff_seconds: float = DEFAULT_ENRICHMENT_CONFIGURATION[
+            "max_backoff_seconds"
+        ],
+    ):
+        self.max_concurrent_requests = max(1, int(max_concurrent_requests))
+        self.rate_limiter = rate_limiter
+        self.model_configuration = model_configuration
+        self.max_retries = max_retries
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def estimate_tokens(self, text: str) -> int:
+        """Estimates the tokens for a call about the text, only when there is a tokens per minute limit to count them against"""
+        if (
+            self.rate_limiter is None
+            or not self.rate_limiter.tokens_per_minute
+            or self.model_configuration is None
+        ):
+            return 0
+
+        return estimate_call_tokens(text, self.model_configuration)
+
+    def map(
+        self,
+        function: Callable[[Any], Any],
+        items: List[Any],
+        estimate_tokens: Callable[[Any], int] = None,
+        return_exceptions: bool = False,
+    ) -> List[Any]:
+        """Calls the function for each item, up to max_concurrent_requests at a time.
+
+        Args:
+            function: The (LLM calling) function to call with each item.
+            items: The items.
+            estimate_tokens: Estimates the tokens a call will use, for the tokens per minute limit.
+            return_exceptions: Put the exception in the results for an item that fails (after all
+                of the retries, for a transient error), instead of raising it.
+
+        Returns:
+            List[Any]: The results, in the same order as the items.
+        """
+        if not items:
+            return []
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_concurrent_requests, len(items))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self._call_with_retries,
+                    function,
+                    item,
+                    estimate_tokens(item) if estimate_tokens else 0,
+                )
+                for item in items
+            ]
+
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results.append(e)
+
+            return results
+
+    def _call_with_retries(self, function: Callable, item: Any, tokens: int) -> Any:
+        attempt = 0
+
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire(tokens)
+
+            try:
+                return function(item)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+
+                # Exponential backoff, with jitter so the retries don't all land together
+                backoff_seconds = min(
+                    self.initial_backoff_seconds * (2**attempt),
+                    self.max_backoff_seconds,
+                ) * random.uniform(0.5, 1.0)
+                attempt += 1
+
+                logging.warning(
+                    f"Enrichment call failed ({e}), retry {attempt} of {self.max_retries} in {backoff_seconds:.1f}s"
+                )
+                time.sleep(backoff_seconds)
+
+
+def create_enrichment_engine(model_configuration: ModelConfiguration) -> EnrichmentEngine:
+    """Creates an enrichment engine for calls to the given model"""
+    configuration = get_enrichment_configuration()
+
+    return EnrichmentEngine(
+        max_concurrent_requests=model_configuration.max_concurrent_requests
+        or configuration["max_concurrent_requests"],
+        rate_limiter=get_rate_limiter(model_configuration),
+        model_configuration=model_configuration,
+        max_retries=configuration["max_retries"],
+        initial_backoff_seconds=configuration["initial_backoff_seconds"],
+        max_backoff_seconds=configuration["max_backoff_seconds"],
+    )
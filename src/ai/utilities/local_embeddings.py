@@ -0,0 +1,163 @@
+import logging
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+# Local embedding models, loaded lazily and kept per model name so that collections using different
+# local models each get their own.
+#
+# Each model's configuration (under jarvis_ai.embedding_models) can set:
+#   "path": where the model is.
+#   "model_type": "instructor" (the default, INSTRUCTOR models) or "sentence_transformer".
+#   "backend": "torch" (the default) or "onnx" (sentence_transformer models only, needs onnxruntime).
+#   "onnx_file_name": the ONNX file in the model directory to use, e.g. "onnx/model_qint8_avx512.onnx"
+#       for an int8 quantized export.
+#   "quantize": true to quantize a torch model's linear layers to int8, for faster CPU inference.
+#   "device": e.g. "cpu" or "cuda", otherwise the best one available is used.
+
+INSTRUCTOR_MODEL_TYPE = "instructor"
+SENTENCE_TRANSFORMER_MODEL_TYPE = "sentence_transformer"
+
+TORCH_BACKEND = "torch"
+ONNX_BACKEND = "onnx"
+
+
+class LocalEmbeddingModel:
+    """A loaded local embedding model.
+
+    Calls to encode are serialized with a lock- the underlying models aren't guaranteed to be thread-safe,
+    and they already use every core for a batch.
+    """
+
+    def __init__(self, model_name: str, model_config: dict):
+        self.model_name = model_name
+        self.model_type = model_config.get("model_type", INSTRUCTOR_MODEL_TYPE)
+        self.backend = model_config.get("backend", TORCH_BACKEND)
+
+        self._lock = threading.Lock()
+        self._model = self._load_model(model_config)
+
+    def encode(
+        self,
+        texts: List[str],
+        instruction: str = None,
+        batch_size: int = 32,
+        dimensions: int = None,
+    ) -> np.ndarray:
+        """Embeds the texts in batches, returning a (len(texts), dimensions) float32 array.
+
+        Setting dimensions shortens the embeddings (truncated and normalized again), which only makes sense
+        for models trained for it (Matryoshka embeddings).
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        if self.model_type == INSTRUCTOR_MODEL_TYPE:
+            inputs = [[instruction or "", text] for text in texts]
+        elif instruction:
+            # Plain sentence transformers don't take a separate instruction
+            inputs = [f"{instruction} {text}" for text in texts]
+        else:
+            inputs = texts
+
+        with self._lock:
+            embeddings = self._model.encode(
+                inputs,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        if dimensions and dimensions < embeddings.shape[1]:
+            embeddings = embeddings[:, :dimensions]
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+
+        return embeddings
+
+    def _load_model(self, model_config: dict):
+        if self.model_type == INSTRUCTOR_MODEL_TYPE:
+            if self.backend != TORCH_BACKEND:
+                raise ValueError(
+                    f"The {self.backend} backend isn't supported for INSTRUCTOR models ({self.model_name})"
+                )
+
+            from InstructorEmbedding import INSTRUCTOR
+
+            model = INSTRUCTOR(model_config["path"], device=model_config.get("device"))
+        elif self.model_type == SENTENCE_TRANSFORMER_MODEL_TYPE:
+            from sentence_transformers import SentenceTransformer
+
+            if self.backend == ONNX_BACKEND:
+                model_kwargs = {}
+                if model_config.get("onnx_file_name"):
+                    model_kwargs["file_name"] = model_config["onnx_file_name"]
+
+                model = SentenceTransformer(
+                    model_config["path"],
+                    device=model_config.get("device"),
+                    backend=ONNX_BACKEND,
+                    model_kwargs=model_kwargs,
+                )
+            elif self.backend == TORCH_BACKEND:
+                model = SentenceTransformer(
+                    model_config["path"], device=model_config.get("device")
+                )
+            else:
+                raise ValueError(
+                    f"Unknown embedding backend {self.backend} for {self.model_name}"
+                )
+        else:
+            raise ValueError(
+                f"Unknown embedding model type {self.model_type} for {self.model_name}"
+            )
+
+        if model_config.get("quantize", False) and self.backend == TORCH_BACKEND:
+            model = self._quantize(model)
+
+        logging.info(
+            f"Loaded local embedding model {self.model_name} ({self.model_type}, {self.backend})"
+        )
+
+        return model
+
+    def _quantize(self, model):
+        import torch
+
+        if str(getattr(model, "device", "cpu")) != "cpu":
+            logging.warning(
+                f"Not quantizing {self.model_name}, int8 quantization is only for CPU inference"
+            )
+            return model
+
+        # Dynamic quantization only changes the linear layers' weights, the model is used the same way
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+_local_embedding_models: Dict[str, LocalEmbeddingModel] = {}
+_local_embedding_models_lock = threading.Lock()
+# Model name -> lock, so loading one model doesn't hold up using (or loading) the others
+_loading_locks: Dict[str, threading.Lock] = {}
+
+
+def get_local_embedding_model(model_name: str, model_config: dict) -> LocalEmbeddingModel:
+    """Gets the local embedding model with the given name, loading it the first time it's used"""
+    model = _local_embedding_models.get(model_name)
+    if model is not None:
+        return model
+
+    with _local_embedding_models_lock:
+        loading_lock = _loading_locks.setdefault(model_name, threading.Lock())
+
+    with loading_lock:
+        model = _local_embedding_models.get(model_name)
+        if model is None:
+            model = LocalEmbeddingModel(model_name, model_config)
+            _local_embedding_models[model_name] = model
+
+    return model
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -11,6 +13,10 @@ class ModelConfiguration(BaseModel):
     max_conversation_history_tokens: int
     max_completion_tokens: int
     model_kwargs: dict = {}
+    # Limits for concurrent calls to the model (e.g. during ingestion), see enrichment_engine.py
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+    max_concurrent_requests: Optional[int] = None
 
     def __init__(self, **config_data):
         super().__init__(**config_data)
@@ -0,0 +1,62 @@
+import sys
+import os
+import logging
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+
+from src.db.database.vector_index_utilities import SUPPORTED_STORAGE_TYPES
+from src.db.models.documents import Documents
+
+# Converts the embeddings of an existing document collection to fewer dimensions (for models that support
+# shortened embeddings) and/or to half precision or binary quantized storage, in place, without re-embedding.
+
+
+def convert_collection(
+    collection_name: str, embedding_dimensions: int, embedding_storage: str
+):
+    documents_helper = Documents()
+
+    collection = documents_helper.get_collection_by_name(collection_name)
+
+    if collection is None:
+        raise ValueError(f"Collection '{collection_name}' does not exist")
+
+    logging.info(
+        f"Converting '{collection_name}' from {collection.embedding_storage} ({collection.embedding_dimensions or 'full size'}) "
+        f"to {embedding_storage or collection.embedding_storage} ({embedding_dimensions or collection.embedding_dimensions or 'full size'})"
+    )
+
+    collection = documents_helper.convert_collection_embeddings(
+        collection.id,
+        embedding_dimensions=embedding_dimensions,
+        embedding_storage=embedding_storage,
+    )
+
+    logging.info(
+        f"Converted '{collection_name}', it now uses {documents_helper.get_collection_embedding_model_name(collection.id)} embeddings"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Convert a document collection's embeddings to fewer dimensions and/or reduced precision storage."
+    )
+    parser.add_argument("collection_name", help="The name of the collection")
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=None,
+        help="Shorten the embeddings to this many dimensions (only for models with supports_dimensions)",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=SUPPORTED_STORAGE_TYPES,
+        default=None,
+        help="How to store the embeddings (defaults to the collection's current storage)",
+    )
+    args = parser.parse_args()
+
+    convert_collection(args.collection_name, args.dimensions, args.storage)
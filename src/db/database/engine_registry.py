@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# A process-wide registry of SQLAlchemy engines (and their session factories), keyed by connection string.
+# Every VectorDatabase subclass shares the engine for its connection string, so a process has one
+# connection pool per database rather than one per helper instance.
+
+
+def get_pool_configuration() -> dict:
+    return {
+        "pool_size": int(os.environ.get("POSTGRES_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("POSTGRES_MAX_OVERFLOW", 20)),
+        "pool_timeout": int(os.environ.get("POSTGRES_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("POSTGRES_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.environ.get("POSTGRES_POOL_PRE_PING", "true").lower()
+        in ("true", "1", "t"),
+    }
+
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool that records how long callers wait to check out a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._metrics_lock = threading.Lock()
+        self.checkout_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait_seconds = time.perf_counter() - start
+
+            with self._metrics_lock:
+                self.checkout_count += 1
+                self.total_wait_seconds += wait_seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def get_metrics(self) -> dict:
+        with self._metrics_lock:
+            return {
+                "pool_size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": max(self.overflow(), 0),
+                "checkout_count": self.checkout_count,
+                "average_wait_seconds": (
+                    self.total_wait_seconds / self.checkout_count
+                    if self.checkout_count
+                    else 0.0
+                ),
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+_engines = {}
+_session_factories = {}
+_registry_lock = threading.Lock()
+
+
+def get_engine(connection_string: str):
+    with _registry_lock:
+        engine = _engines.get(connection_string, None)
+
+        if engine is None:
+            pool_configuration = get_pool_configuration()
+
+            logging.info(
+                f"Creating database engine with pool size {pool_configuration['pool_size']} and max overflow {pool_configuration['max_overflow']}"
+            )
+
+            engine = create_engine(
+                connection_string, poolclass=MeteredQueuePool, **pool_configuration
+            )
+
+            _engines[connection_string] = engine
+
+        return engine
+
+
+def get_session_factory(connection_string: str) -> sessionmaker:
+    engine = get_engine(connection_string)
+
+    with _registry_lock:
+        session_factory = _session_factories.get(connection_string, None)
+
+        if session_factory is None:
+            session_factory = sessionmaker(bind=engine)
+            _session_factories[connection_string] = session_factory
+
+        return session_factory
+
+
+def get_pool_metrics() -> dict:
+    """Gets the connection pool metrics for each engine, keyed by database (without credentials)"""
+    with _registry_lock:
+        engines = dict(_engines)
+
+    metrics = {}
+    for engine in engines.values():
+        database = engine.url.render_as_string(hide_password=True)
+
+        if isinstance(engine.pool, MeteredQueuePool):
+            metrics[database] = engine.pool.get_metrics()
+        else:
+            metrics[database] = {"status": engine.pool.status()}
+
+    return metrics
+
+
+def dispose_engines() -> None:
+    with _registry_lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+        _engines.clear()
+        _session_factories.clear()
+
+
+def _reset_after_fork() -> None:
+    # Connections can't be shared with a forked child (e.g. worker processes), so drop the
+    # inherited pools without closing the parent's connections
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,54 @@
+"""migration 2024-02-14_09-12-37
+
+Revision ID: 5c1e9a7b3d20
+Revises: d8992a7d7e6a
+Create Date: 2024-02-14 09:12:37.102448
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e9a7b3d20'
+down_revision = 'd8992a7d7e6a'
+branch_labels = None
+depends_on = None
+
+# The embedding models (and their dimensions) available when this migration was written.
+# Models added later get their indexes via `python src/db/database/vector_index_utilities.py`
+# text-embedding-3-large (3072) is not indexed, pgvector can't index more than 2000 dimensions.
+MODEL_DIMENSIONS = {
+    "text_embedding_ada_002": ("text-embedding-ada-002", 1536),
+    "text_embedding_3_small": ("text-embedding-3-small", 1536),
+    "hkunlp_instructor_xl": ("hkunlp/instructor-xl", 768),
+}
+
+# The embedding columns on the documents table, and their short names for the index names
+DOCUMENT_EMBEDDING_COLUMNS = {
+    "embedding": "text",
+    "document_text_summary_embedding": "summary",
+    "embedding_question_1": "q1",
+    "embedding_question_2": "q2",
+    "embedding_question_3": "q3",
+    "embedding_question_4": "q4",
+    "embedding_question_5": "q5",
+}
+
+
+def upgrade() -> None:
+    # Partial HNSW indexes per embedding model, since the embedding columns have no fixed dimension
+    for model_slug, (model_name, dimensions) in MODEL_DIMENSIONS.items():
+        for column_name, column_alias in DOCUMENT_EMBEDDING_COLUMNS.items():
+            op.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_documents_{column_alias}_{model_slug} ON documents "
+                f"USING hnsw (({column_name}::vector({dimensions})) vector_cosine_ops) "
+                f"WITH (m = 16, ef_construction = 64) "
+                f"WHERE embedding_model_name = '{model_name}'"
+            )
+
+
+def downgrade() -> None:
+    for model_slug in MODEL_DIMENSIONS.keys():
+        for column_alias in DOCUMENT_EMBEDDING_COLUMNS.values():
+            op.execute(f"DROP INDEX IF EXISTS ix_documents_{column_alias}_{model_slug}")
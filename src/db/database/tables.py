@@ -6,6 +6,7 @@
 # enabling efficient data storage, retrieval, and management.
 
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
@@ -18,9 +19,14 @@ from sqlalchemy import (
     UniqueConstraint,
     Boolean,
     LargeBinary,
+    Computed,
+    Index,
+    Sequence,
+    func,
 )
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC, Vector
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -117,8 +123,17 @@ class ConversationMessage(ModelBase):
         Integer, ForeignKey("conversation_role_types.id")
     )
     message_text = Column(String, nullable=False)
+    # Generated full-text search vector for keyword search, kept up to date by Postgres
+    message_text_search_vector = Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', message_text)", persisted=True),
+    )
     user_id = Column(Integer, ForeignKey("users.id"))
     additional_metadata = Column(String, nullable=True)
+    # The number of tokens in message_text, and the tiktoken encoding it was counted with.
+    # Counted the first time the message is loaded into conversation memory (see token_buffer.py)
+    message_token_count = Column(Integer, nullable=True)
+    message_token_encoding = Column(String, nullable=True)
     # embedding = Column(Vector(dim=None), nullable=True)
     # embedding_model_name = Column(String, nullable=False)
     exception = Column(String, nullable=True)
@@ -158,6 +173,20 @@ class ConversationMessage(ModelBase):
         "ConversationRoleType", back_populates="conversation_messages"
     )
 
+    __table_args__ = (
+        Index(
+            "ix_conversation_messages_message_text_search_vector",
+            message_text_search_vector,
+            postgresql_using="gin",
+        ),
+        # Paging through a conversation's messages by id
+        Index(
+            "ix_conversation_messages_conversation_id_id",
+            conversation_id,
+            id,
+        ),
+    )
+
 
 # ConversationRoleType model represents the role types that can be assigned to messages within a conversation.
 class ConversationRoleType(ModelBase):
@@ -232,25 +261,28 @@ class Document(ModelBase):
     )
     file_id = Column(Integer, ForeignKey("files.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
-    additional_metadata = Column(String, nullable=True)
+    # The chunk's metadata (e.g. page, start_line, type), as JSONB so it can be filtered on in queries
+    additional_metadata = Column(JSONB, nullable=True)
     document_text = Column(String, nullable=False)
+    # Generated full-text search vector for keyword search, kept up to date by Postgres
+    document_text_search_vector = Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', document_text)", persisted=True),
+    )
     document_name = Column(String, nullable=False)
     document_text_summary = Column(String, nullable=True)
-    document_text_summary_embedding = Column(Vector(dim=None), nullable=True)
     document_text_has_summary = Column(Boolean, nullable=False, default=False)
-    embedding = Column(Vector(dim=None), nullable=True)
     question_1 = Column(String, nullable=True)
-    embedding_question_1 = Column(Vector(dim=None), nullable=True)
     question_2 = Column(String, nullable=True)
-    embedding_question_2 = Column(Vector(dim=None), nullable=True)
     question_3 = Column(String, nullable=True)
-    embedding_question_3 = Column(Vector(dim=None), nullable=True)
     question_4 = Column(String, nullable=True)
-    embedding_question_4 = Column(Vector(dim=None), nullable=True)
     question_5 = Column(String, nullable=True)
-    embedding_question_5 = Column(Vector(dim=None), nullable=True)
     record_created = Column(DateTime, nullable=False, default=datetime.now)
     embedding_model_name = Column(String, nullable=False)
+    # The position of the chunk in its file, set by the ingestion pipeline so that retried batches can skip stored chunks
+    chunk_index = Column(Integer, nullable=True)
+    # Hash of the normalized chunk text, so that re-ingesting a changed file only processes the changed chunks
+    content_hash = Column(String, nullable=True)
 
     # Define user and collection constraints
     # Define the ForeignKeyConstraint to ensure the user_id exists in the users table
@@ -291,6 +323,91 @@ class Document(ModelBase):
     # Define the relationship with files
     file = relationship("File", back_populates="documents")
 
+    __table_args__ = (
+        Index(
+            "ix_documents_document_text_search_vector",
+            document_text_search_vector,
+            postgresql_using="gin",
+        ),
+        Index(
+            "ix_documents_file_id_chunk_index",
+            file_id,
+            chunk_index,
+            unique=True,
+            postgresql_where=chunk_index.isnot(None),
+        ),
+        Index("ix_documents_file_id_content_hash", file_id, content_hash),
+        # For metadata containment filters, e.g. additional_metadata @> '{"type": "MODULE"}'
+        Index(
+            "ix_documents_additional_metadata",
+            additional_metadata,
+            postgresql_using="gin",
+            postgresql_ops={"additional_metadata": "jsonb_path_ops"},
+        ),
+    )
+
+
+# DocumentEmbedding model holds the embeddings for a document chunk, one row per kind of embedding (text, summary, questions).
+# Keeping the vectors out of the documents table keeps those rows small, and puts every embedding behind a single ANN index.
+# Every write to document_embeddings takes the next value, see DocumentEmbedding.version
+document_embeddings_version_seq = Sequence(
+    "document_embeddings_version_seq", metadata=Base.metadata
+)
+
+
+class DocumentEmbedding(ModelBase):
+    __tablename__ = "document_embeddings"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(
+        Integer,
+        ForeignKey("documents.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    collection_id = Column(
+        Integer, ForeignKey("document_collections.id"), nullable=False
+    )
+    kind = Column(String, nullable=False)
+    embedding_model_name = Column(String, nullable=False)
+    # Only one of these is set, depending on the collection's embedding_storage- full precision
+    # embeddings are in embedding, and half precision (halfvec and binary storage) in embedding_half
+    embedding = Column(Vector(dim=None), nullable=True)
+    embedding_half = Column(HALFVEC(dim=None), nullable=True)
+    # Set on insert, and bumped by every update, so that the local vector indexes can catch up on
+    # replaced embeddings (which keep their id) as well as new ones
+    version = Column(
+        BigInteger,
+        document_embeddings_version_seq,
+        server_default=document_embeddings_version_seq.next_value(),
+        nullable=False,
+    )
+
+    # Define the relationship with Document
+    document = relationship("Document", back_populates="embeddings")
+
+    __table_args__ = (
+        UniqueConstraint("document_id", "kind"),
+        Index(
+            "ix_document_embeddings_collection_id_model_version",
+            "collection_id",
+            "embedding_model_name",
+            "version",
+        ),
+    )
+
+    # Get the version back from the insert, for the local vector indexes
+    __mapper_args__ = {"eager_defaults": True}
+
+
+Document.embeddings = relationship(
+    "DocumentEmbedding",
+    order_by=DocumentEmbedding.id,
+    back_populates="document",
+    cascade="all, delete-orphan",
+    passive_deletes=True,
+)
+
 
 # DocumentCollection model represents a collection of documents, including its properties and relationships.
 class DocumentCollection(ModelBase):
@@ -300,6 +417,12 @@ class DocumentCollection(ModelBase):
     collection_name = Column(String, nullable=False, unique=True)
     record_created = Column(DateTime, nullable=False, default=datetime.now)
     embedding_name = Column(String, nullable=False)
+    # Shortens the embeddings to fewer dimensions than the model's, for models that support it (NULL is the model's own)
+    embedding_dimensions = Column(Integer, nullable=True)
+    # vector, halfvec or binary (see vector_index_utilities.py)
+    embedding_storage = Column(
+        String, nullable=False, default="vector", server_default="vector"
+    )
 
     documents = relationship("Document", back_populates="collection")
 
@@ -362,6 +485,15 @@ class CodeFile(ModelBase):
         back_populates="code_files",
     )
 
+    # Files are looked up by (case insensitive) path and sha when a repository is scanned
+    __table_args__ = (
+        Index(
+            "ix_code_files_lower_code_file_name_sha",
+            func.lower(code_file_name),
+            code_file_sha,
+        ),
+    )
+
 
 class CodeFileDependencies(Base):
     __tablename__ = "code_file_dependencies"
@@ -463,3 +595,46 @@ SupportedSourceControlProvider.source_control_providers = relationship(
     order_by=SourceControlProvider.id,
     back_populates="supported_source_control_provider",
 )
+
+
+# EmbeddingCacheEntry model stores previously computed embeddings, keyed by the model, instruction and a hash of the text.
+class EmbeddingCacheEntry(ModelBase):
+    __tablename__ = "embedding_cache"
+
+    id = Column(Integer, primary_key=True)
+    embedding_model_name = Column(String, nullable=False)
+    instruction = Column(String, nullable=False, default="")
+    text_hash = Column(String, nullable=False)
+    embedding = Column(Vector(dim=None), nullable=False)
+    record_created = Column(DateTime, nullable=False, default=datetime.now)
+    last_accessed = Column(DateTime, nullable=False, default=datetime.now, index=True)
+    # The number of stored document chunk texts/summaries/questions with this embedding- entries that
+    # are referenced are never evicted, so re-uploaded and duplicated content is not embedded again
+    reference_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        UniqueConstraint("embedding_model_name", "instruction", "text_hash"),
+    )
+
+
+# IngestionJob model tracks the progress of a file through the background ingestion pipeline, so the UI can poll it.
+class IngestionJob(ModelBase):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(
+        Integer,
+        ForeignKey("files.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    # The hash of the file the job was started for, a job for the same file contents is not run twice
+    file_hash = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    total_chunks = Column(Integer, nullable=True)
+    stored_chunks = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    record_created = Column(DateTime, nullable=False, default=datetime.now)
+    last_updated = Column(
+        DateTime, nullable=False, default=datetime.now, onupdate=datetime.now
+    )
@@ -0,0 +1,405 @@
+import sys
+import os
+import re
+import logging
+import argparse
+
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+
+from src.db.database.connection_utilities import get_connection_string
+
+# pgvector cannot build HNSW/IVFFlat indexes on a vector column without a fixed dimension.
+# Our embedding columns are Vector(dim=None) because a collection can use any embedding model,
+# so we create one partial expression index per (column, embedding model), casting the column
+# to the model's dimensions and restricting it to rows embedded with that model.
+# Queries must use the same cast and model filter in order for the planner to pick the index.
+
+# The maximum number of dimensions pgvector can index for the vector type
+MAX_INDEXABLE_DIMENSIONS = 2000
+
+# How a collection's embeddings are stored:
+#   vector: full precision (float32), in the embedding column.
+#   halfvec: half precision (float16) in the embedding_half column, half the size with practically the same ranking.
+#   binary: half precision in the embedding_half column, searched through a binary quantized (1 bit per dimension)
+#       index, with the candidates rescored on the halfvec embeddings.
+VECTOR_STORAGE = "vector"
+HALFVEC_STORAGE = "halfvec"
+BINARY_STORAGE = "binary"
+SUPPORTED_STORAGE_TYPES = [VECTOR_STORAGE, HALFVEC_STORAGE, BINARY_STORAGE]
+
+# The maximum number of dimensions pgvector can index, for each storage type
+MAX_INDEXABLE_DIMENSIONS_BY_STORAGE = {
+    VECTOR_STORAGE: MAX_INDEXABLE_DIMENSIONS,
+    HALFVEC_STORAGE: 4000,
+    BINARY_STORAGE: 64000,
+}
+
+# The document_embeddings column each storage type uses, and the short name used in its index names
+DOCUMENT_EMBEDDING_STORAGE_COLUMNS = {
+    VECTOR_STORAGE: {"embedding": "embedding"},
+    HALFVEC_STORAGE: {"embedding_half": "half"},
+    BINARY_STORAGE: {"embedding_half": "binary"},
+}
+
+# With binary storage, this many times the requested candidates are read from the binary index to be rescored
+DEFAULT_BINARY_RESCORE_MULTIPLIER = 4
+
+# The largest hnsw.ef_search pgvector accepts
+MAX_HNSW_EF_SEARCH = 1000
+
+# The tables with vector indexes, mapping each embedding column to the short name used in the index names
+VECTOR_INDEXED_TABLES = {
+    "document_embeddings": {"embedding": "embedding"},
+}
+
+SUPPORTED_INDEX_METHODS = ["hnsw", "ivfflat"]
+
+# pgvector (0.8+) can keep scanning an index until enough rows pass the query's filters.
+# relaxed_order returns the rows slightly out of order (the searches re-sort them), "off" is for older versions.
+SUPPORTED_ITERATIVE_SCANS = ["off", "relaxed_order", "strict_order"]
+
+# pgvector's indexes, or the in-process index (see src/db/models/document_embedding_index.py)
+SUPPORTED_BACKENDS = ["pgvector", "local"]
+
+DEFAULT_VECTOR_INDEX_CONFIGURATION = {
+    "backend": "pgvector",
+    "method": "hnsw",
+    "hnsw_m": 16,
+    "hnsw_ef_construction": 64,
+    "hnsw_ef_search": 100,
+    "ivfflat_lists": 100,
+    "ivfflat_probes": 10,
+    "iterative_scan": "relaxed_order",
+    "hnsw_max_scan_tuples": 20000,
+    "binary_rescore_multiplier": DEFAULT_BINARY_RESCORE_MULTIPLIER,
+}
+
+
+def get_vector_index_configuration() -> dict:
+    """Gets the vector index configuration, falling back to the defaults for anything not configured"""
+    from src.utilities.configuration_utilities import get_app_configuration
+
+    configuration = dict(DEFAULT_VECTOR_INDEX_CONFIGURATION)
+    configuration.update(get_app_configuration()["jarvis_ai"].get("vector_index", {}))
+
+    if configuration["backend"] not in SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"Unknown vector index backend '{configuration['backend']}', expected one of {SUPPORTED_BACKENDS}"
+        )
+
+    if configuration["method"] not in SUPPORTED_INDEX_METHODS:
+        raise ValueError(
+            f"Unknown vector index method '{configuration['method']}', expected one of {SUPPORTED_INDEX_METHODS}"
+        )
+
+    if configuration["iterative_scan"] not in SUPPORTED_ITERATIVE_SCANS or (
+        configuration["method"] == "ivfflat"
+        and configuration["iterative_scan"] == "strict_order"
+    ):
+        raise ValueError(
+            f"Unsupported iterative scan '{configuration['iterative_scan']}' for {configuration['method']} indexes"
+        )
+
+    return configuration
+
+
+def get_configured_model_dimensions() -> dict:
+    """Gets a map of embedding model name -> dimensions for all of the available embedding models"""
+    from src.utilities.configuration_utilities import get_app_configuration_state
+
+    app_configuration = get_app_configuration_state()
+
+    return {
+        model_name: dimensions
+        for model_name, dimensions in app_configuration.embedding_model_dimensions.items()
+        if model_name in app_configuration.embedding_model_keys
+    }
+
+
+def is_indexable(dimensions: int, storage: str = VECTOR_STORAGE) -> bool:
+    return (
+        dimensions is not None
+        and 0 < int(dimensions) <= MAX_INDEXABLE_DIMENSIONS_BY_STORAGE[storage]
+    )
+
+
+def get_vector_index_expression(column_name: str, dimensions: int, storage: str) -> str:
+    """Gets the indexed expression and operator class for a storage type- queries have to order by the same expression"""
+    if storage == HALFVEC_STORAGE:
+        return f"({column_name}::halfvec({int(dimensions)})) halfvec_cosine_ops"
+
+    if storage == BINARY_STORAGE:
+        return f"(binary_quantize({column_name})::bit({int(dimensions)})) bit_hamming_ops"
+
+    return f"({column_name}::vector({int(dimensions)})) vector_cosine_ops"
+
+
+def get_vector_index_name(table_name: str, column_alias: str, model_name: str) -> str:
+    model_slug = re.sub(r"[^a-z0-9]+", "_", model_name.lower()).strip("_")
+
+    # Postgres identifiers are limited to 63 characters
+    return f"ix_{table_name}_{column_alias}_{model_slug}"[:63]
+
+
+def get_create_vector_index_statement(
+    index_name: str,
+    table_name: str,
+    column_name: str,
+    model_name: str,
+    dimensions: int,
+    index_configuration: dict = DEFAULT_VECTOR_INDEX_CONFIGURATION,
+    storage: str = VECTOR_STORAGE,
+) -> str:
+    method = index_configuration["method"]
+
+    if method == "hnsw":
+        with_clause = f"WITH (m = {int(index_configuration['hnsw_m'])}, ef_construction = {int(index_configuration['hnsw_ef_construction'])})"
+    else:
+        with_clause = f"WITH (lists = {int(index_configuration['ivfflat_lists'])})"
+
+    # The model name is a configuration value, but escape it anyway since it ends up in a literal
+    escaped_model_name = model_name.replace("'", "''")
+
+    return (
+        f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} "
+        f"USING {method} ({get_vector_index_expression(column_name, dimensions, storage)}) "
+        f"{with_clause} "
+        f"WHERE embedding_model_name = '{escaped_model_name}'"
+    )
+
+
+def create_vector_indexes(
+    connection,
+    table_name: str,
+    column_aliases: dict,
+    model_dimensions: dict,
+    index_configuration: dict = DEFAULT_VECTOR_INDEX_CONFIGURATION,
+    storage: str = VECTOR_STORAGE,
+):
+    """Creates the partial ANN indexes on a table's embedding columns for each of the supplied models.
+
+    Args:
+        connection: An open SQLAlchemy connection (or alembic bind).
+        table_name (str): The table to index. It must have an embedding_model_name column.
+        column_aliases (dict): Map of embedding column name -> short name used in the index name.
+        model_dimensions (dict): Map of embedding model name -> dimensions.
+        index_configuration (dict): The index method and build parameters.
+        storage (str): How the embeddings in the columns are stored (vector, halfvec or binary).
+    """
+    for model_name, dimensions in model_dimensions.items():
+        if not is_indexable(dimensions, storage):
+            logging.warning(
+                f"Skipping {storage} vector indexes for '{model_name}', {dimensions} dimensions exceeds the pgvector limit of {MAX_INDEXABLE_DIMENSIONS_BY_STORAGE[storage]}"
+            )
+            continue
+
+        for column_name, column_alias in column_aliases.items():
+            logging.info(
+                f"Creating {index_configuration['method']} index on {table_name}.{column_name} for '{model_name}'"
+            )
+            connection.execute(
+                text(
+                    get_create_vector_index_statement(
+                        index_name=get_vector_index_name(
+                            table_name, column_alias, model_name
+                        ),
+                        table_name=table_name,
+                        column_name=column_name,
+                        model_name=model_name,
+                        dimensions=dimensions,
+                        index_configuration=index_configuration,
+                        storage=storage,
+                    )
+                )
+            )
+
+
+def create_document_embedding_indexes(
+    connection,
+    model_name: str,
+    dimensions: int,
+    storage: str,
+    index_configuration: dict = None,
+):
+    """Creates the ANN index for document embeddings of one embedding model (or shortened model) stored a given way"""
+    if index_configuration is None:
+        index_configuration = get_vector_index_configuration()
+
+    create_vector_indexes(
+        connection,
+        "document_embeddings",
+        DOCUMENT_EMBEDDING_STORAGE_COLUMNS[storage],
+        {model_name: dimensions},
+        index_configuration,
+        storage=storage,
+    )
+
+
+def get_collection_index_settings(connection) -> list:
+    """Gets the distinct (embedding model name, dimensions, storage) of the document collections"""
+    from src.ai.utilities.embeddings_helper import (
+        get_embedding_dimensions,
+        get_embedding_model_name,
+    )
+
+    result = connection.execute(
+        text(
+            "SELECT DISTINCT embedding_name, embedding_dimensions, embedding_storage FROM document_collections"
+        )
+    )
+
+    settings = []
+    for row in result:
+        try:
+            model_name = get_embedding_model_name(
+                row.embedding_name, row.embedding_dimensions
+            )
+        except Exception as e:
+            logging.warning(f"Skipping the vector indexes for a collection: {e}")
+            continue
+
+        settings.append(
+            (model_name, get_embedding_dimensions(model_name), row.embedding_storage)
+        )
+
+    return settings
+
+
+def drop_vector_indexes(
+    connection, table_name: str, column_aliases: dict, model_dimensions: dict
+):
+    for model_name in model_dimensions.keys():
+        for column_alias in column_aliases.values():
+            index_name = get_vector_index_name(table_name, column_alias, model_name)
+            connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+
+def get_existing_vector_indexes(connection, table_name: str) -> list:
+    result = connection.execute(
+        text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table_name "
+            "AND (indexdef ILIKE '%USING hnsw%' OR indexdef ILIKE '%USING ivfflat%')"
+        ),
+        {"table_name": table_name},
+    )
+
+    return [row.indexname for row in result]
+
+
+def set_search_parameters(
+    session, min_candidates: int = 0, index_configuration: dict = None
+):
+    """Sets the ANN search parameters for the current transaction.
+
+    The indexes cover every collection using a model, so filtering on collection (and kind) happens after
+    the index scan. An iterative scan keeps reading the index until enough rows pass the filters, and a
+    larger candidate list keeps recall up when a collection is a small part of the table.
+
+    Args:
+        session: The session the search will run in.
+        min_candidates (int): The number of rows the search needs. HNSW returns at most ef_search rows.
+        index_configuration (dict, optional): The index configuration, loaded from the app configuration if not supplied.
+    """
+    if index_configuration is None:
+        index_configuration = get_vector_index_configuration()
+
+    if index_configuration["method"] == "hnsw":
+        ef_search = min(
+            max(int(index_configuration["hnsw_ef_search"]), min_candidates),
+            MAX_HNSW_EF_SEARCH,
+        )
+        session.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+    else:
+        session.execute(
+            text(
+                f"SET LOCAL ivfflat.probes = {int(index_configuration['ivfflat_probes'])}"
+            )
+        )
+
+    # Validated against SUPPORTED_ITERATIVE_SCANS when the configuration is loaded
+    iterative_scan = index_configuration["iterative_scan"]
+    if iterative_scan != "off":
+        method = index_configuration["method"]
+        session.execute(text(f"SET LOCAL {method}.iterative_scan = {iterative_scan}"))
+
+        if method == "hnsw":
+            session.execute(
+                text(
+                    f"SET LOCAL hnsw.max_scan_tuples = {int(index_configuration['hnsw_max_scan_tuples'])}"
+                )
+            )
+
+
+def rebuild_vector_indexes(connection_string: str, drop_existing: bool = False):
+    """Creates any missing vector indexes for the configured embedding models, and reindexes the rest.
+
+    Args:
+        connection_string (str): The database connection string.
+        drop_existing (bool): Drop and recreate the indexes, e.g. after changing the index method or build parameters.
+    """
+    index_configuration = get_vector_index_configuration()
+    model_dimensions = get_configured_model_dimensions()
+
+    # CONCURRENTLY cannot run inside a transaction
+    engine = create_engine(connection_string, isolation_level="AUTOCOMMIT")
+
+    with engine.connect() as connection:
+        for table_name, column_aliases in VECTOR_INDEXED_TABLES.items():
+            # Collections with shortened embeddings or reduced precision storage have their own indexes
+            collection_index_settings = (
+                get_collection_index_settings(connection)
+                if table_name == "document_embeddings"
+                else []
+            )
+
+            if drop_existing:
+                drop_vector_indexes(
+                    connection, table_name, column_aliases, model_dimensions
+                )
+
+                for model_name, dimensions, storage in collection_index_settings:
+                    drop_vector_indexes(
+                        connection,
+                        table_name,
+                        DOCUMENT_EMBEDDING_STORAGE_COLUMNS[storage],
+                        {model_name: dimensions},
+                    )
+
+            existing_indexes = get_existing_vector_indexes(connection, table_name)
+
+            create_vector_indexes(
+                connection,
+                table_name,
+                column_aliases,
+                model_dimensions,
+                index_configuration,
+            )
+
+            for model_name, dimensions, storage in collection_index_settings:
+                create_document_embedding_indexes(
+                    connection, model_name, dimensions, storage, index_configuration
+                )
+
+            for index_name in existing_indexes:
+                logging.info(f"Reindexing {index_name}")
+                connection.execute(text(f"REINDEX INDEX CONCURRENTLY {index_name}"))
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Create and rebuild the vector (ANN) indexes for the embedding models in the app configuration."
+    )
+    parser.add_argument(
+        "--drop-existing",
+        action="store_true",
+        help="Drop and recreate the indexes instead of reindexing them",
+    )
+    args = parser.parse_args()
+
+    rebuild_vector_indexes(get_connection_string(), drop_existing=args.drop_existing)
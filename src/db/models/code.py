@@ -3,11 +3,12 @@ import sys
 import os
 from datetime import datetime
 
-from typing import List, Any
+from typing import Iterator, List, Any, Set, Tuple
 from urllib.parse import urlparse
 from requests import Session
 
-from sqlalchemy import and_, func, select, column, cast, or_
+from sqlalchemy import String, and_, bindparam, delete, func, select, column, cast, or_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 
 import pgvector.sqlalchemy
 from src.ai.prompts.prompt_models.code_details_extraction import (
@@ -24,7 +25,10 @@ from src.db.models.user_settings import UserSettings
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
 
 from src.db.models.domain.code_repository_model import CodeRepositoryModel
-from src.db.models.domain.code_file_model import CodeFileModel
+from src.db.models.domain.code_file_model import (
+    CodeFileListingModel,
+    CodeFileModel,
+)
 
 from src.db.database.tables import (
     CodeDescription,
@@ -43,6 +47,9 @@ from src.ai.utilities.embeddings_helper import (
     get_embedding_by_model,
 )
 
+# How many rows are fetched at a time when streaming large listings
+LISTING_BATCH_SIZE = 1000
+
 
 class Code(VectorDatabase):
     def get_repositories(self) -> List[CodeRepositoryModel]:
@@ -139,6 +146,83 @@ class Code(VectorDatabase):
                 code_repository_files_association.insert().values(**assoc_entry)
             )
 
+    def plan_repository_scan(
+        self, code_repo_id: int, files: List[Tuple[str, str]]
+    ) -> Set[Tuple[str, str]]:
+        """Brings a repository's linked code files up to date with a scan, in one transaction.
+
+        The code files that are already stored (same path and sha, from any repository) are linked to the
+        repository, and the links to files that are no longer in it (removed, or changed) are deleted.
+
+        Args:
+            code_repo_id (int): The ID of the repository.
+            files (List[Tuple[str, str]]): The (path, sha) of every file in the scanned repository.
+
+        Returns:
+            Set[Tuple[str, str]]: The (path, sha) pairs that are already stored- the rest are new or changed.
+        """
+        # All of the pairs are sent as two arrays, rather than a parameter per file
+        scanned_files = (
+            func.unnest(
+                bindparam("paths", [path for path, _ in files], type_=ARRAY(String)),
+                bindparam("shas", [sha for _, sha in files], type_=ARRAY(String)),
+            )
+            .table_valued("path", "sha")
+            .render_derived()
+        )
+
+        with self.session_context(self.Session()) as session:
+            existing_files = session.execute(
+                select(
+                    scanned_files.c.path,
+                    scanned_files.c.sha,
+                    func.min(CodeFile.id).label("code_file_id"),
+                )
+                .join(
+                    CodeFile,
+                    and_(
+                        func.lower(CodeFile.code_file_name)
+                        == func.lower(scanned_files.c.path),
+                        CodeFile.code_file_sha == scanned_files.c.sha,
+                    ),
+                )
+                .group_by(scanned_files.c.path, scanned_files.c.sha)
+            ).all()
+
+            existing_code_file_ids = list({f.code_file_id for f in existing_files})
+
+            # Only delete the links that disappeared, and leave the ones that are still there alone
+            session.execute(
+                delete(code_repository_files_association).where(
+                    code_repository_files_association.c.code_repository_id
+                    == code_repo_id,
+                    code_repository_files_association.c.code_file_id.notin_(
+                        existing_code_file_ids
+                    ),
+                )
+            )
+
+            if existing_code_file_ids:
+                session.execute(
+                    insert(code_repository_files_association)
+                    .values(
+                        [
+                            {
+                                "code_repository_id": code_repo_id,
+                                "code_file_id": code_file_id,
+                            }
+                            for code_file_id in existing_code_file_ids
+                        ]
+                    )
+                    .on_conflict_do_nothing()
+                )
+
+            logging.info(
+                f"{len(existing_files)} of the {len(files)} scanned files are already stored, and linked to repository {code_repo_id}"
+            )
+
+            return {(f.path, f.sha) for f in existing_files}
+
     def add_update_code(
         self,
         repository_id,
@@ -258,7 +342,6 @@ class Code(VectorDatabase):
                     CodeFile.code_file_sha,
                     CodeFile.code_file_content,
                     CodeFile.code_file_summary,
-                    CodeFile.code_file_summary_embedding,
                     CodeFile.record_created,
                 )
                 .join(
@@ -274,6 +357,107 @@ class Code(VectorDatabase):
 
             return [CodeFileModel.from_database_model(c) for c in code_files]
 
+    def iterate_code_files(self, repository_id: int) -> Iterator[CodeFileModel]:
+        """Streams a repository's code files, with their content, LISTING_BATCH_SIZE rows at a time"""
+        with self.session_context(self.Session()) as session:
+            code_files = (
+                session.query(
+                    CodeFile.id,
+                    CodeFile.code_file_name,
+                    CodeFile.code_file_sha,
+                    CodeFile.code_file_content,
+                    CodeFile.code_file_summary,
+                    CodeFile.record_created,
+                )
+                .join(
+                    code_repository_files_association,
+                    CodeFile.id == code_repository_files_association.c.code_file_id,
+                )
+                .filter(
+                    code_repository_files_association.c.code_repository_id
+                    == repository_id
+                )
+                .yield_per(LISTING_BATCH_SIZE)
+            )
+
+            for code_file in code_files:
+                yield CodeFileModel.from_database_model(code_file)
+
+    def _filter_repository_files(
+        self,
+        query,
+        repository_id: int,
+        folder_path: str = None,
+        partial_file_name: str = None,
+    ):
+        query = query.join(
+            code_repository_files_association,
+            CodeFile.id == code_repository_files_association.c.code_file_id,
+        ).filter(code_repository_files_association.c.code_repository_id == repository_id)
+
+        if folder_path:
+            query = query.filter(CodeFile.code_file_name.like(f"{folder_path}/%"))
+
+        if partial_file_name:
+            query = query.filter(
+                func.lower(CodeFile.code_file_name).contains(partial_file_name.lower())
+            )
+
+        return query
+
+    def get_code_file_listing(
+        self,
+        repository_id: int,
+        folder_path: str = None,
+        partial_file_name: str = None,
+        include_summary: bool = False,
+    ) -> List[CodeFileListingModel]:
+        """Lists a repository's code files without their content (or summaries, unless include_summary is set).
+
+        Args:
+            repository_id (int): The ID of the repository.
+            folder_path (str, optional): Only the files in this folder (a path within the repository).
+            partial_file_name (str, optional): Only the files whose names contain this (case insensitive).
+            include_summary (bool, optional): Whether to load the file summaries.
+        """
+        columns = [CodeFile.id, CodeFile.code_file_name, CodeFile.code_file_sha]
+        if include_summary:
+            columns.append(CodeFile.code_file_summary)
+
+        with self.session_context(self.Session()) as session:
+            code_files = self._filter_repository_files(
+                session.query(*columns),
+                repository_id,
+                folder_path=folder_path,
+                partial_file_name=partial_file_name,
+            ).yield_per(LISTING_BATCH_SIZE)
+
+            return [CodeFileListingModel.from_database_model(c) for c in code_files]
+
+    def get_code_file_count(self, repository_id: int, folder_path: str = None) -> int:
+        with self.session_context(self.Session()) as session:
+            return self._filter_repository_files(
+                session.query(func.count(CodeFile.id)),
+                repository_id,
+                folder_path=folder_path,
+            ).scalar()
+
+    def get_code_file_line_counts(self, repository_id: int) -> List[Tuple[str, int]]:
+        """Gets the (file name, number of lines) of each of a repository's code files, counted by the database"""
+        line_count = (
+            func.length(CodeFile.code_file_content)
+            - func.length(func.replace(CodeFile.code_file_content, "\n", ""))
+            + 1
+        )
+
+        with self.session_context(self.Session()) as session:
+            code_files = self._filter_repository_files(
+                session.query(CodeFile.code_file_name, line_count.label("line_count")),
+                repository_id,
+            ).yield_per(LISTING_BATCH_SIZE)
+
+            return [(c.code_file_name, c.line_count or 0) for c in code_files]
+
     def get_code_file_by_id(self, code_file_id: int) -> CodeFileModel:
         with self.session_context(self.Session()) as session:
             # We now need to join CodeFile with the association table and then filter by repository ID
@@ -284,7 +468,6 @@ class Code(VectorDatabase):
                     CodeFile.code_file_sha,
                     CodeFile.code_file_content,
                     CodeFile.code_file_summary,
-                    CodeFile.code_file_summary_embedding,
                     CodeFile.record_created,
                 )
                 .filter(CodeFile.id == code_file_id)
@@ -305,7 +488,6 @@ class Code(VectorDatabase):
                     CodeFile.code_file_sha,
                     CodeFile.code_file_content,
                     CodeFile.code_file_summary,
-                    CodeFile.code_file_summary_embedding,
                     CodeFile.record_created,
                 )
                 .join(
@@ -366,7 +548,6 @@ class Code(VectorDatabase):
                     CodeFile.code_file_sha,
                     CodeFile.code_file_content,
                     CodeFile.code_file_summary,
-                    CodeFile.code_file_summary_embedding,
                     CodeFile.record_created,
                 )
                 .join(
@@ -445,7 +626,6 @@ class Code(VectorDatabase):
                     CodeFile.code_file_sha,
                     CodeFile.code_file_content,
                     CodeFile.code_file_summary,
-                    CodeFile.code_file_summary_embedding,
                     CodeFile.record_created,
                 )
                 .join(
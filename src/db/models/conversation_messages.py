@@ -1,5 +1,6 @@
 from typing import Union, List, Any
 from uuid import UUID
+from sqlalchemy import update
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
 from src.db.database.tables import ConversationMessage
@@ -65,10 +66,22 @@ class ConversationMessages(VectorDatabase):
                 search_type = SearchType(search_type)
 
             if search_type == SearchType.Keyword:
-                # TODO: Do better key word search
-                query = query.filter(
-                    ConversationMessage.message_text.contains(search_query)
-                ).limit(top_k)
+                full_text_query = self.get_full_text_query(search_query)
+
+                query = (
+                    query.filter(
+                        ConversationMessage.message_text_search_vector.op("@@")(
+                            full_text_query
+                        )
+                    )
+                    .order_by(
+                        self.get_full_text_rank(
+                            ConversationMessage.message_text_search_vector,
+                            full_text_query,
+                        ).desc()
+                    )
+                    .limit(top_k)
+                )
             elif search_type == SearchType.Similarity:
                 # Calculate the query embedding, then search for the nearest neighbors
                 embedding = self.get_embedding(search_query)
@@ -101,6 +114,8 @@ class ConversationMessages(VectorDatabase):
                     ConversationMessage.additional_metadata,
                     ConversationMessage.exception,
                     ConversationMessage.is_deleted,
+                    ConversationMessage.message_token_count,
+                    ConversationMessage.message_token_encoding,
                 )
                 .filter(
                     ConversationMessage.conversation_id == conversation_id,
@@ -117,6 +132,56 @@ class ConversationMessages(VectorDatabase):
                 ConversationMessageModel.from_database_model(c) for c in query.limit(top_k)
             ]
 
+    def get_conversation_messages_page(
+        self,
+        conversation_id: UUID,
+        before_id: int = None,
+        page_size: int = 50,
+        return_deleted: bool = False,
+    ) -> List[ConversationMessageModel]:
+        """Gets a page of messages from a conversation, newest first.
+
+        Pages are keyed on the message id, so pass the id of the oldest message in the
+        previous page as before_id to get the next (older) page.
+        """
+        with self.session_context(self.Session()) as session:
+            query = session.query(ConversationMessage).filter(
+                ConversationMessage.conversation_id == conversation_id
+            )
+
+            if not return_deleted:
+                query = query.filter(ConversationMessage.is_deleted == False)
+
+            if before_id is not None:
+                query = query.filter(ConversationMessage.id < before_id)
+
+            query = query.order_by(ConversationMessage.id.desc()).limit(page_size)
+
+            return [ConversationMessageModel.from_database_model(c) for c in query]
+
+    def set_message_token_counts(self, token_encoding: str, token_counts: dict) -> None:
+        """Stores the token counts for messages.
+
+        Args:
+            token_encoding (str): The tiktoken encoding the messages were counted with.
+            token_counts (dict): Map of message id -> token count.
+        """
+        if not token_counts:
+            return
+
+        with self.session_context(self.Session()) as session:
+            session.execute(
+                update(ConversationMessage),
+                [
+                    {
+                        "id": message_id,
+                        "message_token_count": token_count,
+                        "message_token_encoding": token_encoding,
+                    }
+                    for message_id, token_count in token_counts.items()
+                ],
+            )
+
     def get_conversations_for_user(
         self, associated_user_id: int, top_k: int = None
     ) -> List[ConversationMessageModel]:
@@ -0,0 +1,483 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pgvector.sqlalchemy
+from sqlalchemy import cast, func
+
+from src.db.database.tables import Document, DocumentEmbedding
+from src.db.database.vector_index_utilities import get_vector_index_configuration
+from src.db.models.domain.document_embedding_kind import DocumentEmbeddingKind
+from src.db.models.vector_database import VectorDatabase
+from src.utilities.local_vector_index import (
+    DEFAULT_HNSW_EF_CONSTRUCTION,
+    DEFAULT_HNSW_EF_SEARCH,
+    DEFAULT_HNSW_M,
+    DEFAULT_HNSW_THRESHOLD,
+    NumpyVectorIndex,
+)
+
+# The local (in-process) index of a collection's document embeddings, used instead of pgvector's indexes when the
+# vector_index backend is "local". See src/utilities/local_vector_index.py.
+#
+# The embeddings are still stored in the database, and the index follows it- Documents updates the loaded indexes
+# as it stores and deletes embeddings, and before each search an index compares its count and newest version with the
+# collection's, catching up on embeddings stored or replaced by other processes (or rebuilding, if some were deleted
+# elsewhere).  Every write to document_embeddings takes a new version from document_embeddings_version_seq, so an
+# upserted embedding (which keeps its id) is caught up on as well.
+
+LOCAL_BACKEND = "local"
+
+DEFAULT_LOCAL_VECTOR_INDEX_CONFIGURATION = {
+    "path": "data/vector_indexes",
+    "hnsw_threshold": DEFAULT_HNSW_THRESHOLD,
+    "hnsw_m": DEFAULT_HNSW_M,
+    "hnsw_ef_construction": DEFAULT_HNSW_EF_CONSTRUCTION,
+    "hnsw_ef_search": DEFAULT_HNSW_EF_SEARCH,
+    # Saving rewrites the index files, so changes are saved at most this often (anything unsaved is caught up from the database)
+    "save_interval_seconds": 60,
+}
+
+METADATA_FILE_NAME = "metadata.npz"
+
+# The number of embeddings read from the database at a time when building an index
+LOAD_BATCH_SIZE = 2000
+
+KIND_CODES = {kind.value: code for code, kind in enumerate(DocumentEmbeddingKind)}
+
+
+def is_local_vector_index_enabled() -> bool:
+    return get_vector_index_configuration().get("backend", "pgvector") == LOCAL_BACKEND
+
+
+def get_local_vector_index_configuration() -> dict:
+    configuration = dict(DEFAULT_LOCAL_VECTOR_INDEX_CONFIGURATION)
+    configuration.update(get_vector_index_configuration().get("local", {}))
+
+    return configuration
+
+
+class DocumentEmbeddingIndex(VectorDatabase):
+    """The local index of one collection's document embeddings, for one embedding model"""
+
+    def __init__(self, collection_id: int, model_name: str, dimensions: int):
+        super().__init__()
+
+        self.collection_id = collection_id
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.configuration = get_local_vector_index_configuration()
+
+        model_slug = re.sub(r"[^a-z0-9]+", "_", model_name.lower()).strip("_")
+        self.directory = os.path.join(
+            self.configuration["path"], f"collection_{collection_id}_{model_slug}"
+        )
+
+        self._index: NumpyVectorIndex = None
+        # Sorted embedding ids, with the version, document id, file id and kind of each
+        self._metadata_ids = np.zeros(0, dtype=np.int64)
+        self._versions = np.zeros(0, dtype=np.int64)
+        self._document_ids = np.zeros(0, dtype=np.int64)
+        self._file_ids = np.zeros(0, dtype=np.int64)
+        self._kinds = np.zeros(0, dtype=np.int16)
+        # Every version up to this one has been caught up on
+        self._max_version = 0
+
+        self._last_save = time.monotonic()
+        self._unsaved_changes = False
+        self._lock = threading.RLock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def search(
+        self,
+        embedding,
+        top_k: int,
+        kinds: List[DocumentEmbeddingKind],
+        target_file_id: int = None,
+        document_ids: List[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """Gets the (document id, cosine distance) of the documents with the nearest of the top_k nearest embeddings, nearest first.
+
+        Setting document_ids only searches the embeddings of those documents (e.g. the ones that match a metadata filter).
+        """
+        kind_codes = [KIND_CODES[kind.value] for kind in kinds]
+        if document_ids is not None:
+            allowed_document_ids = np.asarray(document_ids, dtype=np.int64)
+
+        with self._lock:
+            with self.session_context(self.Session()) as session:
+                if self._index is None:
+                    self._load(session)
+                self._catch_up(session)
+
+            def id_filter(ids: np.ndarray) -> np.ndarray:
+                positions = np.searchsorted(self._metadata_ids, ids)
+                allowed = np.isin(self._kinds[positions], kind_codes)
+                if target_file_id is not None:
+                    allowed &= self._file_ids[positions] == target_file_id
+                if document_ids is not None:
+                    allowed &= np.isin(
+                        self._document_ids[positions], allowed_document_ids
+                    )
+                return allowed
+
+            ids, distances = self._index.search(embedding, top_k, id_filter)
+            nearest_document_ids = self._document_ids[np.searchsorted(self._metadata_ids, ids)]
+
+            self._save_if_due()
+
+        # Each document can match on several kinds of embedding, keep its nearest
+        nearest = {}
+        for document_id, distance in zip(
+            nearest_document_ids.tolist(), distances.tolist()
+        ):
+            nearest.setdefault(document_id, distance)
+
+        return list(nearest.items())
+
+    def add(
+        self,
+        embedding_ids: List[int],
+        versions: List[int],
+        document_ids: List[int],
+        file_ids: List[int],
+        kinds: List[str],
+        embeddings: List,
+    ) -> None:
+        """Adds (or replaces) stored embeddings, if the index is loaded- otherwise it catches up when it is"""
+        if not embedding_ids:
+            return
+
+        with self._lock:
+            if self._index is None:
+                return
+
+            self._add(
+                np.asarray(embedding_ids, dtype=np.int64),
+                np.asarray(versions, dtype=np.int64),
+                np.asarray(document_ids, dtype=np.int64),
+                np.asarray([file_id or 0 for file_id in file_ids], dtype=np.int64),
+                np.asarray([KIND_CODES[kind] for kind in kinds], dtype=np.int16),
+                np.asarray(embeddings, dtype=np.float32),
+            )
+            self._save_if_due()
+
+    def remove_documents(self, document_ids: List[int]) -> None:
+        """Removes all of the embeddings of the given documents"""
+        with self._lock:
+            if self._index is None or not document_ids:
+                return
+
+            removed = np.isin(self._document_ids, np.asarray(document_ids, dtype=np.int64))
+            if not removed.any():
+                return
+
+            self._index.remove(self._metadata_ids[removed])
+
+            kept = ~removed
+            self._metadata_ids = self._metadata_ids[kept]
+            self._versions = self._versions[kept]
+            self._document_ids = self._document_ids[kept]
+            self._file_ids = self._file_ids[kept]
+            self._kinds = self._kinds[kept]
+            self._unsaved_changes = True
+
+            self._save_if_due()
+
+    def delete(self) -> None:
+        """Deletes the index (and its files)"""
+        with self._lock:
+            self._index = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self) -> None:
+        with self._lock:
+            if self._index is None:
+                return
+
+            self._index.save(self.directory)
+
+            metadata_path = os.path.join(self.directory, METADATA_FILE_NAME)
+            with open(metadata_path + ".tmp", "wb") as file:
+                np.savez(
+                    file,
+                    ids=self._metadata_ids,
+                    versions=self._versions,
+                    document_ids=self._document_ids,
+                    file_ids=self._file_ids,
+                    kinds=self._kinds,
+                    max_version=np.asarray([self._max_version], dtype=np.int64),
+                )
+            os.replace(metadata_path + ".tmp", metadata_path)
+
+            self._last_save = time.monotonic()
+            self._unsaved_changes = False
+
+    def _save_if_due(self) -> None:
+        if (
+            self._unsaved_changes
+            and time.monotonic() - self._last_save
+            >= self.configuration["save_interval_seconds"]
+        ):
+            self.save()
+
+    def _create_index(self) -> NumpyVectorIndex:
+        return NumpyVectorIndex(
+            self.dimensions,
+            hnsw_threshold=self.configuration["hnsw_threshold"],
+            hnsw_m=self.configuration["hnsw_m"],
+            hnsw_ef_construction=self.configuration["hnsw_ef_construction"],
+            hnsw_ef_search=self.configuration["hnsw_ef_search"],
+        )
+
+    def _load(self, session) -> None:
+        """Loads the saved index, or builds it from the database"""
+        index = None
+        metadata_path = os.path.join(self.directory, METADATA_FILE_NAME)
+
+        if os.path.exists(metadata_path):
+            index = NumpyVectorIndex.load(
+                self.directory,
+                self.dimensions,
+                hnsw_threshold=self.configuration["hnsw_threshold"],
+                hnsw_m=self.configuration["hnsw_m"],
+                hnsw_ef_construction=self.configuration["hnsw_ef_construction"],
+                hnsw_ef_search=self.configuration["hnsw_ef_search"],
+            )
+
+        if index is not None:
+            with np.load(metadata_path) as metadata:
+                # Indexes saved before the versions were tracked are rebuilt
+                if "versions" in metadata:
+                    self._metadata_ids = metadata["ids"]
+                    self._versions = metadata["versions"]
+                    self._document_ids = metadata["document_ids"]
+                    self._file_ids = metadata["file_ids"]
+                    self._kinds = metadata["kinds"]
+                    self._max_version = int(metadata["max_version"][0])
+                else:
+                    index = None
+
+            if index is not None and len(self._metadata_ids) == len(index):
+                self._index = index
+                return
+
+        self._rebuild(session)
+
+    def _rebuild(self, session) -> None:
+        logging.info(
+            f"Building the local vector index for collection {self.collection_id} ({self.model_name})"
+        )
+
+        self._index = self._create_index()
+        self._metadata_ids = np.zeros(0, dtype=np.int64)
+        self._versions = np.zeros(0, dtype=np.int64)
+        self._document_ids = np.zeros(0, dtype=np.int64)
+        self._file_ids = np.zeros(0, dtype=np.int64)
+        self._kinds = np.zeros(0, dtype=np.int16)
+
+        # Anything written after this is caught up on by the next search
+        self._max_version = self._get_collection_state(session)[1]
+        self._load_embeddings(session, DocumentEmbedding.version <= self._max_version)
+        self.save()
+
+    def _get_collection_state(self, session) -> Tuple[int, int]:
+        """Gets the number of embeddings in the collection, and the newest version"""
+        count, max_version = (
+            session.query(
+                func.count(DocumentEmbedding.id), func.max(DocumentEmbedding.version)
+            )
+            .filter(
+                DocumentEmbedding.collection_id == self.collection_id,
+                DocumentEmbedding.embedding_model_name == self.model_name,
+            )
+            .one()
+        )
+
+        return count, max_version or 0
+
+    def _catch_up(self, session) -> None:
+        """Catches up on the embeddings that were stored, replaced (or deleted) without updating this index"""
+        count, max_version = self._get_collection_state(session)
+
+        if count == len(self._index) and max_version == self._max_version:
+            return
+
+        if max_version > self._max_version:
+            changed = (
+                session.query(DocumentEmbedding.id, DocumentEmbedding.version)
+                .filter(
+                    DocumentEmbedding.collection_id == self.collection_id,
+                    DocumentEmbedding.embedding_model_name == self.model_name,
+                    DocumentEmbedding.version > self._max_version,
+                    DocumentEmbedding.version <= max_version,
+                )
+                .all()
+            )
+
+            # Only load the ones this process didn't add itself
+            changed_ids = np.asarray([row.id for row in changed], dtype=np.int64)
+            changed_versions = np.asarray(
+                [row.version for row in changed], dtype=np.int64
+            )
+            stale = changed_versions != self._get_versions(changed_ids)
+
+            if stale.any():
+                self._load_embeddings(
+                    session, DocumentEmbedding.id.in_(changed_ids[stale].tolist())
+                )
+
+            self._max_version = max_version
+            self._unsaved_changes = True
+
+        if count != len(self._index):
+            # Some were deleted (or moved to another collection) by another process
+            self._rebuild(session)
+
+    def _get_versions(self, embedding_ids: np.ndarray) -> np.ndarray:
+        """Gets the versions of the embeddings in the index, or -1 for the ones that aren't in it"""
+        if len(self._metadata_ids) == 0:
+            return np.full(len(embedding_ids), -1, dtype=np.int64)
+
+        positions = np.minimum(
+            np.searchsorted(self._metadata_ids, embedding_ids),
+            len(self._metadata_ids) - 1,
+        )
+
+        return np.where(
+            self._metadata_ids[positions] == embedding_ids,
+            self._versions[positions],
+            -1,
+        )
+
+    def _load_embeddings(self, session, embedding_filter=None) -> None:
+        # Binary and halfvec storage keep the embeddings in embedding_half
+        embedding = func.coalesce(
+            DocumentEmbedding.embedding,
+            cast(DocumentEmbedding.embedding_half, pgvector.sqlalchemy.Vector),
+            type_=pgvector.sqlalchemy.Vector,
+        )
+
+        query = (
+            session.query(
+                DocumentEmbedding.id,
+                DocumentEmbedding.version,
+                DocumentEmbedding.document_id,
+                Document.file_id,
+                DocumentEmbedding.kind,
+                embedding.label("embedding"),
+            )
+            .join(Document, Document.id == DocumentEmbedding.document_id)
+            .filter(
+                DocumentEmbedding.collection_id == self.collection_id,
+                DocumentEmbedding.embedding_model_name == self.model_name,
+            )
+        )
+
+        if embedding_filter is not None:
+            query = query.filter(embedding_filter)
+
+        rows = []
+        for row in query.yield_per(LOAD_BATCH_SIZE):
+            rows.append(row)
+
+            if len(rows) >= LOAD_BATCH_SIZE:
+                self._add_rows(rows)
+                rows = []
+
+        self._add_rows(rows)
+
+    def _add_rows(self, rows: list) -> None:
+        if not rows:
+            return
+
+        self._add(
+            np.asarray([row.id for row in rows], dtype=np.int64),
+            np.asarray([row.version for row in rows], dtype=np.int64),
+            np.asarray([row.document_id for row in rows], dtype=np.int64),
+            np.asarray([row.file_id or 0 for row in rows], dtype=np.int64),
+            np.asarray([KIND_CODES[row.kind] for row in rows], dtype=np.int16),
+            np.asarray([row.embedding for row in rows], dtype=np.float32),
+        )
+
+    def _add(
+        self,
+        embedding_ids: np.ndarray,
+        versions: np.ndarray,
+        document_ids: np.ndarray,
+        file_ids: np.ndarray,
+        kinds: np.ndarray,
+        embeddings: np.ndarray,
+    ) -> None:
+        self._index.add(embedding_ids, embeddings)
+
+        # Replace the metadata of any embeddings that were already there
+        kept = ~np.isin(self._metadata_ids, embedding_ids)
+        metadata_ids = np.concatenate([self._metadata_ids[kept], embedding_ids])
+        order = np.argsort(metadata_ids, kind="stable")
+
+        self._metadata_ids = metadata_ids[order]
+        self._versions = np.concatenate([self._versions[kept], versions])[order]
+        self._document_ids = np.concatenate([self._document_ids[kept], document_ids])[order]
+        self._file_ids = np.concatenate([self._file_ids[kept], file_ids])[order]
+        self._kinds = np.concatenate([self._kinds[kept], kinds])[order]
+
+        self._unsaved_changes = True
+
+
+# (collection id, model name) -> index
+_document_embedding_indexes: Dict[tuple, DocumentEmbeddingIndex] = {}
+_document_embedding_indexes_lock = threading.Lock()
+
+
+def get_document_embedding_index(
+    collection_id: int, model_name: str, dimensions: int
+) -> DocumentEmbeddingIndex:
+    """Gets the local index for a collection's embeddings- it is loaded (or built) the first time it is searched"""
+    with _document_embedding_indexes_lock:
+        key = (collection_id, model_name)
+
+        if key not in _document_embedding_indexes:
+            _document_embedding_indexes[key] = DocumentEmbeddingIndex(
+                collection_id, model_name, dimensions
+            )
+
+        return _document_embedding_indexes[key]
+
+
+def get_loaded_document_embedding_indexes(
+    collection_id: int = None,
+) -> List[DocumentEmbeddingIndex]:
+    """Gets the local indexes of a collection (or all of them) that are loaded in this process"""
+    with _document_embedding_indexes_lock:
+        return [
+            index
+            for (index_collection_id, _), index in _document_embedding_indexes.items()
+            if (collection_id is None or index_collection_id == collection_id)
+            and index.is_loaded
+        ]
+
+
+def delete_document_embedding_indexes(collection_id: int) -> None:
+    """Deletes all of a collection's local indexes, e.g. when the collection is deleted or converted"""
+    with _document_embedding_indexes_lock:
+        keys = [key for key in _document_embedding_indexes if key[0] == collection_id]
+        indexes = [_document_embedding_indexes.pop(key) for key in keys]
+
+    for index in indexes:
+        index.delete()
+
+    # Including any saved by other processes
+    path = get_local_vector_index_configuration()["path"]
+    if os.path.isdir(path):
+        for directory in os.listdir(path):
+            if directory.startswith(f"collection_{collection_id}_"):
+                shutil.rmtree(os.path.join(path, directory), ignore_errors=True)
@@ -1,39 +1,101 @@
 import sys
 import os
 
-from typing import List, Any
+from typing import Dict, List, Any, Set, Tuple
 
 from sqlalchemy.orm.attributes import InstrumentedAttribute
-from sqlalchemy import func, select, column, cast, or_
+from sqlalchemy import func, select, column, cast, or_, text, update
 
 import pgvector.sqlalchemy
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
 
+from sqlalchemy.dialects.postgresql import insert
+
 from src.db.database.tables import (
     Document,
     DocumentCollection,
+    DocumentEmbedding,
     File,
+    document_embeddings_version_seq,
 )
 
 from src.db.models.vector_database import VectorDatabase, SearchType
 from src.db.models.domain.document_collection_model import DocumentCollectionModel
 from src.db.models.domain.document_model import DocumentModel
+from src.db.models.domain.document_embedding_kind import DocumentEmbeddingKind
 from src.db.models.domain.file_model import FileModel
+from src.db.models.document_embedding_index import (
+    delete_document_embedding_indexes,
+    get_document_embedding_index,
+    get_loaded_document_embedding_indexes,
+    is_local_vector_index_enabled,
+)
+
+from src.db.database.vector_index_utilities import (
+    BINARY_STORAGE,
+    HALFVEC_STORAGE,
+    SUPPORTED_STORAGE_TYPES,
+    VECTOR_STORAGE,
+    create_document_embedding_indexes,
+    get_vector_index_configuration,
+    is_indexable,
+    set_search_parameters,
+)
+from src.utilities.hash_utilities import calculate_text_hash
+
+from src.ai.utilities.embedding_cache import get_embedding_cache
+from src.ai.utilities.embeddings_helper import (
+    get_embedding_by_model,
+    get_embeddings_by_model,
+    get_embedding_model_name,
+    get_embedding_dimensions,
+    split_embedding_model_name,
+)
+
 
-from src.ai.utilities.embeddings_helper import get_embedding_by_name, get_embedding_by_model
+# The instructions the document chunk texts are embedded with, by kind
+TEXT_EMBEDDING_INSTRUCTION = "Represent the document for retrieval: "
+SUMMARY_EMBEDDING_INSTRUCTION = "Represent the summary for retrieval: "
+QUESTION_EMBEDDING_INSTRUCTION = "Represent the question for retrieval: "
 
 
 class Documents(VectorDatabase):
     def create_collection(
-        self, collection_name, embedding_name
+        self,
+        collection_name,
+        embedding_name,
+        embedding_dimensions: int = None,
+        embedding_storage: str = VECTOR_STORAGE,
     ) -> DocumentCollectionModel:
+        if embedding_storage not in SUPPORTED_STORAGE_TYPES:
+            raise ValueError(
+                f"Unknown embedding storage '{embedding_storage}', expected one of {SUPPORTED_STORAGE_TYPES}"
+            )
+
+        # Raises if the model's embeddings can't be shortened to these dimensions
+        model_name = get_embedding_model_name(embedding_name, embedding_dimensions)
+        _, embedding_dimensions = split_embedding_model_name(model_name)
+
         with self.session_context(self.Session()) as session:
             collection = DocumentCollection(
-                collection_name=collection_name, embedding_name=embedding_name
+                collection_name=collection_name,
+                embedding_name=embedding_name,
+                embedding_dimensions=embedding_dimensions,
+                embedding_storage=embedding_storage,
             )
 
             session.add(collection)
+
+            # The configured models' full size vector indexes already exist (see vector_index_utilities.py)
+            if embedding_dimensions or embedding_storage != VECTOR_STORAGE:
+                create_document_embedding_indexes(
+                    session.connection(),
+                    model_name,
+                    get_embedding_dimensions(model_name),
+                    embedding_storage,
+                )
+
             session.commit()
 
             return DocumentCollectionModel.from_database_model(collection)
@@ -49,6 +111,8 @@ class Documents(VectorDatabase):
             session.delete(collection)
             session.commit()
 
+        delete_document_embedding_indexes(collection_id)
+
     def get_collection(self, collection_id) -> DocumentCollectionModel:
         with self.session_context(self.Session()) as session:
             collection = (
@@ -57,6 +121,8 @@ class Documents(VectorDatabase):
                     DocumentCollection.collection_name,
                     DocumentCollection.record_created,
                     DocumentCollection.embedding_name,
+                    DocumentCollection.embedding_dimensions,
+                    DocumentCollection.embedding_storage,
                 )
                 .filter(DocumentCollection.id == collection_id)
                 .first()
@@ -72,6 +138,8 @@ class Documents(VectorDatabase):
                     DocumentCollection.collection_name,
                     DocumentCollection.record_created,
                     DocumentCollection.embedding_name,
+                    DocumentCollection.embedding_dimensions,
+                    DocumentCollection.embedding_storage,
                 )
                 .filter(DocumentCollection.collection_name == collection_name)
                 .first()
@@ -86,10 +154,157 @@ class Documents(VectorDatabase):
                 DocumentCollection.collection_name,
                 DocumentCollection.record_created,
                 DocumentCollection.embedding_name,
+                DocumentCollection.embedding_dimensions,
+                DocumentCollection.embedding_storage,
             ).all()
 
             return [DocumentCollectionModel.from_database_model(c) for c in collections]
 
+    def get_collection_embedding_model_name(self, collection_id) -> str:
+        """Gets the model name a collection's documents are embedded with, including any shortened dimensions"""
+        collection = self.get_collection(collection_id)
+
+        return get_embedding_model_name(
+            collection.embedding_name, collection.embedding_dimensions
+        )
+
+    def convert_collection_embeddings(
+        self,
+        collection_id: int,
+        embedding_dimensions: int = None,
+        embedding_storage: str = None,
+    ) -> DocumentCollectionModel:
+        """Converts a collection's stored embeddings to fewer dimensions and/or another storage type, without re-embedding.
+
+        Shortening truncates the embeddings and normalizes them again, which gives the same embeddings as asking the
+        model for fewer dimensions (for the models that support it). Embeddings can't be made longer.
+        Anything not supplied stays the way the collection has it.
+        """
+        collection = self.get_collection(collection_id)
+
+        if collection is None:
+            raise ValueError(f"Collection with ID '{collection_id}' does not exist")
+
+        embedding_storage = embedding_storage or collection.embedding_storage
+
+        if embedding_storage not in SUPPORTED_STORAGE_TYPES:
+            raise ValueError(
+                f"Unknown embedding storage '{embedding_storage}', expected one of {SUPPORTED_STORAGE_TYPES}"
+            )
+
+        previous_model_name = get_embedding_model_name(
+            collection.embedding_name, collection.embedding_dimensions
+        )
+        model_name = get_embedding_model_name(
+            collection.embedding_name,
+            embedding_dimensions or collection.embedding_dimensions,
+        )
+        _, embedding_dimensions = split_embedding_model_name(model_name)
+        dimensions = get_embedding_dimensions(model_name)
+
+        if dimensions > get_embedding_dimensions(previous_model_name):
+            raise ValueError(
+                f"Can't convert {previous_model_name} embeddings to {dimensions} dimensions, the documents need to be ingested again"
+            )
+
+        source_column = self._get_embedding_column(collection.embedding_storage)
+        target_column = self._get_embedding_column(embedding_storage)
+
+        # subvector and l2_normalize work on full precision vectors
+        expression = f"{source_column}::vector"
+        if model_name != previous_model_name:
+            expression = f"l2_normalize(subvector({expression}, 1, {dimensions}))"
+        if target_column == "embedding_half":
+            expression = f"({expression})::halfvec"
+
+        assignments = [f"{target_column} = {expression}"]
+        if source_column != target_column:
+            assignments.append(f"{source_column} = NULL")
+        # So that the local indexes in other processes catch up on the converted embeddings
+        assignments.append("version = nextval('document_embeddings_version_seq')")
+
+        with self.session_context(self.Session()) as session:
+            previous_documents = self._get_documents_for_references(
+                session, Document.collection_id == collection_id
+            )
+
+            if model_name != previous_model_name or source_column != target_column:
+                session.execute(
+                    text(
+                        f"UPDATE document_embeddings SET {', '.join(assignments)}, embedding_model_name = :model_name "
+                        "WHERE collection_id = :collection_id"
+                    ),
+                    {"model_name": model_name, "collection_id": collection_id},
+                )
+
+            session.query(Document).filter(
+                Document.collection_id == collection_id
+            ).update({Document.embedding_model_name: model_name})
+
+            session.query(DocumentCollection).filter(
+                DocumentCollection.id == collection_id
+            ).update(
+                {
+                    DocumentCollection.embedding_dimensions: embedding_dimensions,
+                    DocumentCollection.embedding_storage: embedding_storage,
+                }
+            )
+
+            create_document_embedding_indexes(
+                session.connection(), model_name, dimensions, embedding_storage
+            )
+
+            session.commit()
+
+            documents = self._get_documents_for_references(
+                session, Document.collection_id == collection_id
+            )
+
+        # The local indexes are rebuilt (with the new embeddings) when they're next searched
+        delete_document_embedding_indexes(collection_id)
+
+        if model_name != previous_model_name:
+            # The embedding cache only has the previous model's embeddings
+            self._update_embedding_references(previous_documents, add=False)
+            self._update_embedding_references(documents, add=True)
+
+        return self.get_collection(collection_id)
+
+    @staticmethod
+    def _get_embedding_column(embedding_storage: str) -> str:
+        """Gets the document_embeddings column embeddings are stored in, for a collection's storage type"""
+        if embedding_storage in (HALFVEC_STORAGE, BINARY_STORAGE):
+            return "embedding_half"
+
+        return "embedding"
+
+    @staticmethod
+    def _get_metadata_filters(
+        metadata: dict = None, page_range: Tuple[int, int] = None
+    ) -> list:
+        """Gets the SQL filters on the document chunks' additional_metadata.
+
+        Args:
+            metadata: Only chunks whose metadata contains these keys and values, e.g. {"type": "MODULE"} (uses the GIN index).
+            page_range: Only chunks on these pages, as an inclusive (first page, last page)- either can be None.
+        """
+        filters = []
+
+        if metadata:
+            filters.append(Document.additional_metadata.contains(metadata))
+
+        if page_range:
+            first_page, last_page = page_range
+            # Compared as JSONB, so numbers compare as numbers
+            page = Document.additional_metadata["page"]
+
+            if first_page is not None:
+                filters.append(page >= first_page)
+            if last_page is not None:
+                filters.append(page <= last_page)
+
+        return filters
+
     def create_file(self, file: FileModel, file_data) -> FileModel:
         with self.session_context(self.Session()) as session:
             file = file.to_database_model()
@@ -115,6 +330,30 @@ class Documents(VectorDatabase):
 
             return FileModel.from_database_model(file)
 
+    def update_file_content(
+        self,
+        file_id: int,
+        file_hash: str,
+        file_data,
+        chunk_size: int,
+        chunk_overlap: int,
+    ) -> FileModel:
+        """Replaces the content of a file that is being re-ingested in place, keeping its chunks.
+
+        The summary and document count no longer apply to the new content, so they are reset.
+        """
+        with self.session_context(self.Session()) as session:
+            file = session.query(File).filter(File.id == file_id).first()
+            file.file_hash = file_hash
+            file.file_data = file_data
+            file.chunk_size = chunk_size
+            file.chunk_overlap = chunk_overlap
+            file.file_summary = None
+            file.document_count = 0
+            session.commit()
+
+            return FileModel.from_database_model(file)
+
     def get_file_data(self, file_id: int) -> Any:
         with self.session_context(self.Session()) as session:
             file = (
@@ -195,11 +434,19 @@ class Documents(VectorDatabase):
                     File.record_created,
                 )
                 .filter(File.collection_id == collection_id)
-                .all()
+                .yield_per(1000)
             )
 
             return [FileModel.from_database_model(f) for f in files]
 
+    def get_file_count_in_collection(self, collection_id) -> int:
+        with self.session_context(self.Session()) as session:
+            return (
+                session.query(func.count(File.id))
+                .filter(File.collection_id == collection_id)
+                .scalar()
+            )
+
     def delete_file(self, file_id) -> None:
         with self.session_context(self.Session()) as session:
             file = session.query(File).filter(File.id == file_id).first()
@@ -239,7 +486,13 @@ class Documents(VectorDatabase):
 
             return session.query(Document).filter(Document.file_id == file.id).count()
 
-    def get_document_chunks_by_file_id(self, target_file_id) -> List[DocumentModel]:
+    def get_document_chunks_by_file_id(
+        self,
+        target_file_id,
+        metadata: dict = None,
+        page_range: Tuple[int, int] = None,
+    ) -> List[DocumentModel]:
+        """Gets the chunks of a file, optionally only the ones matching the metadata and/or page range"""
         with self.session_context(self.Session()) as session:
             file = session.query(File).filter(File.id == target_file_id).first()
 
@@ -264,13 +517,140 @@ class Documents(VectorDatabase):
                     Document.question_3,
                     Document.question_4,
                     Document.question_5,
+                    Document.chunk_index,
+                    Document.content_hash,
+                )
+                .filter(
+                    Document.file_id == file.id,
+                    *self._get_metadata_filters(metadata, page_range),
                 )
-                .filter(Document.file_id == file.id)
+                # In chunk order, not the order the rows happen to be stored in
+                .order_by(Document.chunk_index.nulls_last(), Document.id)
                 .all()
             )
 
             return [DocumentModel.from_database_model(d) for d in documents]
 
+    def get_document_metadata_by_file_id(
+        self, target_file_id, metadata: dict = None
+    ) -> List[dict]:
+        """Gets the distinct metadata of a file's chunks (in chunk order), without reading the chunks themselves"""
+        with self.session_context(self.Session()) as session:
+            file = session.query(File.id).filter(File.id == target_file_id).first()
+
+            if file is None:
+                raise ValueError(f"File with ID '{target_file_id}' does not exist")
+
+            rows = (
+                session.query(Document.additional_metadata)
+                .filter(
+                    Document.file_id == file.id,
+                    Document.additional_metadata.isnot(None),
+                    *self._get_metadata_filters(metadata),
+                )
+                .group_by(Document.additional_metadata)
+                .order_by(func.min(Document.id))
+                .all()
+            )
+
+            return [row.additional_metadata for row in rows]
+
+    def get_document_chunk_ids_by_hash(self, target_file_id) -> Dict[str, List[int]]:
+        """Gets the IDs of a file's chunks by the hash of their text, for diffing a changed file against them"""
+        with self.session_context(self.Session()) as session:
+            documents = (
+                session.query(Document.id, Document.content_hash)
+                .filter(Document.file_id == target_file_id)
+                .order_by(Document.id)
+                .all()
+            )
+
+            # Chunks stored before the hashes were added need their text to be hashed here
+            unhashed_ids = [d.id for d in documents if d.content_hash is None]
+            hashes = {}
+            if unhashed_ids:
+                hashes = {
+                    d.id: calculate_text_hash(d.document_text)
+                    for d in session.query(Document.id, Document.document_text).filter(
+                        Document.id.in_(unhashed_ids)
+                    )
+                }
+
+            chunk_ids_by_hash = {}
+            for document in documents:
+                chunk_ids_by_hash.setdefault(
+                    document.content_hash or hashes[document.id], []
+                ).append(document.id)
+
+            return chunk_ids_by_hash
+
+    def keep_unchanged_document_chunks(
+        self, file_id: int, chunk_texts: Dict[int, str]
+    ) -> Set[int]:
+        """Diffs a changed file (chunk index -> chunk text, in order) against its stored chunks.
+
+        The stored chunks whose text is still in the file are kept (with their summaries, questions and
+        embeddings) and moved to their new positions, and the rest are deleted.
+
+        Returns:
+            The chunk indexes that were kept, the rest still need to be stored.
+        """
+        chunk_ids_by_hash = self.get_document_chunk_ids_by_hash(file_id)
+
+        chunk_indexes = {}
+        for chunk_index, chunk_text in chunk_texts.items():
+            chunk_ids = chunk_ids_by_hash.get(calculate_text_hash(chunk_text))
+            if chunk_ids:
+                chunk_indexes[chunk_ids.pop(0)] = chunk_index
+
+        # Delete first, so the removed chunks' positions are free for the kept ones
+        self.delete_documents(
+            [chunk_id for chunk_ids in chunk_ids_by_hash.values() for chunk_id in chunk_ids]
+        )
+        self.reindex_document_chunks(chunk_indexes)
+
+        return set(chunk_indexes.values())
+
+    def reindex_document_chunks(self, chunk_indexes: Dict[int, int]) -> None:
+        """Moves kept chunks to their positions in a changed file (document ID -> chunk index)"""
+        if not chunk_indexes:
+            return
+
+        with self.session_context(self.Session()) as session:
+            document_ids = list(chunk_indexes.keys())
+
+            # Clear them first, since the (file_id, chunk_index) index is checked row by row as they move
+            session.query(Document).filter(Document.id.in_(document_ids)).update(
+                {Document.chunk_index: None}, synchronize_session=False
+            )
+            session.execute(
+                update(Document),
+                [
+                    {"id": document_id, "chunk_index": chunk_index}
+                    for document_id, chunk_index in chunk_indexes.items()
+                ],
+            )
+
+            session.commit()
+
+    def delete_documents(self, document_ids: List[int]) -> None:
+        if not document_ids:
+            return
+
+        with self.session_context(self.Session()) as session:
+            deleted_documents = self._get_documents_for_references(
+                session, Document.id.in_(document_ids)
+            )
+
+            # The embeddings are deleted with the documents (ON DELETE CASCADE)
+            session.query(Document).filter(Document.id.in_(document_ids)).delete(
+                synchronize_session=False
+            )
+            session.commit()
+
+        self._update_embedding_references(deleted_documents, add=False)
+        self._remove_from_local_vector_indexes(document_ids)
+
     def set_collection_id_for_document_chunks(
         self, file_id: int, collection_id: int
     ) -> None:
@@ -282,8 +662,23 @@ class Documents(VectorDatabase):
             for document in documents:
                 document.collection_id = collection_id
 
+            document_ids = [d.id for d in documents]
+
+            session.query(DocumentEmbedding).filter(
+                DocumentEmbedding.document_id.in_(document_ids)
+            ).update(
+                {
+                    DocumentEmbedding.collection_id: collection_id,
+                    DocumentEmbedding.version: document_embeddings_version_seq.next_value(),
+                },
+                synchronize_session=False,
+            )
+
             session.commit()
 
+        # The new collection's local index catches up when it's next searched
+        self._remove_from_local_vector_indexes(document_ids)
+
     def get_document_summaries(self, target_file_id) -> List[str]:
         with self.session_context(self.Session()) as session:
             file = session.query(File.id).filter(File.id == target_file_id).first()
@@ -319,6 +714,11 @@ class Documents(VectorDatabase):
             documents = (
                 session.query(Document).filter(Document.file_id == file.id).all()
             )
+            deleted_documents = self._get_documents_for_references(
+                session, Document.file_id == file.id
+            )
+
+            document_ids = [document.id for document in documents]
 
             # Delete all of the documents associated with this file, and the file itself
             for document in documents:
@@ -326,6 +726,9 @@ class Documents(VectorDatabase):
 
             session.commit()
 
+        self._update_embedding_references(deleted_documents, add=False)
+        self._remove_from_local_vector_indexes(document_ids)
+
     def update_document_count(self, file_id: int, document_chunk_count: int) -> None:
         with self.session_context(self.Session()) as session:
             file = session.query(File).filter(File.id == file_id).first()
@@ -333,89 +736,297 @@ class Documents(VectorDatabase):
             session.commit()
 
     def store_document(self, document: DocumentModel) -> DocumentModel:
+        return self.store_documents([document])[0]
+
+    def get_stored_chunk_indexes(self, target_file_id: int) -> set:
+        """Gets the chunk indexes already stored for a file (only set for chunks stored by the ingestion pipeline)"""
         with self.session_context(self.Session()) as session:
-            # Generate the embedding for the document text
-            embedding = get_embedding_by_model(
-                text=document.document_text,
-                model_name=document.embedding_model_name,
-                instruction="Represent the document for retrieval: ",
+            rows = session.query(Document.chunk_index).filter(
+                Document.file_id == target_file_id,
+                Document.chunk_index.isnot(None),
             )
 
-            # Generate the embedding for the document text summary
-            document_text_summary_embedding = None
-            if document.document_text_summary.strip() != "":
-                document_text_summary_embedding = get_embedding_by_model(
+            return set(row.chunk_index for row in rows)
+
+    def store_documents(self, documents: List[DocumentModel]) -> List[DocumentModel]:
+        """Embeds and stores a batch of document chunks.
+
+        All of the texts that need embedding (chunk text, summary and questions) are grouped by
+        model and instruction so that each group is sent as batched requests, and the chunks are
+        inserted together in a single transaction.
+        """
+        return self.store_embedded_documents(
+            documents, self.embed_documents(documents)
+        )
+
+    def embed_documents(
+        self, documents: List[DocumentModel]
+    ) -> List[Dict[DocumentEmbeddingKind, List[float]]]:
+        """Creates the embeddings (chunk text, summary and questions) for a batch of document chunks.
+
+        Returns:
+            List[Dict[DocumentEmbeddingKind, List[float]]]: The embeddings for each document, by kind.
+        """
+        embedding_requests = {}
+        for index, document in enumerate(documents):
+            for kind, text, instruction in self._get_texts_to_embed(document):
+                embedding_requests.setdefault(
+                    (document.embedding_model_name, instruction), []
+                ).append((index, kind, text))
+
+        document_embeddings = [{} for _ in documents]
+        for (model_name, instruction), requests in embedding_requests.items():
+            embeddings = get_embeddings_by_model(
+                texts=[text for _, _, text in requests],
+                model_name=model_name,
+                instruction=instruction,
+            )
+
+            for (index, kind, _), embedding in zip(requests, embeddings):
+                document_embeddings[index][kind] = embedding
+
+        return document_embeddings
+
+    @staticmethod
+    def _get_texts_to_embed(document) -> List[tuple]:
+        """Gets the (kind, text, instruction) of each embedding for a document chunk (a DocumentModel or a Document row)"""
+        texts_to_embed = [
+            (
+                DocumentEmbeddingKind.TEXT,
+                document.document_text,
+                TEXT_EMBEDDING_INSTRUCTION,
+            )
+        ]
+
+        if (document.document_text_summary or "").strip() != "":
+            texts_to_embed.append(
+                (
+                    DocumentEmbeddingKind.SUMMARY,
                     document.document_text_summary,
-                    model_name=document.embedding_model_name,
-                    instruction="Represent the summary for retrieval: ",
+                    SUMMARY_EMBEDDING_INSTRUCTION,
                 )
+            )
 
-            # Generate the embeddings for the questions
-            question_embeddings = []
-            for question_number in range(1, 6):
-                question = getattr(document, f"question_{question_number}")
-                if str(question).strip() != "":
-                    question_embedding = get_embedding_by_model(
+        for question_number in range(1, 6):
+            question = getattr(document, f"question_{question_number}")
+            if question and question.strip() != "":
+                texts_to_embed.append(
+                    (
+                        DocumentEmbeddingKind.question(question_number),
                         question,
-                        model_name=document.embedding_model_name,
-                        instruction=f"Represent the question for retrieval: ",
+                        QUESTION_EMBEDDING_INSTRUCTION,
                     )
-                    question_embeddings.append(question_embedding)
-                else:
-                    question_embeddings.append(None)
+                )
 
-            document = document.to_database_model()
-            document.embedding = embedding
-            document.document_text_summary_embedding = document_text_summary_embedding
-            document.embedding_question_1 = (
-                question_embeddings[0] if question_embeddings[0] is not None else None
-            )
-            document.embedding_question_2 = (
-                question_embeddings[1] if question_embeddings[1] is not None else None
-            )
-            document.embedding_question_3 = (
-                question_embeddings[2] if question_embeddings[2] is not None else None
+        return texts_to_embed
+
+    def _update_embedding_references(self, documents, add: bool) -> None:
+        """Counts the stored (or deleted) document chunks' references to their embeddings in the embedding cache,
+        which keeps the embeddings of stored text from being evicted so that duplicated text is never embedded twice"""
+        embedding_cache = get_embedding_cache()
+
+        if embedding_cache is None or not documents:
+            return
+
+        texts_by_model_and_instruction = {}
+        for document in documents:
+            for _, text, instruction in self._get_texts_to_embed(document):
+                texts_by_model_and_instruction.setdefault(
+                    (document.embedding_model_name, instruction), []
+                ).append(text)
+
+        for (model_name, instruction), texts in texts_by_model_and_instruction.items():
+            if add:
+                embedding_cache.add_references(model_name, instruction, texts)
+            else:
+                embedding_cache.remove_references(model_name, instruction, texts)
+
+    def _get_documents_for_references(self, session, document_filter) -> list:
+        return (
+            session.query(
+                Document.embedding_model_name,
+                Document.document_text,
+                Document.document_text_summary,
+                Document.question_1,
+                Document.question_2,
+                Document.question_3,
+                Document.question_4,
+                Document.question_5,
             )
-            document.embedding_question_4 = (
-                question_embeddings[3] if question_embeddings[3] is not None else None
+            .filter(document_filter)
+            .all()
+        )
+
+    def _add_to_local_vector_indexes(self, embeddings: List[tuple]) -> None:
+        """Adds stored embeddings, as (collection id, model name, embedding id, version, document id, file id, kind, embedding),
+        to the local vector indexes that are loaded"""
+        if not embeddings:
+            return
+
+        embeddings_by_index = {}
+        for collection_id, model_name, *embedding in embeddings:
+            embeddings_by_index.setdefault((collection_id, model_name), []).append(
+                embedding
             )
-            document.embedding_question_5 = (
-                question_embeddings[4] if question_embeddings[4] is not None else None
+
+        for (collection_id, model_name), index_embeddings in embeddings_by_index.items():
+            for index in get_loaded_document_embedding_indexes(collection_id):
+                if index.model_name == model_name:
+                    index.add(*[list(values) for values in zip(*index_embeddings)])
+
+    def _remove_from_local_vector_indexes(self, document_ids: List[int]) -> None:
+        if not document_ids:
+            return
+
+        for index in get_loaded_document_embedding_indexes():
+            index.remove_documents(document_ids)
+
+    def store_embedded_documents(
+        self,
+        documents: List[DocumentModel],
+        document_embeddings: List[Dict[DocumentEmbeddingKind, List[float]]],
+    ) -> List[DocumentModel]:
+        """Stores a batch of document chunks with the embeddings from embed_documents, in a single transaction"""
+        embedding_columns = {
+            collection_id: self._get_embedding_column(
+                self.get_collection(collection_id).embedding_storage
             )
-            
-            document.document_text = document.document_text.replace('\00', '')
+            for collection_id in {document.collection_id for document in documents}
+        }
+
+        with self.session_context(self.Session()) as session:
+            db_documents = []
+            for document, embeddings in zip(documents, document_embeddings):
+                db_document = document.to_database_model()
+
+                for kind, embedding in embeddings.items():
+                    db_document.embeddings.append(
+                        DocumentEmbedding(
+                            collection_id=document.collection_id,
+                            kind=kind.value,
+                            embedding_model_name=document.embedding_model_name,
+                            **{embedding_columns[document.collection_id]: embedding},
+                        )
+                    )
+
+                db_document.document_text = db_document.document_text.replace(
+                    "\00", ""
+                )
+                db_document.content_hash = document.content_hash or calculate_text_hash(
+                    db_document.document_text
+                )
+
+                db_documents.append(db_document)
+
+            session.add_all(db_documents)
+
+            local_index_embeddings = []
+            if is_local_vector_index_enabled():
+                # Flush to get the embedding ids for the local vector indexes
+                session.flush()
+
+                for db_document, embeddings in zip(db_documents, document_embeddings):
+                    # In the same order they were appended
+                    for db_embedding, embedding in zip(
+                        db_document.embeddings, embeddings.values()
+                    ):
+                        local_index_embeddings.append(
+                            (
+                                db_document.collection_id,
+                                db_document.embedding_model_name,
+                                db_embedding.id,
+                                db_embedding.version,
+                                db_document.id,
+                                db_document.file_id,
+                                db_embedding.kind,
+                                embedding,
+                            )
+                        )
 
-            session.add(document)
             session.commit()
 
-            return DocumentModel.from_database_model(document)
+            # Embedded with the original text, before the NULs were removed
+            self._update_embedding_references(documents, add=True)
+            self._add_to_local_vector_indexes(local_index_embeddings)
+
+            return [DocumentModel.from_database_model(d) for d in db_documents]
 
     def set_document_text_summary(
         self, document_id: int, document_text_summary: str, collection_id: int
     ):
-        embedding_name = self.get_collection(
-            collection_id=collection_id
-        ).embedding_name
+        collection = self.get_collection(collection_id=collection_id)
+        model_name = get_embedding_model_name(
+            collection.embedding_name, collection.embedding_dimensions
+        )
+        embedding_column = self._get_embedding_column(collection.embedding_storage)
 
         with self.session_context(self.Session()) as session:
-            document_text_summary_embedding = None
             if document_text_summary.strip() != "":
-                document_text_summary_embedding = get_embedding_by_name(
+                document_text_summary_embedding = get_embedding_by_model(
                     document_text_summary,
-                    embedding_name=embedding_name,
-                    instruction="Represent the summary for retrieval: ",
+                    model_name=model_name,
+                    instruction=SUMMARY_EMBEDDING_INSTRUCTION,
+                )
+
+                previous_summary, file_id = (
+                    session.query(Document.document_text_summary, Document.file_id)
+                    .filter(Document.id == document_id)
+                    .one()
                 )
 
                 session.query(Document).filter(Document.id == document_id).update(
                     {
                         Document.document_text_summary: document_text_summary,
-                        Document.document_text_summary_embedding: document_text_summary_embedding,
                         Document.document_text_has_summary: True,
                     }
                 )
 
+                embedding_id, embedding_version = session.execute(
+                    insert(DocumentEmbedding)
+                    .values(
+                        document_id=document_id,
+                        collection_id=collection_id,
+                        kind=DocumentEmbeddingKind.SUMMARY.value,
+                        embedding_model_name=model_name,
+                        **{embedding_column: document_text_summary_embedding},
+                    )
+                    .on_conflict_do_update(
+                        index_elements=["document_id", "kind"],
+                        set_={
+                            embedding_column: document_text_summary_embedding,
+                            "version": document_embeddings_version_seq.next_value(),
+                        },
+                    )
+                    .returning(DocumentEmbedding.id, DocumentEmbedding.version)
+                ).one()
+
                 session.commit()
 
+                self._add_to_local_vector_indexes(
+                    [
+                        (
+                            collection_id,
+                            model_name,
+                            embedding_id,
+                            embedding_version,
+                            document_id,
+                            file_id,
+                            DocumentEmbeddingKind.SUMMARY.value,
+                            document_text_summary_embedding,
+                        )
+                    ]
+                )
+
+                embedding_cache = get_embedding_cache()
+                if embedding_cache is not None:
+                    if (previous_summary or "").strip() != "":
+                        embedding_cache.remove_references(
+                            model_name, SUMMARY_EMBEDDING_INSTRUCTION, [previous_summary]
+                        )
+                    embedding_cache.add_references(
+                        model_name, SUMMARY_EMBEDDING_INSTRUCTION, [document_text_summary]
+                    )
+
     def search_document_embeddings(
         self,
         search_query: str,
@@ -424,12 +1035,16 @@ class Documents(VectorDatabase):
         target_file_id: int = None,
         top_k=10,
         search_questions: bool = True,
+        metadata: dict = None,
+        page_range: Tuple[int, int] = None,
     ) -> List[DocumentModel]:
-        # # TODO: Handle searching metadata... e.g. metadata_search_query: Union[str,None] = None
+        """Searches the document chunks by keyword or similarity.
 
-        embedding_name = self.get_collection(
-            collection_id=collection_id
-        ).embedding_name
+        metadata and page_range (see _get_metadata_filters) restrict the search to the matching chunks, in the database.
+        """
+        metadata_filters = self._get_metadata_filters(metadata, page_range)
+
+        collection = self.get_collection(collection_id=collection_id)
 
         with self.session_context(self.Session()) as session:
             # Before searching, pre-filter the query to only include conversations that match the single inputs
@@ -458,165 +1073,236 @@ class Documents(VectorDatabase):
             if target_file_id is not None:
                 query = query.filter(Document.file_id == target_file_id)
 
+            if metadata_filters:
+                query = query.filter(*metadata_filters)
+
             if type(search_type) == str:
                 search_type = SearchType(search_type)
 
             if search_type == SearchType.Keyword:
-                # TODO: Do better key word search
+                full_text_query = self.get_full_text_query(search_query)
 
-                if type(search_query) == str:
-                    search_query = [search_query]
-
-                query = query.filter(
-                    or_(
-                        func.lower(Document.document_text).contains(func.lower(kword))
-                        for kword in search_query
+                query = (
+                    query.filter(
+                        Document.document_text_search_vector.op("@@")(full_text_query)
+                    )
+                    .order_by(
+                        self.get_full_text_rank(
+                            Document.document_text_search_vector, full_text_query
+                        ).desc()
                     )
+                    .limit(top_k)
                 )
 
-                return [
-                    DocumentModel.from_database_model(d) for d in query.all()[:top_k]
-                ]
+                return [DocumentModel.from_database_model(d) for d in query.all()]
 
             elif search_type == SearchType.Similarity:
-                query_embedding = get_embedding_by_name(
+                model_name = get_embedding_model_name(
+                    collection.embedding_name, collection.embedding_dimensions
+                )
+                dimensions = get_embedding_dimensions(model_name)
+
+                query_embedding = get_embedding_by_model(
                     text=search_query,
-                    embedding_name=embedding_name,
+                    model_name=model_name,
                     instruction="Represent the query for retrieval: ",
                 )
 
-                embedding_results = []
+                kinds = [DocumentEmbeddingKind.TEXT, DocumentEmbeddingKind.SUMMARY]
 
-                embedding_results.append(
-                    self._get_nearest_neighbors(
-                        session=session,
-                        collection_id=collection_id,
+                if search_questions:
+                    # Search each of the generated question embeddings
+                    kinds.extend(DocumentEmbeddingKind.questions())
+
+                # Each document can match on several kinds of embedding, so ask the index for
+                # enough candidates to still have top_k distinct documents after de-duplication
+                candidate_count = top_k * len(kinds)
+
+                if is_local_vector_index_enabled():
+                    document_ids = None
+                    if metadata_filters:
+                        # The local index doesn't have the metadata, so it's given the matching documents
+                        document_ids = [
+                            d.id
+                            for d in query.with_entities(Document.id).all()
+                        ]
+
+                        if not document_ids:
+                            return []
+
+                    nearest_documents = get_document_embedding_index(
+                        collection_id, model_name, dimensions
+                    ).search(
+                        query_embedding,
+                        top_k=candidate_count,
+                        kinds=kinds,
                         target_file_id=target_file_id,
-                        embedding_prop=Document.embedding,
-                        embedding=query_embedding,
-                        top_k=top_k,
+                        document_ids=document_ids,
+                    )[:top_k]
+                    distances = dict(nearest_documents)
+
+                    documents = query.filter(Document.id.in_(list(distances))).all()
+                    documents.sort(key=lambda d: distances[d.id])
+
+                    return [DocumentModel.from_database_model(d) for d in documents]
+
+                index_configuration = get_vector_index_configuration()
+                storage = collection.embedding_storage
+
+                # A file's (or a metadata filter's) rows can be a tiny part of an index that covers every
+                # collection, so even an iterative index scan can give up before finding top_k of them.
+                # Those searches only cover a few rows, so they scan them exactly instead.
+                exact = target_file_id is not None or bool(metadata_filters)
+
+                # Binary storage reads more candidates from the (less precise) index, to rescore
+                index_candidate_count = candidate_count
+                if storage == BINARY_STORAGE:
+                    index_candidate_count *= max(
+                        int(index_configuration["binary_rescore_multiplier"]), 1
                     )
-                )
 
-                embedding_results.append(
-                    self._get_nearest_neighbors(
-                        session=session,
-                        collection_id=collection_id,
-                        target_file_id=target_file_id,
-                        embedding_prop=Document.document_text_summary_embedding,
-                        embedding=query_embedding,
-                        top_k=top_k,
+                if is_indexable(dimensions, storage) and not exact:
+                    set_search_parameters(
+                        session,
+                        min_candidates=index_candidate_count,
+                        index_configuration=index_configuration,
                     )
-                )
 
-                if search_questions:
-                    # Search each of the generated question embeddings
-                    for question_number in range(1, 6):
-                        embedding_results.append(
-                            self._get_nearest_neighbors(
-                                session=session,
-                                collection_id=collection_id,
-                                target_file_id=target_file_id,
-                                embedding_prop=getattr(
-                                    Document, f"embedding_question_{question_number}"
-                                ),
-                                embedding=query_embedding,
-                                top_k=top_k,
-                            )
-                        )
+                nearest_neighbors = self._get_nearest_neighbors(
+                    collection_id=collection_id,
+                    target_file_id=target_file_id,
+                    document_filters=metadata_filters,
+                    kinds=kinds,
+                    embedding=query_embedding,
+                    model_name=model_name,
+                    dimensions=dimensions,
+                    top_k=candidate_count,
+                    storage=storage,
+                    rescore_candidates=index_candidate_count,
+                    exact=exact,
+                )
 
-                results = self._combine_document_embedding_queries(
-                    embedding_results=embedding_results,
-                    top_k=top_k,
+                # Join the de-duplicated neighbors back to the (vector-free) document columns,
+                # so the database returns the final top_k in a single round trip
+                query = (
+                    query.join(
+                        nearest_neighbors, Document.id == nearest_neighbors.c.id
+                    )
+                    .order_by(nearest_neighbors.c.distance)
+                    .limit(top_k)
                 )
 
                 # TODO: Add an arg to allow passing back the distance, as well.
-                return [doc["document"] for doc in results]
+                return [DocumentModel.from_database_model(d) for d in query.all()]
 
             else:
                 raise ValueError(f"Unknown search type: {search_type}")
 
-    def _combine_document_embedding_queries(
-        self, embedding_results: list, top_k
-    ) -> str:
-        def reorder_dict_by_distance(dict_list):
-            # Remove anything that doesn't have a distance (e.g. probably didn't have a summary)
-            filtered_list = [
-                item for item in dict_list if item.get("distance") is not None
-            ]
-
-            sorted_dict_list = sorted(filtered_list, key=lambda x: x["distance"])
-
-            return sorted_dict_list
+    def _get_nearest_neighbors(
+        self,
+        collection_id: int,
+        kinds: List[DocumentEmbeddingKind],
+        embedding,
+        model_name: str,
+        dimensions: int,
+        target_file_id: int = None,
+        document_filters: list = None,
+        top_k=5,
+        storage: str = VECTOR_STORAGE,
+        rescore_candidates: int = None,
+        exact: bool = False,
+    ):
+        """Builds a subquery of the documents nearest to the embedding, across the given kinds of embedding.
+
+        The nearest top_k embeddings are found with a single (ANN indexed) scan of document_embeddings,
+        and then de-duplicated with DISTINCT ON (document_id), keeping the smallest distance for each document.
+
+        With binary storage, the nearest rescore_candidates are found by hamming distance on the binary index
+        first, and the top_k of those by cosine distance on the half precision embeddings.
+
+        document_filters are filters on the documents table (e.g. metadata filters), applied before the limit.
+
+        Setting exact computes the distance to every matching embedding, rather than scanning the ANN index.
+
+        Returns:
+            A subquery with the columns: id, distance, l2_distance
+        """
+        if storage == VECTOR_STORAGE:
+            column = DocumentEmbedding.embedding
+            base_type = pgvector.sqlalchemy.Vector
+        else:
+            column = DocumentEmbedding.embedding_half
+            base_type = pgvector.sqlalchemy.HALFVEC
+
+        if is_indexable(dimensions, storage) and not exact:
+            vector_type = base_type(dimensions)
+            # Cast to the model's dimensions so the ordering matches the expression in the
+            # partial ANN index for this model (see vector_index_utilities.py)
+            embedding_prop = cast(column, vector_type)
+        else:
+            vector_type = base_type
+            embedding_prop = column
+
+        emb_val = cast(embedding, vector_type)
+        cosine_distance = embedding_prop.cosine_distance(emb_val)
+
+        def filter_embeddings(statement):
+            statement = statement.filter(
+                DocumentEmbedding.collection_id == collection_id,
+                DocumentEmbedding.embedding_model_name == model_name,
+                DocumentEmbedding.kind.in_([kind.value for kind in kinds]),
+            )
 
-        # Convert the results into a list of dictionaries
-        new_embedding_results = []
-        for embeddings in embedding_results:
-            for d in embeddings:
-                new_embedding_results.append(
-                    {
-                        "document": DocumentModel.from_database_model(d[0]),
-                        "distance": d[1],
-                        "l2_distance": d[2],
-                    }
+            if target_file_id or document_filters:
+                statement = statement.join(
+                    Document, Document.id == DocumentEmbedding.document_id
                 )
 
-        # Now we need to take these two dictionaries, sort them by distance, and then combine them while removing duplicates
-        def combine_and_remove_duplicates(list_of_dictionaries):
-            # Combine the two lists and reorder by distance
-            combined_list = reorder_dict_by_distance(list_of_dictionaries)
-
-            unique_documents = {}
-            unique_list = []
+                if target_file_id:
+                    statement = statement.filter(Document.file_id == target_file_id)
+                if document_filters:
+                    statement = statement.filter(*document_filters)
 
-            for item in combined_list:
-                document_id = item["document"].id
+            return statement
 
-                # Check if the document ID is not already in the dictionary
-                if document_id not in unique_documents:
-                    # Mark as seen
-                    unique_documents[document_id] = True
-                    # Add the dictionary to the unique list
-                    unique_list.append(item)
+        statement = filter_embeddings(
+            select(
+                DocumentEmbedding.document_id.label("id"),
+                cosine_distance.label("distance"),
+                embedding_prop.l2_distance(emb_val).label("l2_distance"),
+            )
+        )
 
-            return unique_list
+        if storage == BINARY_STORAGE and not exact:
+            # Same expression as the binary index
+            bit_type = pgvector.sqlalchemy.BIT(dimensions)
+            hamming_distance = cast(
+                func.binary_quantize(DocumentEmbedding.embedding_half), bit_type
+            ).op("<~>")(
+                cast(
+                    func.binary_quantize(
+                        cast(embedding, pgvector.sqlalchemy.HALFVEC(dimensions))
+                    ),
+                    bit_type,
+                )
+            )
 
-        combined_list = combine_and_remove_duplicates(new_embedding_results)
+            binary_candidates = (
+                filter_embeddings(select(DocumentEmbedding.id))
+                .order_by(hamming_distance)
+                .limit(rescore_candidates or top_k)
+            )
 
-        # Re-rank the list using a re-ranking function
-        # TODO: Add a re-ranking function
+            statement = statement.filter(DocumentEmbedding.id.in_(binary_candidates))
 
-        # Now the list contains a sorted and de-duped combination of the two lists, but it may be longer than the top_k
-        # Return the list limited to the original top_k
-        return combined_list[:top_k]
+        candidates = statement.order_by(cosine_distance).limit(top_k).subquery()
 
-    def _get_nearest_neighbors(
-        self,
-        session,
-        collection_id: int,
-        embedding_prop,
-        embedding,
-        target_file_id: int = None,
-        top_k=5,
-    ):
-        emb_val = cast(embedding, pgvector.sqlalchemy.Vector)
-        cosine_distance = func.cosine_distance(embedding_prop, emb_val)
-        l2_distance = func.l2_distance(embedding_prop, emb_val)
-
-        statement = (
-            select(Document)
-            .filter(
-                Document.collection_id == collection_id,
-                Document.file_id == target_file_id if target_file_id else True,
-            )
-            .order_by(cosine_distance)
-            .limit(top_k)
-            .add_columns(cosine_distance)
-            .add_columns(l2_distance)
+        return (
+            select(candidates)
+            .distinct(candidates.c.id)
+            .order_by(candidates.c.id, candidates.c.distance)
+            .subquery()
         )
-        result = session.execute(statement)
-
-        return result
 
 
 # Testing
@@ -40,3 +40,33 @@ class CodeFileModel:
             code_file_summary=db_code_file.code_file_summary,
             record_created=db_code_file.record_created,
         )
+
+
+class CodeFileListingModel:
+    """A code file without its content, for listings that only need the ids and names (and maybe the summaries)"""
+
+    def __init__(
+        self,
+        id,
+        code_file_name,
+        code_file_sha=None,
+        code_file_summary=None,
+        record_created=None,
+    ):
+        self.id = id
+        self.code_file_name = code_file_name
+        self.code_file_sha = code_file_sha
+        self.code_file_summary = code_file_summary
+        self.record_created = record_created
+
+    @classmethod
+    def from_database_model(cls, db_code_file):
+        if not db_code_file:
+            return None
+        return cls(
+            id=db_code_file.id,
+            code_file_name=db_code_file.code_file_name,
+            code_file_sha=getattr(db_code_file, "code_file_sha", None),
+            code_file_summary=getattr(db_code_file, "code_file_summary", None),
+            record_created=getattr(db_code_file, "record_created", None),
+        )
@@ -14,6 +14,8 @@ class ConversationMessageModel:
         additional_metadata=None,
         exception=None,
         is_deleted=False,
+        message_token_count=None,
+        message_token_encoding=None,
     ):
         self.id = id
         self.record_created = record_created
@@ -24,6 +26,8 @@ class ConversationMessageModel:
         self.exception = exception
         self.is_deleted = is_deleted
         self.conversation_role_type = conversation_role_type
+        self.message_token_count = message_token_count
+        self.message_token_encoding = message_token_encoding
 
     def to_database_model(self):
         return ConversationMessage(
@@ -36,6 +40,8 @@ class ConversationMessageModel:
             additional_metadata=self.additional_metadata,
             exception=self.exception,
             is_deleted=self.is_deleted,
+            message_token_count=self.message_token_count,
+            message_token_encoding=self.message_token_encoding,
         )
 
     @classmethod
@@ -55,4 +61,8 @@ class ConversationMessageModel:
             additional_metadata=db_conversation.additional_metadata,
             exception=db_conversation.exception,
             is_deleted=db_conversation.is_deleted,
+            message_token_count=getattr(db_conversation, "message_token_count", None),
+            message_token_encoding=getattr(
+                db_conversation, "message_token_encoding", None
+            ),
         )
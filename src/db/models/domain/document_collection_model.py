@@ -1,11 +1,21 @@
 from src.db.database.tables import DocumentCollection
 
 class DocumentCollectionModel:
-    def __init__(self, id, collection_name, embedding_name, record_created=None):
+    def __init__(
+        self,
+        id,
+        collection_name,
+        embedding_name,
+        record_created=None,
+        embedding_dimensions=None,
+        embedding_storage="vector",
+    ):
         self.id = id
         self.collection_name = collection_name
         self.record_created = record_created
         self.embedding_name = embedding_name
+        self.embedding_dimensions = embedding_dimensions
+        self.embedding_storage = embedding_storage
 
     def to_database_model(self):
         return DocumentCollection(
@@ -13,6 +23,8 @@ class DocumentCollectionModel:
             collection_name=self.collection_name,
             record_created=self.record_created,
             embedding_name=self.embedding_name,
+            embedding_dimensions=self.embedding_dimensions,
+            embedding_storage=self.embedding_storage,
         )
 
     @classmethod
@@ -25,4 +37,6 @@ class DocumentCollectionModel:
             collection_name=db_document_collection.collection_name,
             record_created=db_document_collection.record_created,
             embedding_name=db_document_collection.embedding_name,
+            embedding_dimensions=db_document_collection.embedding_dimensions,
+            embedding_storage=db_document_collection.embedding_storage,
         )
@@ -0,0 +1,20 @@
+from enum import Enum
+
+
+# The kinds of embeddings stored for a document chunk in the document_embeddings table
+class DocumentEmbeddingKind(Enum):
+    TEXT = "text"
+    SUMMARY = "summary"
+    QUESTION_1 = "question_1"
+    QUESTION_2 = "question_2"
+    QUESTION_3 = "question_3"
+    QUESTION_4 = "question_4"
+    QUESTION_5 = "question_5"
+
+    @classmethod
+    def question(cls, question_number: int) -> "DocumentEmbeddingKind":
+        return cls(f"question_{question_number}")
+
+    @classmethod
+    def questions(cls) -> list:
+        return [cls.question(question_number) for question_number in range(1, 6)]
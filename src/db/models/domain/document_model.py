@@ -1,8 +1,21 @@
-import json
-
 from src.db.database.tables import Document
 
 
+def _remove_nul_characters(value):
+    """Removes the NUL characters from the strings in some metadata, since JSONB can't store them"""
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {
+            _remove_nul_characters(key): _remove_nul_characters(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_remove_nul_characters(item) for item in value]
+
+    return value
+
+
 class DocumentModel:
     def __init__(
         self,
@@ -22,6 +35,8 @@ class DocumentModel:
         question_3:str = None,
         question_4:str = None,
         question_5:str = None,
+        chunk_index: int = None,
+        content_hash: str = None,
     ):
         self.id = id
         self.collection_id = collection_id
@@ -39,6 +54,8 @@ class DocumentModel:
         self.question_3 = question_3
         self.question_4 = question_4
         self.question_5 = question_5
+        self.chunk_index = chunk_index
+        self.content_hash = content_hash
 
     def to_database_model(self):
         return Document(
@@ -46,7 +63,7 @@ class DocumentModel:
             collection_id=self.collection_id,
             file_id=self.file_id,
             user_id=self.user_id,
-            additional_metadata=json.dumps(self.additional_metadata),
+            additional_metadata=_remove_nul_characters(self.additional_metadata),
             document_text=self.document_text,
             document_name=self.document_name,
             document_text_summary=self.document_text_summary,
@@ -58,6 +75,8 @@ class DocumentModel:
             question_3=self.question_3,
             question_4=self.question_4,
             question_5=self.question_5,
+            chunk_index=self.chunk_index,
+            content_hash=self.content_hash,
         )
 
     @classmethod
@@ -70,7 +89,7 @@ class DocumentModel:
             collection_id=db_document.collection_id,
             file_id=db_document.file_id,
             user_id=db_document.user_id,
-            additional_metadata=json.loads(db_document.additional_metadata),
+            additional_metadata=db_document.additional_metadata,
             document_text=db_document.document_text,
             document_name=db_document.document_name,
             document_text_summary=db_document.document_text_summary,
@@ -82,4 +101,7 @@ class DocumentModel:
             question_3=db_document.question_3,
             question_4=db_document.question_4,
             question_5=db_document.question_5,
+            chunk_index=getattr(db_document, "chunk_index", None),
+            content_hash=getattr(db_document, "content_hash", None),
         )
+
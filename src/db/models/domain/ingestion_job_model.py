@@ -0,0 +1,83 @@
+from enum import Enum
+
+from src.db.database.tables import IngestionJob
+
+
+# The stages a file goes through in the ingestion pipeline (see src/services/documents/document_ingestion_tasks.py)
+class IngestionJobStatus(Enum):
+    QUEUED = "queued"
+    LOADING = "loading"
+    SPLITTING = "splitting"
+    PROCESSING = "processing"
+    SUMMARIZING = "summarizing"
+    COMPLETE = "complete"
+    FAILED = "failed"
+
+
+class IngestionJobModel:
+    def __init__(
+        self,
+        file_id,
+        file_hash,
+        status: IngestionJobStatus,
+        total_chunks=None,
+        stored_chunks=0,
+        error=None,
+        id=None,
+        record_created=None,
+        last_updated=None,
+    ):
+        self.id = id
+        self.file_id = file_id
+        self.file_hash = file_hash
+        self.status = status
+        self.total_chunks = total_chunks
+        self.stored_chunks = stored_chunks
+        self.error = error
+        self.record_created = record_created
+        self.last_updated = last_updated
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (IngestionJobStatus.COMPLETE, IngestionJobStatus.FAILED)
+
+    @property
+    def progress(self) -> float:
+        """The fraction of the file's chunks that have been stored, from 0 to 1"""
+        if self.status == IngestionJobStatus.COMPLETE:
+            return 1.0
+
+        if not self.total_chunks:
+            return 0.0
+
+        return min(self.stored_chunks / self.total_chunks, 1.0)
+
+    def to_database_model(self):
+        return IngestionJob(
+            id=self.id,
+            file_id=self.file_id,
+            file_hash=self.file_hash,
+            status=self.status.value,
+            total_chunks=self.total_chunks,
+            stored_chunks=self.stored_chunks,
+            error=self.error,
+            record_created=self.record_created,
+            last_updated=self.last_updated,
+        )
+
+    @classmethod
+    def from_database_model(cls, db_ingestion_job):
+        if not db_ingestion_job:
+            return None
+
+        return cls(
+            id=db_ingestion_job.id,
+            file_id=db_ingestion_job.file_id,
+            file_hash=db_ingestion_job.file_hash,
+            status=IngestionJobStatus(db_ingestion_job.status),
+            total_chunks=db_ingestion_job.total_chunks,
+            stored_chunks=db_ingestion_job.stored_chunks,
+            error=db_ingestion_job.error,
+            record_created=db_ingestion_job.record_created,
+            last_updated=db_ingestion_job.last_updated,
+        )
@@ -0,0 +1,152 @@
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import Integer, String, and_, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+
+from src.db.database.tables import EmbeddingCacheEntry
+from src.db.models.vector_database import VectorDatabase
+
+
+class EmbeddingCacheStore(VectorDatabase):
+    """Database tier of the embedding cache, see src/ai/utilities/embedding_cache.py"""
+
+    def get_embeddings(
+        self, embedding_model_name: str, instruction: str, text_hashes: List[str]
+    ) -> Dict[str, List[float]]:
+        """Gets the cached embeddings for the given text hashes.
+
+        Returns:
+            Dict[str, List[float]]: Map of text hash -> embedding, for the hashes that were found.
+        """
+        with self.session_context(self.Session()) as session:
+            entries = (
+                session.query(
+                    EmbeddingCacheEntry.id,
+                    EmbeddingCacheEntry.text_hash,
+                    EmbeddingCacheEntry.embedding,
+                )
+                .filter(
+                    EmbeddingCacheEntry.embedding_model_name == embedding_model_name,
+                    EmbeddingCacheEntry.instruction == instruction,
+                    EmbeddingCacheEntry.text_hash.in_(text_hashes),
+                )
+                .all()
+            )
+
+            if entries:
+                session.query(EmbeddingCacheEntry).filter(
+                    EmbeddingCacheEntry.id.in_([e.id for e in entries])
+                ).update(
+                    {EmbeddingCacheEntry.last_accessed: datetime.now()},
+                    synchronize_session=False,
+                )
+                session.commit()
+
+            return {e.text_hash: [float(v) for v in e.embedding] for e in entries}
+
+    def add_embeddings(
+        self,
+        embedding_model_name: str,
+        instruction: str,
+        hashed_embeddings: Dict[str, List[float]],
+    ) -> None:
+        """Adds embeddings to the cache in a single statement.
+
+        Args:
+            hashed_embeddings (Dict[str, List[float]]): Map of text hash -> embedding.
+        """
+        now = datetime.now()
+
+        with self.session_context(self.Session()) as session:
+            # Another process may have cached the same text in the meantime
+            session.execute(
+                insert(EmbeddingCacheEntry)
+                .values(
+                    [
+                        {
+                            "embedding_model_name": embedding_model_name,
+                            "instruction": instruction,
+                            "text_hash": text_hash,
+                            "embedding": embedding,
+                            "record_created": now,
+                            "last_accessed": now,
+                        }
+                        for text_hash, embedding in hashed_embeddings.items()
+                    ]
+                )
+                .on_conflict_do_nothing()
+            )
+
+    def update_reference_counts(
+        self,
+        embedding_model_name: str,
+        instruction: str,
+        text_hash_counts: Dict[str, int],
+    ) -> None:
+        """Adds to (or, with negative counts, removes from) the reference counts of entries.
+
+        Args:
+            text_hash_counts (Dict[str, int]): Map of text hash -> change in the number of references.
+        """
+        if not text_hash_counts:
+            return
+
+        # All of the changes go in one UPDATE ... FROM (VALUES ...), rather than a statement per hash
+        reference_changes = values(
+            column("text_hash", String),
+            column("delta", Integer),
+            name="reference_changes",
+        ).data(list(text_hash_counts.items()))
+
+        with self.session_context(self.Session()) as session:
+            session.execute(
+                update(EmbeddingCacheEntry)
+                .where(
+                    and_(
+                        EmbeddingCacheEntry.embedding_model_name
+                        == embedding_model_name,
+                        EmbeddingCacheEntry.instruction == instruction,
+                        EmbeddingCacheEntry.text_hash
+                        == reference_changes.c.text_hash,
+                    )
+                )
+                .values(
+                    reference_count=func.greatest(
+                        EmbeddingCacheEntry.reference_count
+                        + reference_changes.c.delta,
+                        0,
+                    )
+                )
+            )
+
+    def get_entry_count(self) -> int:
+        with self.session_context(self.Session()) as session:
+            return session.query(func.count(EmbeddingCacheEntry.id)).scalar()
+
+    def evict_least_recently_used(self, max_entries: int) -> int:
+        """Deletes the least recently used entries so that at most max_entries remain.
+
+        Entries that are referenced by stored documents are kept, even if that leaves more than max_entries.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        with self.session_context(self.Session()) as session:
+            entry_count = session.query(func.count(EmbeddingCacheEntry.id)).scalar()
+
+            if entry_count <= max_entries:
+                return 0
+
+            oldest_ids = (
+                select(EmbeddingCacheEntry.id)
+                .where(EmbeddingCacheEntry.reference_count == 0)
+                .order_by(EmbeddingCacheEntry.last_accessed)
+                .limit(entry_count - max_entries)
+            )
+
+            return (
+                session.query(EmbeddingCacheEntry)
+                .filter(EmbeddingCacheEntry.id.in_(oldest_ids))
+                .delete(synchronize_session=False)
+            )
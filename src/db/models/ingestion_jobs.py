@@ -0,0 +1,140 @@
+from typing import List
+
+from sqlalchemy import func
+
+from src.db.database.tables import Document, File, IngestionJob
+from src.db.models.vector_database import VectorDatabase
+from src.db.models.domain.ingestion_job_model import (
+    IngestionJobModel,
+    IngestionJobStatus,
+)
+
+
+class IngestionJobs(VectorDatabase):
+    """Progress tracking for the background ingestion pipeline, one job per file"""
+
+    def get_or_create_job(self, file_id: int, file_hash: str) -> IngestionJobModel:
+        """Gets the job for a file, creating it if needed.
+
+        A job that failed, or that was started for different file contents, is reset so it runs again.
+        """
+        with self.session_context(self.Session()) as session:
+            job = (
+                session.query(IngestionJob)
+                .filter(IngestionJob.file_id == file_id)
+                .with_for_update()
+                .first()
+            )
+
+            if job is None:
+                job = IngestionJob(
+                    file_id=file_id,
+                    file_hash=file_hash,
+                    status=IngestionJobStatus.QUEUED.value,
+                    stored_chunks=0,
+                )
+                session.add(job)
+            elif (
+                job.file_hash != file_hash
+                or job.status == IngestionJobStatus.FAILED.value
+            ):
+                job.file_hash = file_hash
+                job.status = IngestionJobStatus.QUEUED.value
+                job.total_chunks = None
+                job.stored_chunks = 0
+                job.error = None
+
+            session.commit()
+
+            return IngestionJobModel.from_database_model(job)
+
+    def get_job(self, file_id: int) -> IngestionJobModel:
+        with self.session_context(self.Session()) as session:
+            job = (
+                session.query(IngestionJob)
+                .filter(IngestionJob.file_id == file_id)
+                .first()
+            )
+
+            return IngestionJobModel.from_database_model(job)
+
+    def get_jobs_for_collection(
+        self, collection_id: int, include_finished: bool = False
+    ) -> List[IngestionJobModel]:
+        with self.session_context(self.Session()) as session:
+            query = (
+                session.query(IngestionJob)
+                .join(File, File.id == IngestionJob.file_id)
+                .filter(File.collection_id == collection_id)
+            )
+
+            if not include_finished:
+                query = query.filter(
+                    IngestionJob.status.notin_(
+                        [
+                            IngestionJobStatus.COMPLETE.value,
+                            IngestionJobStatus.FAILED.value,
+                        ]
+                    )
+                )
+
+            return [
+                IngestionJobModel.from_database_model(job)
+                for job in query.order_by(IngestionJob.id)
+            ]
+
+    def set_status(
+        self, file_id: int, status: IngestionJobStatus, error: str = None
+    ) -> None:
+        with self.session_context(self.Session()) as session:
+            session.query(IngestionJob).filter(IngestionJob.file_id == file_id).update(
+                {IngestionJob.status: status.value, IngestionJob.error: error}
+            )
+
+    def set_total_chunks(self, file_id: int, total_chunks: int) -> None:
+        with self.session_context(self.Session()) as session:
+            session.query(IngestionJob).filter(IngestionJob.file_id == file_id).update(
+                {
+                    IngestionJob.total_chunks: total_chunks,
+                    IngestionJob.status: IngestionJobStatus.PROCESSING.value,
+                }
+            )
+
+    def update_stored_chunks(
+        self, file_id: int, finished_status: IngestionJobStatus
+    ) -> bool:
+        """Updates the stored chunk count from the documents table, and moves the job to finished_status once every chunk is stored.
+
+        The count is taken from the stored chunks rather than incremented, so redelivered batches don't count twice.
+
+        Returns:
+            bool: True if this call moved the job out of processing. Only one caller will see True.
+        """
+        with self.session_context(self.Session()) as session:
+            stored_chunks = (
+                session.query(func.count(Document.id))
+                .filter(Document.file_id == file_id, Document.chunk_index.isnot(None))
+                .scalar()
+            )
+
+            session.query(IngestionJob).filter(IngestionJob.file_id == file_id).update(
+                {IngestionJob.stored_chunks: stored_chunks}
+            )
+
+            # Only one of the concurrent store tasks can make this transition
+            finished = (
+                session.query(IngestionJob)
+                .filter(
+                    IngestionJob.file_id == file_id,
+                    IngestionJob.status == IngestionJobStatus.PROCESSING.value,
+                    IngestionJob.total_chunks <= stored_chunks,
+                )
+                .update(
+                    {IngestionJob.status: finished_status.value},
+                    synchronize_session=False,
+                )
+            )
+
+            session.commit()
+
+            return finished == 1
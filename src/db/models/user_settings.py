@@ -1,23 +1,90 @@
+import threading
+import time
+
 from src.db.database.tables import UserSetting
 from src.db.models.domain.user_settings_model import UserSettingModel
 from src.db.models.vector_database import VectorDatabase
 
+# A single request reads dozens of settings (tool enablement, model configurations, etc.),
+# so all of a user's settings are loaded with one query and served from memory.
+# Writes made through this class invalidate the user's cached settings, preload_user_settings
+# reloads them at the start of a request, and entries expire after the TTL to pick up
+# changes made by other processes.
+USER_SETTINGS_CACHE_TTL_SECONDS = 60
+
+# user_id -> (time loaded, {setting_name: UserSettingModel})
+_user_settings_cache = {}
+# user_id -> number of times the user's settings have been invalidated
+_user_settings_generations = {}
+_user_settings_cache_lock = threading.Lock()
+
 
 class UserSettings(VectorDatabase):
 
-    def get_user_settings(self, user_id, available_for_llm=False):
+    def preload_user_settings(self, user_id):
+        """Reloads all of the user's settings into the cache with a single query"""
+        return self._load_user_settings(user_id)
+
+    def invalidate_user_settings(self, user_id):
+        with _user_settings_cache_lock:
+            _user_settings_cache.pop(user_id, None)
+            _user_settings_generations[user_id] = (
+                _user_settings_generations.get(user_id, 0) + 1
+            )
+
+    @staticmethod
+    def clear_cache():
+        with _user_settings_cache_lock:
+            _user_settings_cache.clear()
+
+    def _get_cached_user_settings(self, user_id) -> dict:
+        with _user_settings_cache_lock:
+            cached = _user_settings_cache.get(user_id, None)
+
+        if (
+            cached is not None
+            and time.monotonic() - cached[0] < USER_SETTINGS_CACHE_TTL_SECONDS
+        ):
+            return cached[1]
+
+        return self._load_user_settings(user_id)
+
+    def _load_user_settings(self, user_id) -> dict:
+        with _user_settings_cache_lock:
+            generation = _user_settings_generations.get(user_id, 0)
+
         with self.session_context(self.Session()) as session:
             db_models = (
-                session.query(UserSetting)
-                .filter(
-                    UserSetting.user_id == user_id,
-                    UserSetting.available_for_llm == available_for_llm,
-                )
-                .all()
+                session.query(UserSetting).filter(UserSetting.user_id == user_id).all()
             )
-            return [
-                UserSettingModel.from_database_model(db_model) for db_model in db_models
-            ]
+            settings = {
+                db_model.setting_name: UserSettingModel.from_database_model(db_model)
+                for db_model in db_models
+            }
+
+        with _user_settings_cache_lock:
+            # Don't cache the settings if they were changed while we were loading them
+            if _user_settings_generations.get(user_id, 0) == generation:
+                _user_settings_cache[user_id] = (time.monotonic(), settings)
+
+        return settings
+
+    @staticmethod
+    def _copy_setting(user_setting: UserSettingModel) -> UserSettingModel:
+        # Callers (and the casting below) modify the returned models, so never hand out the cached ones
+        return UserSettingModel(
+            user_setting.user_id,
+            user_setting.setting_name,
+            user_setting.setting_value,
+            user_setting.available_for_llm,
+        )
+
+    def get_user_settings(self, user_id, available_for_llm=False):
+        return [
+            self._copy_setting(user_setting)
+            for user_setting in self._get_cached_user_settings(user_id).values()
+            if user_setting.available_for_llm == available_for_llm
+        ]
 
     def cast_to_type(self, value, to_type):
         if to_type == bool:
@@ -37,39 +104,33 @@ class UserSettings(VectorDatabase):
         default_value=None,
         default_available_for_llm=False,
     ):
-        with self.session_context(self.Session()) as session:
-            db_model = (
-                session.query(UserSetting)
-                .filter(
-                    UserSetting.user_id == user_id,
-                    UserSetting.setting_name == setting_name,
-                )
-                .first()
-            )
+        cached_setting = self._get_cached_user_settings(user_id).get(
+            setting_name, None
+        )
 
-            if db_model:
-                user_setting = UserSettingModel.from_database_model(db_model)
+        if cached_setting:
+            user_setting = self._copy_setting(cached_setting)
 
-            elif default_value is not None:
-                user_setting = UserSettingModel(
-                    user_id, setting_name, default_value, default_available_for_llm
-                )
-            else:
-                return None
-
-            # Cast it to the target type if it is not None
-            # I hate python's type system.
-            # This would be so much better in a statically typed language.
-            if target_type is not None:
-                user_setting.setting_value = self.cast_to_type(
-                    value=user_setting.setting_value, to_type=type(target_type)
-                )
-            elif default_value is not None:
-                user_setting.setting_value = self.cast_to_type(
-                    value=user_setting.setting_value, to_type=type(default_value)
-                )
+        elif default_value is not None:
+            user_setting = UserSettingModel(
+                user_id, setting_name, default_value, default_available_for_llm
+            )
+        else:
+            return None
 
-            return user_setting
+        # Cast it to the target type if it is not None
+        # I hate python's type system.
+        # This would be so much better in a statically typed language.
+        if target_type is not None:
+            user_setting.setting_value = self.cast_to_type(
+                value=user_setting.setting_value, to_type=type(target_type)
+            )
+        elif default_value is not None:
+            user_setting.setting_value = self.cast_to_type(
+                value=user_setting.setting_value, to_type=type(default_value)
+            )
+
+        return user_setting
 
     def add_update_user_setting(
         self, user_id, setting_name, setting_value, available_for_llm=False
@@ -98,8 +159,12 @@ class UserSettings(VectorDatabase):
 
             session.commit()
 
+        self.invalidate_user_settings(user_id)
+
     def delete_user_setting(self, user_id, setting_name):
         with self.session_context(self.Session()) as session:
             session.query(UserSetting).filter(
                 UserSetting.user_id == user_id, UserSetting.setting_name == setting_name
             ).delete()
+
+        self.invalidate_user_settings(user_id)
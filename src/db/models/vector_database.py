@@ -2,14 +2,19 @@ import logging
 
 
 import psycopg2
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, selectinload
+from sqlalchemy import func, literal_column, text
+from sqlalchemy.orm import selectinload
 
 from contextlib import contextmanager
 
 from enum import Enum
 
 from src.db.database.connection_utilities import get_connection_string
+from src.db.database.engine_registry import (
+    get_engine,
+    get_session_factory,
+    get_pool_metrics,
+)
 from src.db.database.tables import ConversationRoleType
 
 
@@ -18,16 +23,17 @@ class SearchType(Enum):
     Similarity = "Similarity"
 
 
+# The text search configuration used by the generated search vector columns (see tables.py)
+FULL_TEXT_SEARCH_CONFIGURATION = "english"
+
+
 class VectorDatabase:
     def __init__(self):
         try:
             self.connection_string = get_connection_string()
 
-            engine = create_engine(
-                self.connection_string, pool_size=100, max_overflow=20
-            )
-
-            self.Session = sessionmaker(bind=engine)
+            # All of the helpers share one engine (and connection pool) per database
+            self.Session = get_session_factory(self.connection_string)
 
         except (Exception, psycopg2.Error) as error:
             raise ConnectionError("Error while connecting to PostgreSQL") from error
@@ -36,13 +42,17 @@ class VectorDatabase:
     @staticmethod
     def database_exists():
         try:
-            connection_string = VectorDatabase.get_connection_string()
-            engine = create_engine(connection_string)
-            engine.connect()
+            with get_engine(get_connection_string()).connect() as connection:
+                connection.execute(text("SELECT 1"))
             return True
         except Exception:
             return False
 
+    @staticmethod
+    def get_pool_metrics():
+        """Gets the checked-out, overflow and checkout wait time metrics for the shared connection pools"""
+        return get_pool_metrics()
+
     @contextmanager
     def session_context(self, session):
         try:
@@ -54,6 +64,33 @@ class VectorDatabase:
         finally:
             session.close()
 
+    def get_full_text_query(self, keywords):
+        """Builds a tsquery matching any of the keywords.
+
+        Each keyword is parsed with websearch_to_tsquery, so it can contain multiple words,
+        "quoted phrases", "or" and -exclusions.
+        """
+        if type(keywords) == str:
+            keywords = [keywords]
+
+        search_config = literal_column(f"'{FULL_TEXT_SEARCH_CONFIGURATION}'::regconfig")
+
+        full_text_query = None
+        for keyword in keywords:
+            keyword_query = func.websearch_to_tsquery(search_config, keyword)
+
+            if full_text_query is None:
+                full_text_query = keyword_query
+            else:
+                full_text_query = full_text_query.op("||")(keyword_query)
+
+        return full_text_query
+
+    def get_full_text_rank(self, search_vector, full_text_query):
+        # Normalization 1 divides the rank by 1 + log(document length), so that long
+        # chunks don't win just by repeating a term (similar to BM25's length normalization)
+        return func.ts_rank_cd(search_vector, full_text_query, 1)
+
     def eager_load(self, query, eager_load: list):
         for eager_load_item in eager_load:
             try:
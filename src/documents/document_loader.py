@@ -1,12 +1,13 @@
 import logging
 import os
+import queue
 import sys
+import threading
 from subprocess import Popen
-from typing import List
+from typing import Dict, Generator, Iterable, Iterator, List, Tuple, Union
 import asyncio
 
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
 
@@ -23,13 +24,24 @@ from langchain_community.document_loaders import (
     UnstructuredExcelLoader,
 )
 
-from src.utilities.token_helper import num_tokens_from_string
+from src.documents.document_parsing_pool import (
+    DEFAULT_PARSING_TIMEOUT_SECONDS,
+    DocumentParsingPool,
+)
+from src.utilities.configuration_utilities import get_app_configuration
+from src.utilities.token_text_splitter import TokenAwareTextSplitter
 
 # TODO: Add loaders for PPT, and other document types
 
 # Default LibreOffice installation location
 LIBRE_OFFICE_DEFAULT = "/Program Files/LibreOffice/program/soffice.exe"
 
+# Default number of chunks that can be parsed ahead of the consumer when streaming documents
+DEFAULT_MAX_IN_FLIGHT_CHUNKS = 256
+
+# How often a blocked producer checks whether the consumer has gone away
+_PRODUCER_POLL_SECONDS = 0.5
+
 
 class DocumentLoader:
     DOCUMENT_TYPES = {
@@ -71,9 +83,37 @@ class DocumentLoader:
         ".ods": UnstructuredExcelLoader,
     }
 
-    def __init__(self):
+    def __init__(
+        self, parsing_workers: int = None, parsing_timeout_seconds: float = None
+    ):
+        """
+        Args:
+            parsing_workers: The number of worker processes to parse files with, 0 parses them in this process.
+                Defaults to the document_ingestion configuration, or the number of CPUs.
+            parsing_timeout_seconds: How long a worker process can spend parsing a single file.
+        """
         self.converted_file_maps = {}
 
+        configuration = {}
+        if parsing_workers is None or parsing_timeout_seconds is None:
+            configuration = get_app_configuration()["jarvis_ai"].get(
+                "document_ingestion", {}
+            )
+
+        if parsing_workers is None:
+            parsing_workers = configuration.get("parsing_workers")
+            if parsing_workers is None:
+                parsing_workers = os.cpu_count() or 1
+
+        self.parsing_workers = parsing_workers
+        self.parsing_timeout_seconds = (
+            parsing_timeout_seconds
+            if parsing_timeout_seconds is not None
+            else configuration.get(
+                "parsing_timeout_seconds", DEFAULT_PARSING_TIMEOUT_SECONDS
+            )
+        )
+
     @staticmethod
     def get_libre_office_path() -> str:
         if "LIBRE_OFFICE_PATH" in os.environ:
@@ -103,50 +143,95 @@ class DocumentLoader:
     async def load_single_document(self, file_path: str) -> List[Document]:
         file_extension = os.path.splitext(file_path)[1]
 
+        if self.DOCUMENT_TYPES.get(file_extension.lower()):
+            return list(self.lazy_load_single_document(file_path))
+        else:
+            logging.error(f"Unsupported file type: '{file_extension}', {file_path}")
+
+    def lazy_load_single_document(self, file_path: str) -> Iterator[Document]:
+        """Yields the documents (e.g. pages) in a file as they are parsed, instead of parsing the whole file first"""
+        file_extension = os.path.splitext(file_path)[1]
+
         loader_class = self.DOCUMENT_TYPES.get(file_extension.lower())
 
-        if loader_class:
-            # This is where I would look to handle special cases for different file types
-            documents = None
-            if loader_class is UnstructuredExcelLoader:
-                # Speacial case for excel files
-                return []
-            else:
-                # No special case
-                loader = loader_class(file_path)
-                
-            try:
-                if not documents:
-                    # If we haven't loaded the documents yet, load them
-                    documents = loader.load()
-                    
-                for doc in documents:
-                    doc.metadata["filename"] = os.path.basename(
-                        self.converted_file_maps.get(file_path, file_path)
-                    )
-                    doc.metadata.setdefault("page", "N/A")
-                    doc.metadata.setdefault(
-                        "classification",
-                        self.DOCUMENT_CLASSIFICATIONS.get(
-                            file_extension.lower(), "Document"
-                        ),
-                    )
-                return documents
-            except Exception as e:
-                err = f"Could not load {file_path}, {e}"
-                logging.debug(err)
-                raise ValueError(err)
-        else:
+        if not loader_class:
             logging.error(f"Unsupported file type: '{file_extension}', {file_path}")
+            return
+
+        # This is where I would look to handle special cases for different file types
+        if loader_class is UnstructuredExcelLoader:
+            # Speacial case for excel files
+            return
+
+        # No special case
+        loader = loader_class(file_path)
+
+        try:
+            for doc in self._lazy_load(loader):
+                doc.metadata["filename"] = os.path.basename(
+                    self.converted_file_maps.get(file_path, file_path)
+                )
+                doc.metadata.setdefault("page", "N/A")
+                doc.metadata.setdefault(
+                    "classification",
+                    self.DOCUMENT_CLASSIFICATIONS.get(
+                        file_extension.lower(), "Document"
+                    ),
+                )
+                yield doc
+        except Exception as e:
+            err = f"Could not load {file_path}, {e}"
+            logging.debug(err)
+            raise ValueError(err)
 
-    async def load_documents(self, source_dir: str) -> List[Document]:
-        all_files = os.listdir(source_dir)
-        paths = [
+    @staticmethod
+    def _lazy_load(loader) -> Iterator[Document]:
+        # Not every loader implements lazy_load, those that don't can only load the whole file at once
+        try:
+            documents = loader.lazy_load()
+            first_document = next(documents, None)
+        except NotImplementedError:
+            yield from loader.load()
+            return
+
+        if first_document is not None:
+            yield first_document
+            yield from documents
+
+    def get_document_paths(self, source_dir: str) -> List[str]:
+        return [
             os.path.join(source_dir, file_path)
-            for file_path in all_files
+            for file_path in sorted(os.listdir(source_dir))
             if os.path.splitext(file_path)[1] in self.DOCUMENT_TYPES
         ]
 
+    def parse_files(
+        self, file_paths: List[str]
+    ) -> Iterator[Tuple[str, Union[List[Document], Exception]]]:
+        """Parses the files in worker processes, yielding (file path, documents or the exception) as each one finishes"""
+        return DocumentParsingPool(
+            max_workers=self.parsing_workers,
+            timeout_seconds=self.parsing_timeout_seconds,
+        ).parse_files(file_paths, self.converted_file_maps)
+
+    async def load_documents(self, source_dir: str) -> List[Document]:
+        paths = self.get_document_paths(source_dir)
+
+        if self.parsing_workers:
+            file_documents = {}
+            for file_path, documents in self.parse_files(paths):
+                if isinstance(documents, Exception):
+                    logging.error(str(documents))
+                else:
+                    file_documents[file_path] = documents
+
+            # Keep the files in the same order as loading them here
+            return [
+                doc
+                for file_path in paths
+                for doc in file_documents.get(file_path, [])
+            ]
+
         tasks = [self.load_single_document(file_path) for file_path in paths]
         documents = await asyncio.gather(*tasks, return_exceptions=True)
         documents = [
@@ -171,6 +256,23 @@ class DocumentLoader:
 
         return self.converted_file_maps
 
+    @staticmethod
+    def get_text_splitter(chunk_size: int, chunk_overlap: int):
+        return TokenAwareTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+
+    def split_documents(
+        self, documents: List[Document], chunk_size: int, chunk_overlap: int
+    ) -> List[Document]:
+        text_splitter = self.get_text_splitter(chunk_size, chunk_overlap)
+        texts = text_splitter.split_documents(documents)
+        logging.debug(
+            f"Split into {len(texts)} chunks of text (chunk_size: {chunk_size}, chunk_overlap: {chunk_overlap})"
+        )
+
+        return texts
+
     async def load_and_split_documents(
         self,
         document_directory: str,
@@ -189,15 +291,7 @@ class DocumentLoader:
         documents = await self.load_documents(document_directory)
 
         if documents and split_documents and not is_code:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                length_function=num_tokens_from_string,
-            )
-            texts = text_splitter.split_documents(documents)
-            logging.debug(
-                f"Split into {len(texts)} chunks of text (chunk_size: {chunk_size}, chunk_overlap: {chunk_overlap})"
-            )
+            texts = self.split_documents(documents, chunk_size, chunk_overlap)
         else:
             texts = documents
 
@@ -210,6 +304,184 @@ class DocumentLoader:
 
         return texts
 
+    def stream_split_documents(
+        self,
+        document_directory: str,
+        split_documents: bool,
+        is_code: bool,
+        chunk_size: int,
+        chunk_overlap: int,
+        max_in_flight_chunks: int = DEFAULT_MAX_IN_FLIGHT_CHUNKS,
+        file_split_settings: Dict[str, dict] = None,
+    ) -> Generator[Tuple[str, int, Document], None, None]:
+        """Streaming version of load_and_split_documents.
+
+        file_split_settings overrides is_code, chunk_size and/or chunk_overlap for some of the files, by file name.
+
+        Yields (file name, chunk index, chunk) for each chunk, file by file, as the pages are parsed.
+        Parsing runs on a background thread (and the parsing worker processes), at most max_in_flight_chunks ahead of
+        the consumer, so the consumer can embed and store chunks while the rest of the files are parsed without holding them all in memory.
+        """
+        if not os.path.isdir(document_directory):
+            raise ValueError(
+                f"document_directory must be a directory: {document_directory}"
+            )
+
+        self.converted_file_maps = self.convert_documents(document_directory)
+
+        chunks = queue.Queue(maxsize=max(1, max_in_flight_chunks))
+        stopped = threading.Event()
+        # Marks the end of the stream
+        end_of_stream = object()
+
+        def put(item) -> bool:
+            # Blocks while the window is full, unless the consumer stops reading
+            while not stopped.is_set():
+                try:
+                    chunks.put(item, timeout=_PRODUCER_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            file_paths = self.get_document_paths(document_directory)
+
+            if self.parsing_workers:
+                # Parsed in worker processes a whole file at a time, in the order they finish
+                file_pages = self.parse_files(file_paths)
+            else:
+                # Parsed here one page at a time
+                file_pages = (
+                    (file_path, self.lazy_load_single_document(file_path))
+                    for file_path in file_paths
+                )
+
+            try:
+                for file_path, pages in file_pages:
+                    if isinstance(pages, Exception):
+                        # Same as load_documents, a file that can't be loaded doesn't stop the rest
+                        logging.error(str(pages))
+                        continue
+
+                    split_settings = {
+                        "is_code": is_code,
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": chunk_overlap,
+                    }
+                    split_settings.update(
+                        (file_split_settings or {}).get(
+                            os.path.basename(
+                                self.converted_file_maps.get(file_path, file_path)
+                            ),
+                            {},
+                        )
+                    )
+
+                    if not self._produce_file_chunks(
+                        file_path,
+                        pages,
+                        split_documents,
+                        put=put,
+                        **split_settings,
+                    ):
+                        return
+                put(end_of_stream)
+            except Exception as e:
+                put(e)
+            finally:
+                # Stops the parsing worker processes if the consumer stopped early
+                if hasattr(file_pages, "close"):
+                    file_pages.close()
+
+        producer = threading.Thread(
+            target=produce, name="document-loader-producer", daemon=True
+        )
+        producer.start()
+
+        try:
+            while True:
+                item = chunks.get()
+                if item is end_of_stream:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+    def count_split_documents(
+        self,
+        file_path: str,
+        split_documents: bool,
+        is_code: bool,
+        chunk_size: int,
+        chunk_overlap: int,
+    ) -> int:
+        """Counts the chunks stream_split_documents yields for one file, parsing just that file (here, not in the pool)"""
+        if os.path.splitext(file_path)[1] in self.WORD_DOC_TYPES:
+            self.convert_word_doc_to_pdf(file_path, os.path.dirname(file_path))
+            converted_file_path = os.path.splitext(file_path)[0] + ".pdf"
+            self.converted_file_maps[converted_file_path] = file_path
+            file_path = converted_file_path
+
+        chunk_count = 0
+
+        def count(_) -> bool:
+            nonlocal chunk_count
+            chunk_count += 1
+            return True
+
+        self._produce_file_chunks(
+            file_path,
+            self.lazy_load_single_document(file_path),
+            split_documents,
+            is_code,
+            chunk_size,
+            chunk_overlap,
+            count,
+        )
+
+        return chunk_count
+
+    def _produce_file_chunks(
+        self,
+        file_path: str,
+        pages: Iterable[Document],
+        split_documents: bool,
+        is_code: bool,
+        chunk_size: int,
+        chunk_overlap: int,
+        put,
+    ) -> bool:
+        """Splits a file page by page, handing each chunk to put. Returns False if the consumer has stopped."""
+        text_splitter = (
+            self.get_text_splitter(chunk_size, chunk_overlap)
+            if split_documents and not is_code
+            else None
+        )
+
+        chunk_index = 0
+        try:
+            for page in pages:
+                page_chunks = (
+                    text_splitter.split_documents([page]) if text_splitter else [page]
+                )
+
+                for chunk in page_chunks:
+                    chunk.page_content = chunk.page_content.replace("TLP:WHITE", "")
+
+                    if not put((chunk.metadata["filename"], chunk_index, chunk)):
+                        return False
+                    chunk_index += 1
+        except ValueError as e:
+            # Same as load_documents, a file that can't be loaded doesn't stop the rest
+            logging.error(str(e))
+
+        logging.debug(f"Streamed {chunk_index} chunks from {file_path}")
+
+        return True
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=os.getenv("LOGGING_LEVEL", "INFO"))
@@ -0,0 +1,145 @@
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Tuple, Union
+
+from langchain.docstore.document import Document
+
+# Parses files in worker processes, so that parsing (PDF extraction in particular) uses more than one core.
+# Each file gets a timeout, and a file that hangs or crashes its worker only fails that file- the pool is
+# replaced, and the other files that were being parsed with it are started again.
+
+DEFAULT_PARSING_TIMEOUT_SECONDS = 300
+
+# A file is tried this many times when its worker process dies, since it may have been another file's fault-
+# the retries run on their own
+DEFAULT_MAX_ATTEMPTS = 2
+
+
+def _load_file(file_path: str, converted_file_maps: Dict[str, str]) -> List[Document]:
+    # Runs in the worker process
+    from src.documents.document_loader import DocumentLoader
+
+    document_loader = DocumentLoader(parsing_workers=0)
+    document_loader.converted_file_maps = converted_file_maps
+
+    return list(document_loader.lazy_load_single_document(file_path))
+
+
+class DocumentParsingPool:
+    def __init__(
+        self,
+        max_workers: int,
+        timeout_seconds: float = DEFAULT_PARSING_TIMEOUT_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max(1, max_attempts)
+
+    def parse_files(
+        self, file_paths: List[str], converted_file_maps: Dict[str, str] = {}
+    ) -> Iterator[Tuple[str, Union[List[Document], Exception]]]:
+        """Yields (file path, documents) for each file as it is parsed, in the order they finish.
+
+        A file that can't be parsed yields the exception instead of the documents.
+        """
+        pending = deque((file_path, 0) for file_path in file_paths)
+        # future -> (file path, attempts, deadline)
+        in_flight = {}
+        executor = None
+
+        try:
+            while pending or in_flight:
+                if executor is None:
+                    executor = self._create_executor()
+
+                # Only submit as many files as there are workers, so each one's timeout starts when it does
+                while pending and len(in_flight) < self.max_workers:
+                    # Files being retried after a crash run alone, so that a crash can only be that file's fault
+                    if in_flight and (
+                        pending[0][1] > 0
+                        or any(attempts > 0 for _, attempts, _ in in_flight.values())
+                    ):
+                        break
+
+                    file_path, attempts = pending.popleft()
+                    future = executor.submit(_load_file, file_path, converted_file_maps)
+                    in_flight[future] = (
+                        file_path,
+                        attempts,
+                        time.monotonic() + self.timeout_seconds,
+                    )
+
+                next_deadline = min(deadline for _, _, deadline in in_flight.values())
+                done, _ = wait(
+                    in_flight,
+                    timeout=max(0, next_deadline - time.monotonic()),
+                    return_when=FIRST_COMPLETED,
+                )
+
+                pool_broken = False
+                for future in done:
+                    file_path, attempts, _ = in_flight.pop(future)
+
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        pool_broken = True
+                        if attempts + 1 < self.max_attempts:
+                            pending.append((file_path, attempts + 1))
+                            continue
+                        result = ValueError(
+                            f"Could not load {file_path}, the parser crashed"
+                        )
+                    except Exception as e:
+                        result = e
+
+                    yield file_path, result
+
+                now = time.monotonic()
+                timed_out = [
+                    future
+                    for future, (_, _, deadline) in in_flight.items()
+                    if deadline <= now
+                ]
+                for future in timed_out:
+                    file_path, _, _ = in_flight.pop(future)
+                    yield file_path, TimeoutError(
+                        f"Could not load {file_path}, parsing took longer than {self.timeout_seconds} seconds"
+                    )
+
+                if timed_out or pool_broken:
+                    # The files still in flight go down with the pool, so they start over (without using an attempt)
+                    for file_path, attempts, _ in in_flight.values():
+                        pending.appendleft((file_path, attempts))
+                    in_flight.clear()
+
+                    self._terminate_executor(executor)
+                    executor = None
+        finally:
+            if executor is not None:
+                if in_flight:
+                    self._terminate_executor(executor)
+                else:
+                    executor.shutdown(wait=True)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawn rather than fork, since the callers (e.g. streamlit) have other threads running
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    @staticmethod
+    def _terminate_executor(executor: ProcessPoolExecutor) -> None:
+        # ProcessPoolExecutor can't stop a call that is already running, so stop its worker processes directly
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            if process.is_alive():
+                process.terminate()
+
+        executor.shutdown(wait=False, cancel_futures=True)
+        logging.debug("Replaced the document parsing worker processes")
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterator, List
 from uuid import UUID
 
 from langchain.schema.chat_history import BaseChatMessageHistory
@@ -13,6 +13,9 @@ from langchain.schema.messages import (
 from src.db.models.conversation_messages import ConversationMessages, ConversationMessageModel
 from src.db.models.domain.conversation_role_type import ConversationRoleType
 
+# The number of messages to load from the DB at a time when paging through a conversation
+DEFAULT_PAGE_SIZE = 50
+
 
 class PostgresChatMessageHistory(BaseChatMessageHistory):
     """Chat message history stored in Postgres."""
@@ -33,10 +36,53 @@ class PostgresChatMessageHistory(BaseChatMessageHistory):
     def messages(self) -> List[BaseMessage]:
         """A list of Messages stored in the DB."""
         # return self.chat_messages
-        chat_messages = []
         messages = self.conversation_messages.get_conversations_for_conversation(
             self.conversation_id
         )
+
+        return self._to_chat_messages(messages)
+
+    def get_messages_page(
+        self, before_id: int = None, page_size: int = DEFAULT_PAGE_SIZE
+    ) -> List[BaseMessage]:
+        """Gets a page of messages, oldest first.
+
+        Args:
+            before_id: Only get messages older than this message id. Pass the id of the first
+                message in the previous page to page back through the conversation.
+            page_size: The maximum number of messages to get.
+        """
+        messages = self.conversation_messages.get_conversation_messages_page(
+            self.conversation_id, before_id=before_id, page_size=page_size
+        )
+
+        return self._to_chat_messages(reversed(messages))
+
+    def iter_messages_newest_first(
+        self, page_size: int = DEFAULT_PAGE_SIZE
+    ) -> Iterator[BaseMessage]:
+        """Yields the messages from newest to oldest, loading them from the DB a page at a time.
+
+        Stop iterating once you have enough messages, and the older pages are never loaded.
+        """
+        before_id = None
+
+        while True:
+            # Pages come back newest first
+            messages = self.conversation_messages.get_conversation_messages_page(
+                self.conversation_id, before_id=before_id, page_size=page_size
+            )
+
+            yield from self._to_chat_messages(messages)
+
+            if len(messages) < page_size:
+                return
+
+            before_id = messages[-1].id
+
+    def _to_chat_messages(self, messages) -> List[BaseMessage]:
+        chat_messages = []
+
         for message in messages:
             if message.conversation_role_type == ConversationRoleType.USER:
                 chat_message = HumanMessage(content=message.message_text)
@@ -44,12 +90,22 @@ class PostgresChatMessageHistory(BaseChatMessageHistory):
                 chat_message = AIMessage(content=message.message_text)
             elif message.conversation_role_type == ConversationRoleType.SYSTEM:
                 chat_message = SystemMessage(content=message.message_text)
-
-            chat_message.additional_kwargs = {"id": message.id}
+            else:
+                continue
+
+            chat_message.additional_kwargs = {
+                "id": message.id,
+                "token_count": message.message_token_count,
+                "token_encoding": message.message_token_encoding,
+            }
             chat_messages.append(chat_message)
 
         return chat_messages
 
+    def set_token_counts(self, token_encoding: str, token_counts: dict) -> None:
+        """Stores the token counts (message id -> count) for messages, so they are only counted once."""
+        self.conversation_messages.set_message_token_counts(token_encoding, token_counts)
+
     def add_message(self, message: BaseMessage) -> None:
         """Add a Message object to the store.
 
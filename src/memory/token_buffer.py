@@ -1,12 +1,21 @@
 ## Taken from langchain... had to modify this to allow me to prune stored messages on retrieval,
 # not have the pruning occur on savecontext. Should probably create a PR or something.
 
-from functools import lru_cache
+import logging
 from typing import Any, Dict, List
 
 from langchain.memory.chat_memory import BaseChatMemory
 from langchain.schema.language_model import BaseLanguageModel
-from langchain.schema.messages import BaseMessage, get_buffer_string
+from langchain.schema.messages import (
+    AIMessage,
+    BaseMessage,
+    FunctionMessage,
+    HumanMessage,
+    SystemMessage,
+    get_buffer_string,
+)
+
+from src.utilities.token_helper import get_encoding_for_model
 
 
 class ConversationTokenBufferMemory(BaseChatMemory):
@@ -16,6 +25,8 @@ class ConversationTokenBufferMemory(BaseChatMemory):
     ai_prefix: str = "AI"
     memory_key: str = "history"
     max_token_limit: int = 2000
+    # The model the history is sent to, used to pick the tokenizer
+    model_name: str = "gpt-3.5-turbo"
 
     @property
     def buffer(self) -> Any:
@@ -53,25 +64,48 @@ class ConversationTokenBufferMemory(BaseChatMemory):
         super().save_context(inputs, outputs)
 
     def get_messages(self):
-        # Prune buffer if it exceeds max token limit
-        buffer = self.chat_memory.messages
-        curr_buffer_length = self.get_num_tokens_from_messages(buffer)
-        if curr_buffer_length > self.max_token_limit:
-            pruned_memory = []
-            while curr_buffer_length > self.max_token_limit:
-                pruned_memory.append(buffer.pop(0))
-                curr_buffer_length = self.get_num_tokens_from_messages(buffer)
+        """Gets the newest messages that fit in the max token limit."""
+        encoding = get_encoding_for_model(self.model_name)
 
-        return buffer
+        # Histories that can page through their messages only load as many as fit
+        if hasattr(self.chat_memory, "iter_messages_newest_first"):
+            newest_first = self.chat_memory.iter_messages_newest_first()
+        else:
+            newest_first = reversed(self.chat_memory.messages)
 
-    def get_num_tokens(self, text: str) -> int:
-        # get the cached tokenizer
-        tokenizer = get_tokenizer()
+        # Messages that had to be counted, so that they can be stored with the message
+        new_token_counts = {}
+
+        # Walk back from the newest message, keeping a running total
+        total_tokens = 0
+        buffer = []
+        for message in newest_first:
+            message_tokens = self._get_message_token_count(
+                message, encoding, new_token_counts
+            )
+
+            if total_tokens + message_tokens > self.max_token_limit:
+                break
 
-        # tokenize the text using the GPT-2 tokenizer
-        tokens = tokenizer.encode(text)
+            total_tokens += message_tokens
+            buffer.append(message)
 
-        return len(tokens)
+        buffer.reverse()
+
+        if new_token_counts and hasattr(self.chat_memory, "set_token_counts"):
+            try:
+                self.chat_memory.set_token_counts(encoding.name, new_token_counts)
+            except Exception as e:
+                logging.warning(f"Could not store the message token counts: {e}")
+
+        return buffer
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(
+            get_encoding_for_model(self.model_name).encode(
+                text, disallowed_special=()
+            )
+        )
 
     def get_num_tokens_from_messages(self, messages: List[BaseMessage]) -> int:
         """Get the number of tokens in the messages.
@@ -84,18 +118,52 @@ class ConversationTokenBufferMemory(BaseChatMemory):
         Returns:
             The sum of the number of tokens across the messages.
         """
-        return sum([self.get_num_tokens(get_buffer_string([m])) for m in messages])
-
-
-@lru_cache(maxsize=None)  # Cache the tokenizer
-def get_tokenizer() -> Any:
-    try:
-        from transformers import GPT2TokenizerFast  # type: ignore[import]
-    except ImportError:
-        raise ImportError(
-            "Could not import transformers python package. "
-            "This is needed in order to calculate get_token_ids. "
-            "Please install it with `pip install transformers`."
+        encoding = get_encoding_for_model(self.model_name)
+
+        return sum(
+            [self._get_message_token_count(m, encoding, {}) for m in messages]
+        )
+
+    def _get_message_token_count(
+        self, message: BaseMessage, encoding, new_token_counts: dict
+    ) -> int:
+        """Counts the tokens for a message as it appears in the buffer string.
+
+        The content is only tokenized when there is no stored count from the same encoding.
+        """
+        token_count = message.additional_kwargs.get("token_count", None)
+
+        if (
+            token_count is None
+            or message.additional_kwargs.get("token_encoding", None) != encoding.name
+        ):
+            token_count = len(encoding.encode(message.content, disallowed_special=()))
+            message.additional_kwargs["token_count"] = token_count
+            message.additional_kwargs["token_encoding"] = encoding.name
+
+            message_id = message.additional_kwargs.get("id", None)
+            if message_id is not None:
+                new_token_counts[message_id] = token_count
+
+        # The "<role>: " prefix and the newline separating the messages
+        return (
+            token_count
+            + len(
+                encoding.encode(
+                    f"{self._get_role(message)}: ", disallowed_special=()
+                )
+            )
+            + 1
         )
-    # create a GPT-2 tokenizer instance
-    return GPT2TokenizerFast.from_pretrained("gpt2")
+
+    def _get_role(self, message: BaseMessage) -> str:
+        if isinstance(message, HumanMessage):
+            return self.human_prefix
+        elif isinstance(message, AIMessage):
+            return self.ai_prefix
+        elif isinstance(message, SystemMessage):
+            return "System"
+        elif isinstance(message, FunctionMessage):
+            return "Function"
+
+        return message.type.capitalize()
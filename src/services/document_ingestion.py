@@ -1,27 +1,102 @@
+import hashlib
+
 from fastapi import APIRouter, UploadFile, File
 from typing import List
 
-from .documents.document_ingestion_tasks import process_document_task
+from src.db.models.documents import Documents, FileModel
+from src.db.models.ingestion_jobs import IngestionJobs
+
+from .documents.document_ingestion_tasks import queue_file_ingestion
 
 router = APIRouter()
 
 
 @router.post("/ingest")
 async def ingest_documents(
-    active_collection_id:int,
-    overwrite_existing_files:bool,
-    split_documents:bool,
-    create_summary_and_chunk_questions:bool,
-    summarize_document:bool,
-    chunk_size:int,
-    chunk_overlap:int,
+    active_collection_id: int,
+    user_id: int,
+    overwrite_existing_files: bool,
+    split_documents: bool,
+    create_summary_and_chunk_questions: bool,
+    summarize_document: bool,
+    chunk_size: int,
+    chunk_overlap: int,
+    file_classification: str = "Document",
+    incremental_update: bool = False,
     files: List[UploadFile] = File(...),
 ):
+    documents_helper = Documents()
+    ingestion_settings = {
+        "split_documents": split_documents,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "create_summary_and_chunk_questions": create_summary_and_chunk_questions,
+        "summarize_document": summarize_document,
+        "incremental_update": incremental_update,
+    }
+
+    file_ids = []
     for file in files:
-        file_location = f"/tmp/{file.filename}"
-        with open(file_location, "wb+") as file_object:
-            file_object.write(file.file.read())
+        file_data = file.file.read()
+        # Same as calculate_sha256, without writing the file to disk
+        file_hash = hashlib.sha256(file_data).hexdigest()
+
+        existing_file = documents_helper.get_file_by_name(
+            file.filename, active_collection_id
+        )
+
+        if existing_file:
+            if incremental_update and existing_file.file_hash != file_hash:
+                # Re-ingest the changed file in place, only processing the chunks that changed
+                documents_helper.update_file_content(
+                    existing_file.id, file_hash, file_data, chunk_size, chunk_overlap
+                )
+                queue_file_ingestion(existing_file.id, ingestion_settings)
+                file_ids.append(existing_file.id)
+                continue
+
+            if not overwrite_existing_files:
+                # Resume (or skip, if it's done) the existing file
+                if existing_file.file_hash == file_hash:
+                    queue_file_ingestion(existing_file.id, ingestion_settings)
+                    file_ids.append(existing_file.id)
+                continue
+
+            documents_helper.delete_document_chunks_by_file_id(existing_file.id)
+            documents_helper.delete_file(existing_file.id)
+
+        file_model = documents_helper.create_file(
+            FileModel(
+                user_id=user_id,
+                collection_id=active_collection_id,
+                file_name=file.filename,
+                file_hash=file_hash,
+                file_classification=file_classification,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+            ),
+            file_data,
+        )
+
         # Hand off to Celery for processing
-        process_document_task.delay(file_location)
+        queue_file_ingestion(file_model.id, ingestion_settings)
+        file_ids.append(file_model.id)
+
+    return {"message": "Documents are being processed", "file_ids": file_ids}
+
+
+@router.get("/ingest/{file_id}")
+async def get_ingestion_progress(file_id: int):
+    job = IngestionJobs().get_job(file_id)
+
+    if job is None:
+        return {"file_id": file_id, "status": None}
 
-    return {"message": "Documents are being processed"}
+    return {
+        "file_id": file_id,
+        "status": job.status.value,
+        "total_chunks": job.total_chunks,
+        "stored_chunks": job.stored_chunks,
+        "progress": job.progress,
+        "error": job.error,
+    }
@@ -1,326 +1,459 @@
-from celery import Celery
+import argparse
+import asyncio
+import logging
 import os
+import shutil
+import sys
+import tempfile
+from typing import List
+
+from celery import Celery, Task, chain
+from celery.utils.time import get_exponential_backoff_interval
+from langchain.docstore.document import Document
+from sqlalchemy.exc import OperationalError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+
+from src.ai.utilities.enrichment_engine import is_transient_error
 from src.documents.document_loader import DocumentLoader
 from src.db.models.documents import Documents, FileModel, DocumentModel
-from src.utilities.hash_utilities import calculate_sha256
-import asyncio
+from src.db.models.domain.ingestion_job_model import (
+    IngestionJobModel,
+    IngestionJobStatus,
+)
+from src.db.models.ingestion_jobs import IngestionJobs
+from src.services.documents.ingestion_ai import IngestionAI
+from src.utilities.configuration_utilities import get_app_configuration
+
+# Files are ingested by a pipeline of Celery tasks, each stage on its own queue so that
+# workers (and their concurrency) can be sized per stage:
+#
+#   load (read the file from the DB, convert and parse it) -> split (into chunks)
+#     -> for each batch of chunks: enrich (summary + questions) -> store (embed and insert)
+#
+# A stage is retried when it fails with a transient error (the DB or the LLM provider being
+# unavailable, rate limits, timeouts), any other error fails the file.  Stored chunks are
+# keyed by (file_id, chunk_index), and a retried or redelivered batch skips the chunks that
+# are already stored.  The progress of each file is kept in the ingestion_jobs table for the
+# UI to poll.
+#
+# The chunks are embedded in the same task that stores them, so the vectors never go
+# through the broker.
+#
+# Set CELERY_TASK_ALWAYS_EAGER=true to run the whole pipeline in-process (e.g. for tests),
+# or CELERY_BROKER_URL=memory:// to use an in-memory broker.
+
+INGESTION_STAGES = ["load", "split", "enrich", "store"]
+
+DEFAULT_DOCUMENT_INGESTION_CONFIGURATION = {
+    # Ingest uploaded files with the background workers instead of in the UI
+    "use_background_workers": False,
+    # The number of chunks that go through enrich -> store together
+    "batch_size": 50,
+    "max_retries": 5,
+    # Worker processes per stage, used when starting the workers from this module
+    "stage_concurrency": {
+        "load": 2,
+        "split": 2,
+        "enrich": 4,
+        "store": 2,
+    },
+}
+
+
+def get_document_ingestion_configuration() -> dict:
+    configuration = dict(DEFAULT_DOCUMENT_INGESTION_CONFIGURATION)
+    configured = get_app_configuration()["jarvis_ai"].get("document_ingestion", {})
+    configuration.update(configured)
+
+    configuration["stage_concurrency"] = dict(
+        DEFAULT_DOCUMENT_INGESTION_CONFIGURATION["stage_concurrency"]
+    )
+    configuration["stage_concurrency"].update(configured.get("stage_concurrency", {}))
+
+    return configuration
+
+
+def get_stage_queue(stage: str) -> str:
+    return f"ingestion.{stage}"
+
+
+def get_broker_url() -> str:
+    if os.environ.get("CELERY_BROKER_URL", None):
+        return os.environ["CELERY_BROKER_URL"]
+
+    broker_user = os.environ.get("RABBITMQ_DEFAULT_USER")
+    broker_password = os.environ.get("RABBITMQ_DEFAULT_PASS")
+    broker_host = os.environ.get("RABBITMQ_HOST")
+
+    return f"amqp://{broker_user}:{broker_password}@{broker_host}"
+
 
 # Initialize Celery
-broker_user = os.environ.get("RABBITMQ_DEFAULT_USER")
-broker_password = os.environ.get("RABBITMQ_DEFAULT_PASS")
-broker_host = os.environ.get("RABBITMQ_HOST")
-celery_app = Celery(
-    "document_ingestion", broker=f"amqp://{broker_user}:{broker_password}@{broker_host}"
+celery_app = Celery("document_ingestion", broker=get_broker_url())
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    # Redeliver a task if its worker dies part way through, the stages are idempotent
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Batches can take minutes (LLM calls), so don't let one worker hoard them
+    worker_prefetch_multiplier=1,
 )
 
+if os.environ.get("CELERY_TASK_ALWAYS_EAGER", "false").lower() == "true":
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_eager_propagates = True
+
+MAX_RETRIES = get_document_ingestion_configuration()["max_retries"]
+
+
+def _is_transient_error(error: Exception) -> bool:
+    return isinstance(error, OperationalError) or is_transient_error(error)
+
+
+class IngestionTask(Task):
+    """Base class for the pipeline stages, retries on transient errors and marks the job failed on any other error,
+    or once the retries run out"""
+
+    retry_backoff_max = 600
+    max_retries = MAX_RETRIES
+
+    def __call__(self, *args, **kwargs):
+        # Not autoretry_for, which can only match on the exception type- whether an LLM
+        # provider error is transient depends on its status code
+        try:
+            return super().__call__(*args, **kwargs)
+        except Exception as e:
+            if not _is_transient_error(e):
+                raise
+
+            raise self.retry(
+                exc=e,
+                countdown=get_exponential_backoff_interval(
+                    factor=1,
+                    retries=self.request.retries,
+                    maximum=self.retry_backoff_max,
+                    full_jitter=True,
+                ),
+            )
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        file_id = kwargs.get("file_id", None)
+
+        logging.error(f"Ingestion task {self.name} failed for file {file_id}: {exc}")
 
-@celery_app.task(bind=True)
-def process_document_task(
-    file_path: str, collection_id: int, user_id: int, ingestion_settings: dict
-):
-    """Process (split, vectorize, etc.) a single document and store it in the database
+        if file_id is not None:
+            IngestionJobs().set_status(
+                file_id, IngestionJobStatus.FAILED, error=str(exc)
+            )
+
+
+def queue_file_ingestion(file_id: int, ingestion_settings: dict) -> IngestionJobModel:
+    """Queues a file (already created with its data in the files table) for ingestion.
 
     Args:
-        file_path (str): Path to the file to be processed
-        active_collection_id (int): The collection that this file will be associated with
-        user_id (int): The user that uploaded the file
-        ingestion_settings (dict): A dictionary of settings to use for processing the file
+        file_id (int): The file to ingest.
+        ingestion_settings (dict): split_documents, chunk_size, chunk_overlap,
+            create_summary_and_chunk_questions, summarize_document and incremental_update
+            (keep the stored chunks whose text hasn't changed, see Documents.update_file_content).
+
+    Returns:
+        IngestionJobModel: The job tracking the file. If the same file contents are already
+            ingested (or being ingested), no new work is queued.
     """
-    
-    return "Document processing completed"
-
-    # document_loader = DocumentLoader()
-    # documents_helper = Documents()
-
-    # with open(file_path, "rb") as file:
-    #     file_data = file.read()
-
-    # documents = asyncio.run(
-    #     document_loader.load_and_split_documents(
-    #         document_directory=file_path,
-    #         split_documents=ingestion_settings["split_documents"],
-    #         is_code=False,  # Don't use "Code" type anymore here until it's refactored
-    #         chunk_size=ingestion_settings["chunk_size"],
-    #         chunk_overlap=ingestion_settings["chunk_overlap"],
-    #     )
-    # )
-
-    # for document in documents:
-    #     file_name = document.metadata["filename"].replace(file_path, "").strip("/")
-    #     file_hash = calculate_sha256(document.metadata["filepath"])
-    #     file_model = documents_helper.create_file(
-    #         FileModel(
-    #             user_id=user_id,
-    #             collection_id=collection_id,
-    #             file_name=file_name,
-    #             file_hash=file_hash,
-    #             file_classification=ingestion_settings["file_type"],
-    #             chunk_size=ingestion_settings["chunk_size"],
-    #             chunk_overlap=ingestion_settings["chunk_overlap"],
-    #         ),
-    #         file_data, # Binary file data
-    #     )
-
-    #     summary = ""
-    #     if ingestion_settings["summarize_chunks"]:
-    #         # TODO: Get summary from AI
-    #         summary = "Summarized content"
-
-    #     documents_helper.store_document(
-    #         DocumentModel(
-    #             collection_id=collection_id,
-    #             file_id=file_model.id,
-    #             user_id=user_id,
-    #             document_text=document.page_content,
-    #             document_text_summary=summary,
-    #             document_text_has_summary=summary != "",
-    #             additional_metadata=document.metadata,
-    #             document_name=file_name,
-    #             embedding_model_name="YourEmbeddingModelName",
-    #             question_1="",  # TODO: Get these from the AI
-    #             question_2="",
-    #             question_3="",
-    #             question_4="",
-    #             question_5="",
-    #         )
-    #     )
-
-    
-
-
-# def ingest_files(
-#     uploaded_files,
-#     active_collection_id,
-#     status,
-#     overwrite_existing_files,
-#     split_documents,
-#     create_chunk_questions,
-#     summarize_chunks,
-#     summarize_document,
-#     chunk_size,
-#     chunk_overlap,
-#     ai=None,
-# ):
-#     """Ingests the uploaded files into the specified collection"""
-
-#     documents_helper = Documents()
-#     document_loader = DocumentLoader()
-#     documents = None
-
-#     if not active_collection_id:
-#         st.error("No collection selected")
-#         return
-
-#     if not uploaded_files:
-#         st.error("No files selected")
-#         return
-
-#     status.update(
-#         label=f"Ingesting files and adding to '{get_selected_collection_name()}'",
-#         state="running",
-#     )
-
-#     ingest_progress_bar = st.progress(text="Uploading files...", value=0)
-
-#     # First upload the files to our temp directory
-#     uploaded_file_paths, root_temp_dir = upload_files(
-#         uploaded_files, status, ingest_progress_bar
-#     )
-
-#     with status.container():
-#         with st.empty():
-#             st.info(f"Processing {len(uploaded_file_paths)} files...")
-#             logging.info(f"Processing {len(uploaded_file_paths)} files...")
-#             # First see if there are any files we can't load
-#             files = []
-#             for uploaded_file_path in uploaded_file_paths:
-#                 ingest_progress_bar.progress(
-#                     calculate_progress(
-#                         len(uploaded_file_paths),
-#                         uploaded_file_paths.index(uploaded_file_path) + 1,
-#                     ),
-#                     text=f"Uploading file {uploaded_file_paths.index(uploaded_file_path) + 1} of {len(uploaded_file_paths)}",
-#                 )
-
-#                 # Get the file name
-#                 file_name = (
-#                     uploaded_file_path.replace(root_temp_dir, "").strip("/").strip("\\")
-#                 )
-
-#                 st.info(f"Verifying {uploaded_file_path}...")
-#                 logging.info(f"Verifying {uploaded_file_path}...")
-
-#                 # See if it exists in this collection
-#                 existing_file = documents_helper.get_file_by_name(
-#                     file_name, active_collection_id
-#                 )
-
-#                 if existing_file and not overwrite_existing_files:
-#                     # See if the hash on this file matches the one we have stored
-#                     if existing_file.file_hash == calculate_sha256(uploaded_file_path):
-#                         # It matches, so split the file using the existing document chunks settings
-#                         st.info(
-#                             f"File '{file_name}' already exists, and the hash matches, so we're checking to see if it's a RESUME op..."
-#                         )
-#                         logging.info(
-#                             f"File '{file_name}' already exists, and the hash matches, so we're checking to see if it's a RESUME op..."
-#                         )
-
-#                         if (
-#                             existing_file.file_classification
-#                             != st.session_state.ingestion_settings.file_type
-#                         ):
-#                             st.error(
-#                                 f"File '{file_name}' already exists, and the hash matches, but the file type has changed.  Please set the overwrite option and try again."
-#                             )
-#                             logging.error(
-#                                 f"File '{file_name}' already exists, and the hash matches, but the file type has changed.  Please set the overwrite option and try again."
-#                             )
-
-#                         # TODO: Fix all of this- it's a total inefficient mess, the document ingestion needs to be completely re-written
-
-#                         # Split the document
-#                         documents = asyncio.run(
-#                             document_loader.load_and_split_documents(
-#                                 document_directory=root_temp_dir,
-#                                 split_documents=split_documents,
-#                                 is_code=existing_file.file_classification == "Code",
-#                                 chunk_size=existing_file.chunk_size,
-#                                 chunk_overlap=existing_file.chunk_overlap,
-#                             )
-#                         )
-
-#                         # Get the documents that match this file name
-#                         matching_documents = [
-#                             d
-#                             for d in documents
-#                             if d.metadata["filename"]
-#                             .replace(root_temp_dir, "")
-#                             .strip("/")
-#                             == file_name
-#                         ]
-
-#                         if (
-#                             len(matching_documents) == existing_file.document_count
-#                             or existing_file.document_count == 0
-#                         ):
-#                             files.append(existing_file)                            
-#                         else:
-#                             st.error(
-#                                 f"File '{file_name}' already exists, and the hash matches, but the number of documents in the file has changed.  Please delete the file and try again."
-#                             )
-#                             logging.error(
-#                                 f"File '{file_name}' already exists, and the hash matches, but the number of documents in the file has changed.  Please delete the file and try again."
-#                             )
-
-#                     st.warning(
-#                         f"File '{file_name}' already exists, and overwrite is not enabled"
-#                     )
-#                     logging.warning(
-#                         f"File '{file_name}' already exists, and overwrite is not enabled"
-#                     )
-#                     logging.debug(f"Deleting temp file: {uploaded_file_path}")
-#                     os.remove(uploaded_file_path)
-
-#                     continue
-
-#                 elif not existing_file or (existing_file and overwrite_existing_files):
-#                     # Delete the document chunks
-#                     if existing_file:
-#                         documents_helper.delete_document_chunks_by_file_id(
-#                             existing_file.id
-#                         )
-
-#                         # Delete the existing file
-#                         documents_helper.delete_file(existing_file.id)
-
-#                     # File does not exist (or was deleted)
-#                     # Read the file
-#                     with open(uploaded_file_path, "rb") as file:
-#                         file_data = file.read()
-
-#                     # Start off with the default file classification
-#                     file_classification = st.session_state.ingestion_settings.file_type
-
-#                     # Override the classification if necessary
-#                     # Get the file extension
-#                     file_extension = os.path.splitext(file_name)[1]
-#                     # Check to see if it's an image
-#                     if file_extension in IMAGE_TYPES:
-#                         # It's an image, reclassify it
-#                         file_classification = "Image"
-
-#                     # Create the file
-#                     logging.info(f"Creating file '{file_name}'...")
-#                     file_model = documents_helper.create_file(
-#                         FileModel(
-#                             user_id=st.session_state.user_id,
-#                             collection_id=active_collection_id,
-#                             file_name=file_name,
-#                             file_hash=calculate_sha256(uploaded_file_path),
-#                             file_classification=file_classification,
-#                             chunk_size=chunk_size,
-#                             chunk_overlap=chunk_overlap,
-#                         ),
-#                         file_data,
-#                     )
-#                     files.append(file_model)
-
-#             if not files or len(files) == 0:
-#                 st.warning("Nothing to split... bye!")
-#                 logging.warning("No files to ingest")
-#                 ingest_progress_bar.empty()
-#                 status.update(
-#                     label=f"⚠️ Ingestion complete (with warnings)",
-#                     state="complete",
-#                 )
-#                 return
-
-#             st.info("Splitting documents...")
-#             logging.info("Splitting documents...")
-
-#             is_code = st.session_state.ingestion_settings.file_type == "Code"
-
-#             # Pass the root temp dir to the ingestion function
-#             # if we've already split the docs, don't do it again
-#             if not documents:
-#                 documents = asyncio.run(
-#                     document_loader.load_and_split_documents(
-#                         document_directory=root_temp_dir,
-#                         split_documents=split_documents,
-#                         is_code=is_code,
-#                         chunk_size=chunk_size,
-#                         chunk_overlap=chunk_overlap,
-#                     )
-#                 )
-
-#             if documents == None:
-#                 st.warning(
-#                     f"No documents could be extracted from these files.  Possible images detected..."
-#                 )
-#                 st.success(f"Completed ingesting {len(files)} files")
-#                 status.update(
-#                     label=f"✅ Ingestion complete",
-#                     state="complete",
-#                 )
-#                 logging.info(
-#                     f"No documents could be extracted from these files.  Possible images detected..."
-#                 )
-#                 return
-
-#             save_split_documents(
-#                 active_collection_id,
-#                 status,
-#                 create_chunk_questions,
-#                 summarize_chunks,
-#                 summarize_document,
-#                 ai,
-#                 documents_helper,
-#                 ingest_progress_bar,
-#                 root_temp_dir,
-#                 files,
-#                 documents,
-#             )
-
-#     # Done!
-#     st.balloons()
+    file = Documents().get_file(file_id)
+    job = IngestionJobs().get_or_create_job(file_id, file.file_hash)
+
+    if job.status != IngestionJobStatus.QUEUED:
+        logging.info(
+            f"File {file_id} is already {job.status.value}, not queueing it again"
+        )
+        return job
+
+    chain(
+        load_file_task.s(file_id=file_id, ingestion_settings=ingestion_settings),
+        split_file_task.s(file_id=file_id, ingestion_settings=ingestion_settings),
+    ).apply_async()
+
+    return job
+
+
+@celery_app.task(
+    bind=True,
+    base=IngestionTask,
+    name="document_ingestion.load_file",
+    queue=get_stage_queue("load"),
+)
+def load_file_task(self, file_id: int, ingestion_settings: dict) -> List[dict]:
+    """Loads (converting if necessary) a file's pages from the data stored in the DB"""
+    IngestionJobs().set_status(file_id, IngestionJobStatus.LOADING)
+
+    documents_helper = Documents()
+    file = documents_helper.get_file(file_id)
+    file_data = documents_helper.get_file_data(file_id)
+
+    temp_dir = tempfile.mkdtemp(prefix="ingestion-")
+    try:
+        with open(os.path.join(temp_dir, os.path.basename(file.file_name)), "wb") as f:
+            f.write(file_data)
+
+        # Celery's worker processes can't start their own, and already isolate each file's parsing anyway
+        document_loader = DocumentLoader(parsing_workers=0)
+        document_loader.convert_documents(temp_dir)
+        pages = asyncio.run(document_loader.load_documents(temp_dir))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return [
+        {"page_content": page.page_content, "metadata": page.metadata}
+        for page in pages
+    ]
+
+
+@celery_app.task(
+    bind=True,
+    base=IngestionTask,
+    name="document_ingestion.split_file",
+    queue=get_stage_queue("split"),
+)
+def split_file_task(self, pages: List[dict], file_id: int, ingestion_settings: dict):
+    """Splits the pages into chunks, and queues the chunks that aren't stored yet in batches"""
+    ingestion_jobs = IngestionJobs()
+    ingestion_jobs.set_status(file_id, IngestionJobStatus.SPLITTING)
+
+    documents_helper = Documents()
+    file = documents_helper.get_file(file_id)
+
+    documents = [
+        Document(page_content=page["page_content"], metadata=page["metadata"])
+        for page in pages
+    ]
+
+    if (
+        documents
+        and ingestion_settings["split_documents"]
+        and file.file_classification != "Code"
+    ):
+        documents = DocumentLoader().split_documents(
+            documents,
+            chunk_size=ingestion_settings["chunk_size"],
+            chunk_overlap=ingestion_settings["chunk_overlap"],
+        )
+
+    chunks = [
+        {
+            "chunk_index": chunk_index,
+            "page_content": document.page_content.replace("TLP:WHITE", ""),
+            "metadata": document.metadata,
+        }
+        for chunk_index, document in enumerate(documents)
+    ]
+
+    if ingestion_settings.get("incremental_update", False):
+        _keep_unchanged_chunks(documents_helper, file_id, chunks)
+
+    documents_helper.update_document_count(file_id, len(chunks))
+    ingestion_jobs.set_total_chunks(file_id, len(chunks))
+
+    stored_chunk_indexes = documents_helper.get_stored_chunk_indexes(file_id)
+    chunks = [c for c in chunks if c["chunk_index"] not in stored_chunk_indexes]
+
+    if not chunks:
+        # Nothing (left) to store
+        _finish_if_complete(file_id, ingestion_settings)
+        return
+
+    batch_size = get_document_ingestion_configuration()["batch_size"]
+    for start in range(0, len(chunks), batch_size):
+        chain(
+            enrich_chunks_task.s(
+                chunks[start : start + batch_size],
+                file_id=file_id,
+                ingestion_settings=ingestion_settings,
+            ),
+            store_chunks_task.s(
+                file_id=file_id, ingestion_settings=ingestion_settings
+            ),
+        ).apply_async()
+
+
+@celery_app.task(
+    bind=True,
+    base=IngestionTask,
+    name="document_ingestion.enrich_chunks",
+    queue=get_stage_queue("enrich"),
+)
+def enrich_chunks_task(
+    self, chunks: List[dict], file_id: int, ingestion_settings: dict
+) -> List[dict]:
+    """Adds the summary and questions to each chunk, if enabled"""
+    if not ingestion_settings.get("create_summary_and_chunk_questions", False):
+        return chunks
+
+    file = Documents().get_file(file_id)
+    ingestion_ai = IngestionAI(file.user_id)
+    enrichment_engine = ingestion_ai.create_enrichment_engine()
+
+    results = enrichment_engine.map(
+        lambda chunk: ingestion_ai.create_summary_and_chunk_questions(
+            text=chunk["page_content"]
+        ),
+        chunks,
+        estimate_tokens=lambda chunk: enrichment_engine.estimate_tokens(
+            chunk["page_content"]
+        ),
+        return_exceptions=True,
+    )
+
+    for chunk, summary_and_chunk_questions in zip(chunks, results):
+        if isinstance(summary_and_chunk_questions, Exception):
+            # Same as ingesting in the UI, a chunk without questions is still worth storing
+            logging.error(
+                f"Error creating questions for chunk: {summary_and_chunk_questions}"
+            )
+            continue
+
+        chunk["summary"] = summary_and_chunk_questions.summary
+        chunk["questions"] = summary_and_chunk_questions.questions
+
+    return chunks
+
+
+@celery_app.task(
+    bind=True,
+    base=IngestionTask,
+    name="document_ingestion.store_chunks",
+    queue=get_stage_queue("store"),
+)
+def store_chunks_task(self, chunks: List[dict], file_id: int, ingestion_settings: dict):
+    """Embeds and stores the chunks that aren't already stored, and updates the progress"""
+    documents_helper = Documents()
+
+    stored_chunk_indexes = documents_helper.get_stored_chunk_indexes(file_id)
+    chunks = [c for c in chunks if c["chunk_index"] not in stored_chunk_indexes]
+
+    if chunks:
+        documents_helper.store_documents(
+            _get_document_models(documents_helper, file_id, chunks)
+        )
+
+    _finish_if_complete(file_id, ingestion_settings)
+
+
+@celery_app.task(
+    bind=True,
+    base=IngestionTask,
+    name="document_ingestion.summarize_file",
+    queue=get_stage_queue("enrich"),
+)
+def summarize_file_task(self, file_id: int, ingestion_settings: dict):
+    file = Documents().get_file(file_id)
+    IngestionAI(file.user_id).generate_detailed_document_summary(file_id)
+
+    IngestionJobs().set_status(file_id, IngestionJobStatus.COMPLETE)
+
+
+def _keep_unchanged_chunks(documents_helper: Documents, file_id: int, chunks: List[dict]):
+    """Keeps the stored chunks whose text is still in the file (with their summaries, questions and
+    embeddings), moving them to their new positions, and deletes the rest"""
+    kept_chunk_indexes = documents_helper.keep_unchanged_document_chunks(
+        file_id, {chunk["chunk_index"]: chunk["page_content"] for chunk in chunks}
+    )
+
+    logging.info(
+        f"Keeping {len(kept_chunk_indexes)} unchanged chunks of {len(chunks)} for file {file_id}"
+    )
+
+
+def _finish_if_complete(file_id: int, ingestion_settings: dict):
+    summarize_document = ingestion_settings.get("summarize_document", False)
+
+    finished = IngestionJobs().update_stored_chunks(
+        file_id,
+        IngestionJobStatus.SUMMARIZING
+        if summarize_document
+        else IngestionJobStatus.COMPLETE,
+    )
+
+    if finished and summarize_document:
+        summarize_file_task.apply_async(
+            kwargs={"file_id": file_id, "ingestion_settings": ingestion_settings}
+        )
+
+
+def _get_document_models(
+    documents_helper: Documents, file_id: int, chunks: List[dict]
+) -> List[DocumentModel]:
+    file: FileModel = documents_helper.get_file(file_id)
+    embedding_model_name = documents_helper.get_collection_embedding_model_name(
+        file.collection_id
+    )
+
+    document_models = []
+    for chunk in chunks:
+        summary = chunk.get("summary", "") or ""
+        questions = chunk.get("questions", None) or []
+
+        document_models.append(
+            DocumentModel(
+                collection_id=file.collection_id,
+                file_id=file.id,
+                user_id=file.user_id,
+                document_text=chunk["page_content"],
+                document_text_summary=summary,
+                document_text_has_summary=summary != "",
+                additional_metadata=chunk["metadata"],
+                document_name=chunk["metadata"].get("filename", file.file_name),
+                embedding_model_name=embedding_model_name,
+                question_1=questions[0] if len(questions) > 0 else "",
+                question_2=questions[1] if len(questions) > 1 else "",
+                question_3=questions[2] if len(questions) > 2 else "",
+                question_4=questions[3] if len(questions) > 3 else "",
+                question_5=questions[4] if len(questions) > 4 else "",
+                chunk_index=chunk["chunk_index"],
+            )
+        )
+
+    return document_models
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Start a document ingestion worker for one (or all) of the pipeline stages."
+    )
+    parser.add_argument(
+        "--stage",
+        choices=INGESTION_STAGES + ["all"],
+        default="all",
+        help="The stage to process, each stage can be scaled separately",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Override the configured number of worker processes",
+    )
+    args = parser.parse_args()
+
+    stage_concurrency = get_document_ingestion_configuration()["stage_concurrency"]
+
+    if args.stage == "all":
+        queues = [get_stage_queue(stage) for stage in INGESTION_STAGES]
+        concurrency = args.concurrency or max(stage_concurrency.values())
+    else:
+        queues = [get_stage_queue(args.stage)]
+        concurrency = args.concurrency or stage_concurrency[args.stage]
+
+    celery_app.worker_main(
+        [
+            "worker",
+            "--loglevel=INFO",
+            "-Q",
+            ",".join(queues),
+            "-c",
+            str(concurrency),
+            "-n",
+            f"ingestion-{args.stage}@%h",
+        ]
+    )
@@ -0,0 +1,32 @@
+import json
+
+from src.ai.utilities.document_enrichment import DocumentEnrichment
+from src.configuration.model_configuration import ModelConfiguration
+from src.db.models.user_settings import UserSettings
+
+
+class IngestionAI(DocumentEnrichment):
+    """The LLM calls made while ingesting files, for use outside of a conversation (e.g. in the ingestion workers).
+
+    Uses the user's file ingestion model configuration, the same as RAGAI does when ingesting from the UI.
+    """
+
+    def __init__(self, user_id: int):
+        super().__init__(
+            ModelConfiguration(
+                **json.loads(
+                    UserSettings()
+                    .get_user_setting(
+                        user_id,
+                        "file_ingestion_model_configuration",
+                        default_value=ModelConfiguration.default().model_dump_json(),
+                    )
+                    .setting_value
+                )
+            )
+        )
+
+    def generate_detailed_document_summary(self, file_id: int) -> str:
+        return self.summarize_file(
+            file_id, enrichment_engine=self.create_enrichment_engine()
+        )
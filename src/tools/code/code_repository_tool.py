@@ -61,11 +61,9 @@ class CodeRepositoryTool:
     )
     def search_for_file_id(self, file_name: str):
         """Looks up a file in the repository by partial file name."""
-        code_files = (
-            self.conversation_manager.code_helper.get_code_files_by_partial_name(
-                repository_id=self.conversation_manager.get_selected_repository().id,
-                partial_file_name=file_name,
-            )
+        code_files = self.conversation_manager.code_helper.get_code_file_listing(
+            repository_id=self.conversation_manager.get_selected_repository().id,
+            partial_file_name=file_name,
         )
 
         results = ""
@@ -84,8 +82,9 @@ class CodeRepositoryTool:
     def repository_structure_overview(self, include_summary: bool = False):
         """Gets the list of files and directories in a loaded code repository."""
 
-        code_files = self.conversation_manager.code_helper.get_code_files(
-            repository_id=self.conversation_manager.get_selected_repository().id
+        code_files = self.conversation_manager.code_helper.get_code_file_listing(
+            repository_id=self.conversation_manager.get_selected_repository().id,
+            include_summary=include_summary,
         )
 
         result = ""
@@ -105,21 +104,21 @@ class CodeRepositoryTool:
     )
     def codebase_analysis(self):
         """Generates a summary of the entire codebase in a loaded repository."""
-        code_files = self.conversation_manager.code_helper.get_code_files(
+        # The lines are counted by the database, so the file contents aren't transferred
+        line_counts = self.conversation_manager.code_helper.get_code_file_line_counts(
             repository_id=self.conversation_manager.get_selected_repository().id
         )
 
-        file_count = len(code_files)
+        file_count = len(line_counts)
         total_lines = 0
         file_type_breakdown = {}
 
-        for code_file in code_files:
+        for code_file_name, lines in line_counts:
             # Count lines of code
-            lines = code_file.code_file_content.count("\n") + 1
             total_lines += lines
 
             # Breakdown by file type
-            file_extension = code_file.code_file_name.split(".")[-1]
+            file_extension = code_file_name.split(".")[-1]
             if file_extension not in file_type_breakdown:
                 file_type_breakdown[file_extension] = {"count": 0, "lines": 0}
             file_type_breakdown[file_extension]["count"] += 1
@@ -152,21 +151,12 @@ class CodeRepositoryTool:
             # Clean up the folder path by removing any leading or trailing slashes, and converting backslashes to forward slashes
             folder_path = folder_path.strip().replace("\\", "/").strip("/")
 
-            if (
-                folder_path is None
-                or folder_path == ""
-                or folder_path == "/"
-                or folder_path == "\\"
-            ):
-                code_files = self.conversation_manager.code_helper.get_code_files(
-                    repository_id=repository_id
-                )
-            else:
-                code_files = (
-                    self.conversation_manager.code_helper.get_code_files_by_folder(
-                        repository_id=repository_id, folder_path=folder_path
-                    )
-                )
+            # An empty folder path lists the whole repository
+            code_files = self.conversation_manager.code_helper.get_code_file_listing(
+                repository_id=repository_id,
+                folder_path=folder_path,
+                include_summary=include_summary,
+            )
 
             if code_files is None or len(code_files) == 0:
                 return "No code files found in the specified folder."
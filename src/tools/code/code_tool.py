@@ -19,6 +19,12 @@ from src.utilities.token_helper import num_tokens_from_string
 from src.tools.code.code_dependency import CodeDependency
 from src.ai.utilities.llm_helper import get_llm
 
+# The chunk metadata type for each of get_code_structure's code_types, so only those chunks are read
+CODE_TYPE_METADATA_TYPES = {
+    "MODULE": "MODULE",
+    "FUNCTION_DECLARATION": "FUNCTION_DEFINITION",
+    "CLASS_METHOD": "CLASS_METHOD",
+}
 
 @tool_class
 class CodeTool:
@@ -63,37 +69,39 @@ class CodeTool:
         """
         documents = Documents()
 
-        # Get the list of documents
-        document_chunks = documents.get_document_chunks_by_file_id(
-            target_file_id=target_file_id,
+        # Only the MODULE chunks have the includes, and only their metadata is needed
+        module_metadata_list = documents.get_document_metadata_by_file_id(
+            target_file_id=target_file_id, metadata={"type": "MODULE"}
         )
 
         # Get the list of top-level includes
         code_dependency = CodeDependency(
-            name=document_chunks[0].document_name, dependencies=[]
+            name=module_metadata_list[0]["filename"]
+            if module_metadata_list
+            else documents.get_file(target_file_id).file_name,
+            dependencies=[],
         )
-        for doc in document_chunks:
-            if doc.additional_metadata["type"] == "MODULE":
-                # This might need to be something other than "includes" at some point
-                for include in doc.additional_metadata["includes"]:
-                    # strip the filename from the path
-                    filename = include.split("/")[-1]
-                    if (
-                        not [
-                            d
-                            for d in code_dependency.dependencies
-                            if d.name == filename
-                        ]
-                        and not filename == code_dependency.name
-                    ):
-                        file = documents.get_file_by_name(
-                            filename, self.conversation_manager.collection_id
+        for module_metadata in module_metadata_list:
+            # This might need to be something other than "includes" at some point
+            for include in module_metadata["includes"]:
+                # strip the filename from the path
+                filename = include.split("/")[-1]
+                if (
+                    not [
+                        d
+                        for d in code_dependency.dependencies
+                        if d.name == filename
+                    ]
+                    and not filename == code_dependency.name
+                ):
+                    file = documents.get_file_by_name(
+                        filename, self.conversation_manager.collection_id
+                    )
+                    if file:
+                        # Get the dependencies
+                        code_dependency.dependencies.append(
+                            self.get_dependency_graph(file.id)
                         )
-                        if file:
-                            # Get the dependencies
-                            code_dependency.dependencies.append(
-                                self.get_dependency_graph(file.id)
-                            )
 
         return code_dependency
 
@@ -140,7 +148,12 @@ class CodeTool:
             return "File is not code. Please select a code file to conduct a code review on, or use a different tool."
 
         try:
-            document_chunks = documents.get_document_chunks_by_file_id(target_file_id)
+            # Only read the metadata of the chunks of the requested type (OTHER is everything else, so that reads them all)
+            metadata_type = CODE_TYPE_METADATA_TYPES.get(code_type)
+            metadata_entries = documents.get_document_metadata_by_file_id(
+                target_file_id,
+                metadata={"type": metadata_type} if metadata_type else None,
+            )
 
             # Create a list of unique metadata entries from the document chunks
             full_metadata_list = []
@@ -155,7 +168,7 @@ class CodeTool:
                 functions,
                 class_methods,
                 others,
-                document_chunks,
+                metadata_entries,
             )
 
             # Custom sorting key function
@@ -210,11 +223,10 @@ class CodeTool:
         functions,
         class_methods,
         others,
-        document_chunks,
+        metadata_entries,
     ):
-        for doc in document_chunks:
-            if doc.additional_metadata is not None:
-                metadata = doc.additional_metadata
+        for metadata in metadata_entries:
+            if metadata is not None:
                 if metadata not in full_metadata_list:
                     full_metadata_list.append(metadata)
                     if metadata["type"] == "MODULE":
@@ -240,7 +252,9 @@ class CodeTool:
         if file_model.file_classification.lower() != "code":
             return "File is not code. Please select a code file to conduct a code review on, or use a different tool."
 
-        documents = documents_helper.get_document_chunks_by_file_id(file_id)
+        documents = documents_helper.get_document_chunks_by_file_id(
+            file_id, metadata={"type": "MODULE"}
+        )
 
         C_STUBBING_TEMPLATE = (
             self.conversation_manager.prompt_manager.get_prompt_by_template_name(
@@ -293,16 +307,15 @@ class CodeTool:
         )
 
         for doc in documents:
-            if doc.additional_metadata["type"] == "MODULE":
-                prompt = C_STUBBING_TEMPLATE.format(
-                    code=doc.document_text,
-                    stub_dependencies_template=stub_dependencies,
-                )
-                stubbed_code = llm.invoke(
-                    prompt,
-                    # # callbacks=self.conversation_manager.agent_callbacks
-                )
-                break
+            prompt = C_STUBBING_TEMPLATE.format(
+                code=doc.document_text,
+                stub_dependencies_template=stub_dependencies,
+            )
+            stubbed_code = llm.invoke(
+                prompt,
+                # # callbacks=self.conversation_manager.agent_callbacks
+            )
+            break
 
         return {
             "file": doc.document_name,
@@ -12,11 +12,6 @@ from langchain.chains import (
 )
 from langchain.schema import Document
 from langchain.chains.summarize import load_summarize_chain
-from src.ai.prompts.prompt_models.document_summary import (
-    DocumentChunkSummaryInput,
-    DocumentSummaryOutput,
-    DocumentSummaryRefineInput,
-)
 from src.ai.prompts.prompt_models.document_search import (
     DocumentSearchInput,
     DocumentSearchOutput,
@@ -41,6 +36,7 @@ from src.db.models.pgvector_retriever import PGVectorRetriever
 
 from src.ai.conversations.conversation_manager import ConversationManager
 from src.ai.utilities.llm_helper import get_llm
+from src.ai.utilities.document_enrichment import DocumentEnrichment
 import src.utilities.configuration_utilities as configuration_utilities
 
 
@@ -317,19 +313,6 @@ class DocumentTool:
 
         return result
 
-    def generate_detailed_document_chunk_summary(self, chunk_text: str, llm) -> str:
-        input_object = DocumentChunkSummaryInput(chunk_text=chunk_text)
-
-        query_helper = QueryHelper(self.conversation_manager.prompt_manager)
-        result = query_helper.query_llm(
-            llm=llm,
-            prompt_template_name="DETAILED_DOCUMENT_CHUNK_SUMMARY_TEMPLATE",
-            input_class_instance=input_object,
-            output_class_type=DocumentSummaryOutput,
-        )
-
-        return result.summary
-
     # TODO: Replace this summarize with a summarize call when ingesting documents.  Store the summary in the DB for retrieval here.
     @register_tool(
         display_name="Summarize Entire Document",
@@ -364,58 +347,9 @@ class DocumentTool:
             callbacks=self.conversation_manager.agent_callbacks,
         )
 
-        return self.summarize_entire_document_with_llm(llm, target_file_id)
-
-    def summarize_entire_document_with_llm(self, llm, target_file_id: int):
-        # Create the documents class for the retriever
-        documents = Documents()
-        file = documents.get_file(target_file_id)
-
-        # Is there a summary already?  If so, return that instead of re-running the summarization.
-        if file.file_summary and file.file_summary != "":
-            return file.file_summary
-
-        # Get the document chunks
-        document_chunks = documents.get_document_chunks_by_file_id(
-            target_file_id=target_file_id
-        )
-
-        existing_summary = "No summary yet!"
-
-        # Are there already document chunk summaries?
-        for chunk in document_chunks:
-            if not chunk.document_text_has_summary:
-                # Summarize the chunk
-                summary_chunk = self.generate_detailed_document_chunk_summary(
-                    chunk_text=chunk.document_text, llm=llm
-                )
-                documents.set_document_text_summary(
-                    chunk.id, summary_chunk, self.conversation_manager.collection_id
-                )
-
-            input_object = DocumentSummaryRefineInput(
-                text=chunk.document_text, existing_summary=existing_summary
-            )
-
-            query_helper = QueryHelper(self.conversation_manager.prompt_manager)
-
-            result = query_helper.query_llm(
-                llm=llm,
-                prompt_template_name="DOCUMENT_REFINE_TEMPLATE",
-                input_class_instance=input_object,
-                output_class_type=DocumentSummaryOutput,
-            )
-
-            existing_summary = result.summary
-
-        # Put the summary into the DB so we don't have to re-run this.
-        documents.update_file_summary_and_class(
-            file_id=file.id,
-            summary=existing_summary,
-            classification=file.file_classification,
-        )
-
-        return existing_summary
+        return DocumentEnrichment(
+            tool_model_configuration, self.conversation_manager.prompt_manager
+        ).summarize_file(target_file_id, llm=llm)
 
     def summarize_search_topic(self, query: str, original_user_query: str):
         """Useful for getting a summary of a topic or query from the user.
@@ -1,7 +1,6 @@
 import requests
 from typing import List
 from bs4 import BeautifulSoup
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 
 # Add the project root to the python path at runtime
@@ -22,6 +21,7 @@ from src.db.models.user_settings import UserSettings
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from src.utilities.token_helper import num_tokens_from_string
+from src.utilities.token_text_splitter import TokenAwareTextSplitter
 
 
 @tool_class
@@ -78,10 +78,9 @@ class WebsiteTool:
     def get_summary(self, text: str, user_query: str, max_chunk_size: int) -> str:
         """Returns a summary of the text"""
 
-        splitter = RecursiveCharacterTextSplitter(
+        splitter = TokenAwareTextSplitter(
             chunk_size=max_chunk_size,
             chunk_overlap=50,
-            length_function=num_tokens_from_string,
         )
 
         split_text = splitter.split_text(text)
@@ -172,8 +172,11 @@ def scan_repo(tab: DeltaGenerator, ai: RetrievalAugmentedGenerationAI):
         code_repo.code_repository_address, code_repo.branch_name
     )
 
-    # Unlink all of the previously scanned files, if any, from this repo
-    Code().unlink_code_files(code_repo_id)
+    # Link the files that are already stored (same path and sha) to this repo, and unlink the ones that are
+    # gone or changed, all at once- only the new or changed files need to be retrieved and processed
+    existing_files = Code().plan_repository_scan(
+        code_repo_id, [(file.path, file.sha) for file in files]
+    )
 
     with tab:
         st.info(f"Found {len(files)} files")
@@ -188,8 +191,8 @@ def scan_repo(tab: DeltaGenerator, ai: RetrievalAugmentedGenerationAI):
             temp_dir = f"/tmp/code/{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
             files = filter_and_save_files(
                 files=files,
+                existing_files=existing_files,
                 temp_dir=temp_dir,
-                code_repo_id=code_repo_id,
                 repo_address=code_repo.code_repository_address,
                 branch_name=code_repo.branch_name,
                 progress_bar=progress_bar,
@@ -238,17 +241,15 @@ def scan_repo(tab: DeltaGenerator, ai: RetrievalAugmentedGenerationAI):
 
 def filter_and_save_files(
     files,
+    existing_files,
     temp_dir,
-    code_repo_id,
     repo_address,
     branch_name,
     progress_bar,
     progress_text,
 ):
     import os
-    from src.db.models.code import Code
 
-    code_helper = Code()
     count = 0
 
     files_to_process = []
@@ -257,19 +258,11 @@ def filter_and_save_files(
         progress_text.text(f"Inspecting:\n{file.path}")
         progress_bar.progress((i + 1) / len(files))
 
-        # Skip the file if the same file (sha) has already been processed
-        existing_code_file_id = code_helper.get_code_file_id(
-            code_file_name=file.path, file_sha=file.sha
-        )
-        if existing_code_file_id:
-            # Skip saving the file, but link the code file with the code repo
-            code_helper.link_code_file_to_repo(
-                code_file_id=existing_code_file_id, code_repo_id=code_repo_id
-            )
-
+        # Skip the file if the same file (sha) has already been processed- it's already linked to the repo
+        if (file.path, file.sha) in existing_files:
             progress_text.text(f"{file.path} unchanged")
             logging.info(
-                f"The file `{file.path}` has already been processed- linking it to this repo."
+                f"The file `{file.path}` has already been processed, and is linked to this repo."
             )
 
         else:
@@ -373,14 +366,14 @@ def process_dependencies(repo_id: int, progress_bar, progress_text):
     progress_text.text(f"Processing dependencies for repo")
     progress_bar.progress(0)
 
-    # Write out the repo contents (from the database) to a temp directory
-    repo_files = code_helper.get_code_files(repo_id)
+    # Write out the repo contents (from the database) to a temp directory, streaming them so the whole repo isn't held in memory
+    repo_file_count = code_helper.get_code_file_count(repo_id)
 
     temp_dir = f"/tmp/code-deps/{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
 
     # Make sure the temp directory exists and is empty
 
-    for i, file in enumerate(repo_files):
+    for i, file in enumerate(code_helper.iterate_code_files(repo_id)):
         progress_text.text(
             f"Preparing to scan for dependencies:\n'{file.code_file_name}'"
         )
@@ -394,11 +387,12 @@ def process_dependencies(repo_id: int, progress_bar, progress_text):
         with open(file_path, "w", encoding="utf-8") as f:
             f.write(file_content)
 
-        progress_bar.progress((i + 1) / len(repo_files))
+        progress_bar.progress(min((i + 1) / max(repo_file_count, 1), 1.0))
 
     progress_bar.progress(0)
 
-    # Once all of the files are written, process the dependencies
+    # Once all of the files are written, process the dependencies (only the ids and names are needed now)
+    repo_files = code_helper.get_code_file_listing(repo_id)
     for i, file in enumerate(repo_files):
         progress_text.text(f"Scanning for dependencies:\n'{file.code_file_name}'")
         # Remove any existing dependencies for this file
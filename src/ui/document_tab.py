@@ -3,6 +3,10 @@ import streamlit as st
 from streamlit.delta_generator import DeltaGenerator
 from src.db.models.conversations import Conversations
 from src.db.models.documents import Documents
+from src.db.database.vector_index_utilities import (
+    SUPPORTED_STORAGE_TYPES,
+    VECTOR_STORAGE,
+)
 import src.ui.streamlit_shared as streamlit_shared
 from src.utilities.configuration_utilities import get_app_configuration
 
@@ -65,6 +69,22 @@ def create_documents_collection_tab(ai, tab: DeltaGenerator):
                     key="new_embedding_name",
                 )
 
+                st.number_input(
+                    "New collection embedding dimensions",
+                    min_value=0,
+                    value=0,
+                    step=256,
+                    key="new_embedding_dimensions",
+                    help="Shortens the embeddings, for models that support it (e.g. text-embedding-3-*). 0 uses the model's dimensions.",
+                )
+
+                st.selectbox(
+                    "New collection embedding storage",
+                    options=SUPPORTED_STORAGE_TYPES,
+                    key="new_embedding_storage",
+                    help="halfvec stores the embeddings at half precision, binary also searches them through a binary quantized index and rescores the results.",
+                )
+
                 st.form_submit_button(
                     "Create New Collection",
                     type="primary",
@@ -111,7 +131,13 @@ def create_collection():
         embedding_name = st.session_state.get("new_embedding_name", "Local (HF)")
 
         collection = Documents().create_collection(
-            st.session_state["new_collection_name"], embedding_name
+            st.session_state["new_collection_name"],
+            embedding_name,
+            embedding_dimensions=st.session_state.get("new_embedding_dimensions", 0)
+            or None,
+            embedding_storage=st.session_state.get(
+                "new_embedding_storage", VECTOR_STORAGE
+            ),
         )
 
         logging.info(
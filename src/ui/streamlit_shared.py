@@ -2,7 +2,6 @@ import logging
 import os
 from typing import List
 import uuid
-import asyncio
 
 import streamlit as st
 from streamlit.delta_generator import DeltaGenerator
@@ -21,6 +20,7 @@ from src.configuration.assistant_configuration import (
 
 
 from src.ai.rag_ai import RetrievalAugmentedGenerationAI
+from src.ai.utilities.enrichment_engine import EnrichmentEngine
 
 from src.utilities.configuration_utilities import (
     get_app_configuration,
@@ -29,6 +29,7 @@ from src.utilities.configuration_utilities import (
 
 from src.db.models.users import Users
 from src.db.models.documents import FileModel, DocumentModel, Documents
+from src.db.models.ingestion_jobs import IngestionJobs
 from src.db.models.conversations import Conversations
 from src.db.models.conversation_messages import ConversationMessages
 from langchain.callbacks.streamlit import StreamlitCallbackHandler
@@ -38,11 +39,20 @@ from src.ai.callbacks.streaming_only_callback import (
 
 from src.utilities.hash_utilities import calculate_sha256
 
-from src.documents.document_loader import DocumentLoader
+from src.documents.document_loader import (
+    DEFAULT_MAX_IN_FLIGHT_CHUNKS,
+    DocumentLoader,
+)
 from streamlit_extras.stylable_container import stylable_container
 
 IMAGE_TYPES = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".svg"]
 
+# The number of document chunks to embed and store together during ingestion
+DOCUMENT_STORE_BATCH_SIZE = 50
+
+# The number of chat messages to show at a time, older messages are loaded on request
+CHAT_HISTORY_PAGE_SIZE = 50
+
 
 def get_available_models():
     available_models_path = os.environ.get(
@@ -452,6 +462,9 @@ def select_documents(tab, ai=None):
             st.error("No document collection selected")
             return
 
+        if uses_background_ingestion():
+            show_ingestion_progress(active_collection_id)
+
         with st.expander("Ingestion Settings", expanded=True):
             st.radio(
                 "File type",
@@ -475,6 +488,13 @@ def select_documents(tab, ai=None):
                 value=False,
             )
 
+            st.toggle(
+                "Only update changed chunks",
+                help="When a file that already exists has changed, only the chunks of text that changed are summarized and embedded again- the rest are kept as they are.",
+                key="incremental_update",
+                value=False,
+            )
+
             st.toggle(
                 "Create Chunk Summary and Questions",
                 help="This will create a summary, and hypothetical questions for each chunk of text in the document, which will GREATLY aid in later retrievals.",
@@ -544,9 +564,14 @@ def select_documents(tab, ai=None):
                 disabled=(active_collection_id == None or active_collection_id == "-1"),
             )
 
-            st.markdown(
-                "*⚠️ Currently there is no async/queued file ingestion. Do not navigate away from this page, or click on anything else, while the files are being ingested.*"
-            )
+            if uses_background_ingestion():
+                st.markdown(
+                    "*Files are ingested in the background, you can keep using Jarvis while they are processed.*"
+                )
+            else:
+                st.markdown(
+                    "*⚠️ Currently there is no async/queued file ingestion. Do not navigate away from this page, or click on anything else, while the files are being ingested.*"
+                )
 
             status = st.status(f"Ready to ingest", expanded=False, state="complete")
 
@@ -576,6 +601,9 @@ def select_documents(tab, ai=None):
                                 st.session_state.get("file_chunk_overlap", 50)
                             ),
                             ai=ai,
+                            incremental_update=st.session_state.get(
+                                "incremental_update", False
+                            ),
                         )
 
 
@@ -590,12 +618,28 @@ def ingest_files(
     chunk_size,
     chunk_overlap,
     ai=None,
+    incremental_update=False,
 ):
-    """Ingests the uploaded files into the specified collection"""
+    """Ingests the uploaded files into the specified collection.
+
+    With incremental_update, a changed file that already exists keeps the chunks whose text hasn't changed.
+    """
 
     documents_helper = Documents()
     document_loader = DocumentLoader()
-    documents = None
+    max_in_flight_chunks = (
+        get_app_configuration()["jarvis_ai"]
+        .get("document_ingestion", {})
+        .get("max_in_flight_chunks", DEFAULT_MAX_IN_FLIGHT_CHUNKS)
+    )
+
+    is_code = st.session_state.ingestion_settings.file_type == "Code"
+
+    # The existing files being re-ingested in place
+    incremental_file_ids = set()
+
+    # Resumed files are split with their own (original) settings: file name -> split settings
+    resumed_split_settings = {}
 
     if not active_collection_id:
         st.error("No collection selected")
@@ -645,6 +689,32 @@ def ingest_files(
                     file_name, active_collection_id
                 )
 
+                if existing_file and incremental_update:
+                    uploaded_file_hash = calculate_sha256(uploaded_file_path)
+
+                    if existing_file.file_hash != uploaded_file_hash:
+                        st.info(
+                            f"File '{file_name}' has changed, only the changed chunks will be updated..."
+                        )
+                        logging.info(
+                            f"File '{file_name}' has changed, only the changed chunks will be updated..."
+                        )
+
+                        with open(uploaded_file_path, "rb") as file:
+                            file_data = file.read()
+
+                        files.append(
+                            documents_helper.update_file_content(
+                                existing_file.id,
+                                uploaded_file_hash,
+                                file_data,
+                                chunk_size,
+                                chunk_overlap,
+                            )
+                        )
+                        incremental_file_ids.add(existing_file.id)
+                        continue
+
                 if existing_file and not overwrite_existing_files:
                     # See if the hash on this file matches the one we have stored
                     if existing_file.file_hash == calculate_sha256(uploaded_file_path):
@@ -669,32 +739,26 @@ def ingest_files(
 
                         # TODO: Fix all of this- it's a total inefficient mess, the document ingestion needs to be completely re-written
 
-                        # Split the document
-                        documents = asyncio.run(
-                            document_loader.load_and_split_documents(
-                                document_directory=root_temp_dir,
-                                split_documents=split_documents,
-                                is_code=existing_file.file_classification == "Code",
-                                chunk_size=existing_file.chunk_size,
-                                chunk_overlap=existing_file.chunk_overlap,
-                            )
+                        # Split just this file using the existing file's settings, and count its chunks
+                        existing_split_settings = {
+                            "is_code": existing_file.file_classification == "Code",
+                            "chunk_size": existing_file.chunk_size,
+                            "chunk_overlap": existing_file.chunk_overlap,
+                        }
+                        matching_document_count = document_loader.count_split_documents(
+                            uploaded_file_path,
+                            split_documents=split_documents,
+                            **existing_split_settings,
                         )
 
-                        # Get the documents that match this file name
-                        matching_documents = [
-                            d
-                            for d in documents
-                            if d.metadata["filename"]
-                            .replace(root_temp_dir, "")
-                            .strip("/")
-                            == file_name
-                        ]
-
                         if (
-                            len(matching_documents) == existing_file.document_count
+                            matching_document_count == existing_file.document_count
                             or existing_file.document_count == 0
                         ):
+                            # Keep the uploaded file, so it's streamed again (with the same settings) when the chunks are saved
+                            resumed_split_settings[file_name] = existing_split_settings
                             files.append(existing_file)
+                            continue
                         else:
                             st.error(
                                 f"File '{file_name}' already exists, and the hash matches, but the number of documents in the file has changed.  Please delete the file and try again."
@@ -756,6 +820,23 @@ def ingest_files(
                     )
                     files.append(file_model)
 
+            if files and uses_background_ingestion():
+                queue_background_ingestion(
+                    files,
+                    split_documents=split_documents,
+                    create_summary_and_chunk_questions=create_summary_and_chunk_questions,
+                    summarize_document=summarize_document,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    incremental_update=incremental_update,
+                )
+                ingest_progress_bar.empty()
+                status.update(
+                    label=f"✅ Queued {len(files)} files for ingestion",
+                    state="complete",
+                )
+                return
+
             if not files or len(files) == 0:
                 st.warning("Nothing to split... bye!")
                 logging.warning("No files to ingest")
@@ -769,35 +850,7 @@ def ingest_files(
             st.info("Splitting documents...")
             logging.info("Splitting documents...")
 
-            is_code = st.session_state.ingestion_settings.file_type == "Code"
-
-            # Pass the root temp dir to the ingestion function
-            # if we've already split the docs, don't do it again
-            if not documents:
-                documents = asyncio.run(
-                    document_loader.load_and_split_documents(
-                        document_directory=root_temp_dir,
-                        split_documents=split_documents,
-                        is_code=is_code,
-                        chunk_size=chunk_size,
-                        chunk_overlap=chunk_overlap,
-                    )
-                )
-
-            if documents == None:
-                st.warning(
-                    f"No documents could be extracted from these files.  Possible images detected..."
-                )
-                st.success(f"Completed ingesting {len(files)} files")
-                status.update(
-                    label=f"✅ Ingestion complete",
-                    state="complete",
-                )
-                logging.info(
-                    f"No documents could be extracted from these files.  Possible images detected..."
-                )
-                return
-
+            # The chunks are saved as the files are parsed, with at most max_in_flight_chunks held in memory
             save_split_documents(
                 active_collection_id,
                 status,
@@ -806,15 +859,79 @@ def ingest_files(
                 ai,
                 documents_helper,
                 ingest_progress_bar,
-                root_temp_dir,
                 files,
-                documents,
+                incremental_file_ids,
+                document_loader.stream_split_documents(
+                    document_directory=root_temp_dir,
+                    split_documents=split_documents,
+                    is_code=is_code,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    max_in_flight_chunks=max_in_flight_chunks,
+                    file_split_settings=resumed_split_settings,
+                ),
             )
 
     # Done!
     st.balloons()
 
 
+def uses_background_ingestion() -> bool:
+    return (
+        get_app_configuration()["jarvis_ai"]
+        .get("document_ingestion", {})
+        .get("use_background_workers", False)
+    )
+
+
+def queue_background_ingestion(
+    files: List[FileModel],
+    split_documents,
+    create_summary_and_chunk_questions,
+    summarize_document,
+    chunk_size,
+    chunk_overlap,
+    incremental_update=False,
+):
+    # Imported here so the UI only needs celery when the background workers are used
+    from src.services.documents.document_ingestion_tasks import queue_file_ingestion
+
+    ingestion_settings = {
+        "split_documents": split_documents,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "create_summary_and_chunk_questions": create_summary_and_chunk_questions,
+        "summarize_document": summarize_document,
+        "incremental_update": incremental_update,
+    }
+
+    for file in files:
+        logging.info(f"Queueing '{file.file_name}' for ingestion...")
+        queue_file_ingestion(file.id, ingestion_settings)
+
+
+def show_ingestion_progress(collection_id):
+    """Shows the progress of the files in the collection that are being ingested in the background"""
+    jobs = IngestionJobs().get_jobs_for_collection(collection_id)
+
+    if not jobs:
+        return
+
+    files = {
+        file.id: file.file_name
+        for file in Documents().get_files_in_collection(collection_id)
+    }
+
+    with st.expander(f"Ingesting {len(jobs)} files", expanded=True):
+        for job in jobs:
+            st.progress(
+                job.progress,
+                text=f"{files.get(job.file_id, job.file_id)}: {job.status.value} ({job.stored_chunks} of {job.total_chunks if job.total_chunks is not None else '?'} chunks)",
+            )
+
+        st.button("Refresh", key="refresh_ingestion_progress")
+
+
 def save_split_documents(
     active_collection_id,
     status,
@@ -823,159 +940,172 @@ def save_split_documents(
     ai,
     documents_helper,
     ingest_progress_bar,
-    root_temp_dir,
     files: List[FileModel],
-    documents,
+    incremental_file_ids: set,
+    document_stream,
 ):
-    document_chunk_length = len(documents)
-    st.info(f"Saving {document_chunk_length} document chunks...")
-    logging.info(f"Saving {document_chunk_length} document chunks...")
+    """Saves the (file name, chunk index, chunk) tuples from DocumentLoader.stream_split_documents,
+    storing each file's chunks in batches while the rest of the files are still being parsed.
 
-    # Update the document counts on the files- this will help if we have to resume
-    file_to_chunk_count = {}
-    for file in files:
-        if file.document_count == 0:
-            # Get the count of documents matching the file name
-            document_count = len(
-                [
-                    d
-                    for d in documents
-                    if d.metadata["filename"].replace(root_temp_dir, "").strip("/")
-                    == file.file_name
-                ]
-            )
-            file.document_count = document_count
-            documents_helper.update_document_count(file.id, document_count)
+    For the files in incremental_file_ids, the stored chunks with the same text are kept instead of
+    being stored again, and the stored chunks that are no longer in the file are deleted- once all of
+    the file's chunks have been streamed, the same way the background ingestion does.
+    """
+    st.info(f"Saving document chunks from {len(files)} files...")
+    logging.info(f"Saving document chunks from {len(files)} files...")
 
-        # Get the number of documents already in the DB for this file
-        current_document_count = documents_helper.get_document_chunk_count_by_file_id(
-            file.id
-        )
+    enrichment_engine = (
+        ai.create_enrichment_engine()
+        if hasattr(ai, "create_enrichment_engine")
+        else EnrichmentEngine()
+    )
 
-        file_to_chunk_count[file.file_name] = {
-            "current_document_count": current_document_count,
-            "total_document_count": file.document_count,
-        }
+    files_by_name = {file.file_name: file for file in files}
+    file_positions = {file.file_name: index for index, file in enumerate(files)}
 
-    # Since this is all fucked up, and the documents are all in one list (multiple files in the same list)
-    # I need to split this out into multiple lists, each associated with a single file
-    file_documents = {}
-    for document in documents:
-        # Get the file name without the root_temp_dir (preserving any subdirectories)
-        file_name = document.metadata["filename"].replace(root_temp_dir, "").strip("/")
+    # Get the number of documents already in the DB for each file- the chunks come out in the
+    # same order every time, so if we're resuming, those are the first chunks for the file
+    stored_chunk_counts = {
+        file.file_name: (
+            documents_helper.get_document_chunk_count_by_file_id(file.id)
+            if file.id not in incremental_file_ids
+            else 0
+        )
+        for file in files
+    }
+    kept_chunk_count = 0
 
-        if file_name in file_documents:
-            doc_list = file_documents[file_name]
-        else:
-            doc_list = []
+    embedding_model_name = documents_helper.get_collection_embedding_model_name(
+        active_collection_id
+    )
+    streamed_chunk_counts = {}
+    # (chunk index, chunk) to store in the next batch
+    pending_file = None
+    pending_chunks = []
+    # (chunk index, chunk) of the file being updated in place, until all of its chunks are known
+    incremental_file = None
+    incremental_chunks = []
 
-        doc_list.append(document)
-        file_documents[file_name] = doc_list
-
-    # For each file, loop through the documents
-    current_chunk = 0
-    for file in files:
-        logging.info(
-            f"Processing {len(file_documents[file.file_name]) if file.file_name in file_documents else 0} chunks for {file.file_name}"
-        )
+    for file_name, chunk_index, chunk in document_stream:
+        file = files_by_name.get(file_name)
 
         if not file:
-            st.error(
-                f"Could not find file '{file_name}' in the database after uploading"
+            # Not one of the files we're ingesting (e.g. it already exists)
+            continue
+
+        # Store the chunks in batches (one file at a time), so the embeddings are requested together
+        if pending_chunks and (
+            pending_file is not file or len(pending_chunks) >= DOCUMENT_STORE_BATCH_SIZE
+        ):
+            _store_chunk_batch(
+                active_collection_id,
+                pending_file,
+                pending_chunks,
+                create_summary_and_chunk_questions,
+                ai,
+                enrichment_engine,
+                documents_helper,
+                embedding_model_name,
             )
-            logging.error(
-                f"Could not find file '{file_name}' in the database after uploading"
+            pending_chunks = []
+
+        if incremental_chunks and incremental_file is not file:
+            kept_chunk_count += _store_incremental_file_chunks(
+                active_collection_id,
+                incremental_file,
+                incremental_chunks,
+                create_summary_and_chunk_questions,
+                ai,
+                enrichment_engine,
+                documents_helper,
+                embedding_model_name,
             )
-            break
+            incremental_chunks = []
 
-        current_document_count = file_to_chunk_count[file.file_name][
-            "current_document_count"
-        ]
+        streamed_chunk_counts[file_name] = chunk_index + 1
 
-        file_doc_chunk_len = (
-            len(file_documents[file.file_name])
-            if file.file_name in file_documents
-            else 0
+        # TODO: Fix the progress bar
+        ingest_progress_bar.progress(
+            calculate_progress(len(files), file_positions[file_name] + 1),
+            text=f"Processing {file_name} chunk {chunk_index + 1}",
         )
-        for index in range(current_document_count, file_doc_chunk_len):
-            # TODO: Fix the progress bar
-            ingest_progress_bar.progress(
-                calculate_progress(file_doc_chunk_len, index + 1),
-                text=f"Processing {file.file_name} chunk {index + 1} of {file_doc_chunk_len}",
-            )
 
-            document = file_documents[file.file_name][index]
+        if file.id in incremental_file_ids:
+            incremental_file = file
+            incremental_chunks.append((chunk_index, chunk))
+            continue
+
+        if chunk_index < stored_chunk_counts[file_name]:
+            # Already stored
+            continue
+
+        pending_file = file
+        pending_chunks.append((chunk_index, chunk))
+
+    if pending_chunks:
+        _store_chunk_batch(
+            active_collection_id,
+            pending_file,
+            pending_chunks,
+            create_summary_and_chunk_questions,
+            ai,
+            enrichment_engine,
+            documents_helper,
+            embedding_model_name,
+        )
 
-            summary_and_chunk_questions = None
-            if create_summary_and_chunk_questions and hasattr(
-                ai, "create_summary_and_chunk_questions"
-            ):
-                try:
-                    logging.info("Creating summary and questions for chunk...")
-                    summary_and_chunk_questions = ai.create_summary_and_chunk_questions(
-                        text=document.page_content
-                    )
-                except Exception as e:
-                    logging.error(f"Error creating questions for chunk: {e}")
-
-                # Create the document chunks
-            logging.info(f"Inserting document chunk for file '{file_name}'...")
-            documents_helper.store_document(
-                DocumentModel(
-                    collection_id=active_collection_id,
-                    file_id=file.id,
-                    user_id=st.session_state.user_id,
-                    document_text=document.page_content,
-                    document_text_summary=summary_and_chunk_questions.summary if summary_and_chunk_questions else "",
-                    document_text_has_summary=summary_and_chunk_questions.summary != "" if summary_and_chunk_questions else False,
-                    additional_metadata=document.metadata,
-                    document_name=document.metadata["filename"],
-                    embedding_model_name=get_selected_collection_embedding_model_name(),
-                    question_1=(
-                        summary_and_chunk_questions.questions[0]
-                        if summary_and_chunk_questions
-                        and len(summary_and_chunk_questions.questions) > 0
-                        else ""
-                    ),
-                    question_2=(
-                        summary_and_chunk_questions.questions[1]
-                        if summary_and_chunk_questions
-                        and len(summary_and_chunk_questions.questions) > 1
-                        else ""
-                    ),
-                    question_3=(
-                        summary_and_chunk_questions.questions[2]
-                        if summary_and_chunk_questions
-                        and len(summary_and_chunk_questions.questions) > 2
-                        else ""
-                    ),
-                    question_4=(
-                        summary_and_chunk_questions.questions[3]
-                        if summary_and_chunk_questions
-                        and len(summary_and_chunk_questions.questions) > 3
-                        else ""
-                    ),
-                    question_5=(
-                        summary_and_chunk_questions.questions[4]
-                        if summary_and_chunk_questions
-                        and len(summary_and_chunk_questions.questions) > 4
-                        else ""
-                    ),
-                )
-            )
+    if incremental_chunks:
+        kept_chunk_count += _store_incremental_file_chunks(
+            active_collection_id,
+            incremental_file,
+            incremental_chunks,
+            create_summary_and_chunk_questions,
+            ai,
+            enrichment_engine,
+            documents_helper,
+            embedding_model_name,
+        )
+
+    if kept_chunk_count:
+        st.info(f"Kept {kept_chunk_count} unchanged document chunks")
+        logging.info(f"Kept {kept_chunk_count} unchanged document chunks")
+
+    # Update the document counts on the files- this will help if we have to resume
+    for file in files:
+        if file.document_count == 0 and file.file_name in streamed_chunk_counts:
+            file.document_count = streamed_chunk_counts[file.file_name]
+            documents_helper.update_document_count(file.id, file.document_count)
+
+    total_chunks = sum(streamed_chunk_counts.values())
+    if total_chunks == 0:
+        st.warning(
+            f"No documents could be extracted from these files.  Possible images detected..."
+        )
+        logging.info(
+            f"No documents could be extracted from these files.  Possible images detected..."
+        )
+        status.update(
+            label=f"✅ Ingestion complete",
+            state="complete",
+        )
+        ingest_progress_bar.empty()
+        return
 
     if summarize_document and hasattr(ai, "generate_detailed_document_summary"):
+        # One file at a time- each summary already creates its chunk summaries concurrently with its own engine
         for file in files:
-            # Note: this generates a summary and also puts it into the DB
-            ai.generate_detailed_document_summary(file_id=file.id)
-
-            logging.info(f"Created a summary of file: '{file.file_name}'")
+            try:
+                # Note: this generates a summary and also puts it into the DB
+                ai.generate_detailed_document_summary(file_id=file.id)
+                logging.info(f"Created a summary of file: '{file.file_name}'")
+            except Exception as e:
+                logging.error(f"Error creating a summary of file '{file.file_name}': {e}")
 
     st.success(
-        f"Successfully ingested {len(documents)} document chunks from {len(files)} files"
+        f"Successfully ingested {total_chunks} document chunks from {len(files)} files"
     )
     logging.info(
-        f"Successfully ingested {len(documents)} document chunks from {len(files)} files"
+        f"Successfully ingested {total_chunks} document chunks from {len(files)} files"
     )
     status.update(
         label=f"✅ Ingestion complete",
@@ -985,6 +1115,128 @@ def save_split_documents(
     ingest_progress_bar.empty()
 
 
+def _store_incremental_file_chunks(
+    active_collection_id,
+    file: FileModel,
+    chunks,
+    create_summary_and_chunk_questions,
+    ai,
+    enrichment_engine: EnrichmentEngine,
+    documents_helper: Documents,
+    embedding_model_name,
+) -> int:
+    """Keeps the unchanged chunks of a file being updated in place, and stores the rest. Returns the number kept."""
+    kept_chunk_indexes = documents_helper.keep_unchanged_document_chunks(
+        file.id, {chunk_index: chunk.page_content for chunk_index, chunk in chunks}
+    )
+    changed_chunks = [
+        (chunk_index, chunk)
+        for chunk_index, chunk in chunks
+        if chunk_index not in kept_chunk_indexes
+    ]
+
+    logging.info(
+        f"Keeping {len(kept_chunk_indexes)} unchanged chunks of {len(chunks)} for file '{file.file_name}'"
+    )
+
+    for start in range(0, len(changed_chunks), DOCUMENT_STORE_BATCH_SIZE):
+        _store_chunk_batch(
+            active_collection_id,
+            file,
+            changed_chunks[start : start + DOCUMENT_STORE_BATCH_SIZE],
+            create_summary_and_chunk_questions,
+            ai,
+            enrichment_engine,
+            documents_helper,
+            embedding_model_name,
+        )
+
+    return len(kept_chunk_indexes)
+
+
+def _store_chunk_batch(
+    active_collection_id,
+    file: FileModel,
+    batch,
+    create_summary_and_chunk_questions,
+    ai,
+    enrichment_engine: EnrichmentEngine,
+    documents_helper: Documents,
+    embedding_model_name,
+):
+    """Stores a batch of (chunk index, chunk) for a file"""
+    summaries_and_chunk_questions = [None] * len(batch)
+    if create_summary_and_chunk_questions and hasattr(
+        ai, "create_summary_and_chunk_questions"
+    ):
+        logging.info(f"Creating summary and questions for {len(batch)} chunks...")
+        # The chunks are independent, so the LLM calls run concurrently (rate limited per model)
+        results = enrichment_engine.map(
+            lambda c: ai.create_summary_and_chunk_questions(text=c[1].page_content),
+            batch,
+            estimate_tokens=lambda c: enrichment_engine.estimate_tokens(
+                c[1].page_content
+            ),
+            return_exceptions=True,
+        )
+
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                logging.error(f"Error creating questions for chunk: {result}")
+            else:
+                summaries_and_chunk_questions[index] = result
+
+    pending_documents = [
+        _create_chunk_document_model(
+            active_collection_id,
+            file,
+            chunk_index,
+            document,
+            embedding_model_name,
+            summary_and_chunk_questions,
+        )
+        for (chunk_index, document), summary_and_chunk_questions in zip(
+            batch, summaries_and_chunk_questions
+        )
+    ]
+
+    logging.info(
+        f"Inserting {len(pending_documents)} document chunks for file '{file.file_name}'..."
+    )
+    documents_helper.store_documents(pending_documents)
+
+
+def _create_chunk_document_model(
+    active_collection_id,
+    file: FileModel,
+    chunk_index: int,
+    document,
+    embedding_model_name,
+    summary_and_chunk_questions,
+) -> DocumentModel:
+    questions = (
+        summary_and_chunk_questions.questions if summary_and_chunk_questions else []
+    )
+
+    return DocumentModel(
+        collection_id=active_collection_id,
+        file_id=file.id,
+        user_id=st.session_state.user_id,
+        document_text=document.page_content,
+        document_text_summary=summary_and_chunk_questions.summary if summary_and_chunk_questions else "",
+        document_text_has_summary=summary_and_chunk_questions.summary != "" if summary_and_chunk_questions else False,
+        additional_metadata=document.metadata,
+        document_name=document.metadata["filename"],
+        embedding_model_name=embedding_model_name,
+        question_1=questions[0] if len(questions) > 0 else "",
+        question_2=questions[1] if len(questions) > 1 else "",
+        question_3=questions[2] if len(questions) > 2 else "",
+        question_4=questions[3] if len(questions) > 3 else "",
+        question_5=questions[4] if len(questions) > 4 else "",
+        chunk_index=chunk_index,
+    )
+
+
 def calculate_progress(total_size, current_position):
     """
     Calculate progress as a percentage within the range of 0-100.
@@ -1075,23 +1327,43 @@ def create_documents_and_code_collections(ai):
 
 
 def refresh_messages_session_state(ai_instance):
-    """Pulls the messages from the token buffer on the AI for the first time, and put them into the session state"""
+    """Pulls the latest messages from the AI's chat history, and puts them into the session state"""
 
-    entire_chat_history = (
-        ai_instance.conversation_manager.conversation_token_buffer_memory.chat_memory.messages
+    chat_memory = (
+        ai_instance.conversation_manager.conversation_token_buffer_memory.chat_memory
     )
 
-    messages_in_memory = (
-        ai_instance.conversation_manager.conversation_token_buffer_memory.buffer_as_messages
+    # Page back through the conversation until we have as many messages as we're showing
+    message_limit = st.session_state.get(
+        "chat_history_message_limit", CHAT_HISTORY_PAGE_SIZE
+    )
+    displayed_chat_history = []
+    for message in chat_memory.iter_messages_newest_first(
+        page_size=CHAT_HISTORY_PAGE_SIZE
+    ):
+        if len(displayed_chat_history) == message_limit:
+            break
+
+        displayed_chat_history.append(message)
+    else:
+        # Ran out of messages before hitting the limit
+        message_limit = None
+
+    displayed_chat_history.reverse()
+    st.session_state["has_earlier_messages"] = message_limit is not None
+
+    ids_in_memory = set(
+        message.additional_kwargs["id"]
+        for message in ai_instance.conversation_manager.conversation_token_buffer_memory.buffer_as_messages
     )
 
     logging.info(
-        f"Counts for --- `messages_in_memory`: {str(len(messages_in_memory))}, `entire_chat_history`: {str(len(entire_chat_history))}"
+        f"Counts for --- `messages_in_memory`: {str(len(ids_in_memory))}, `displayed_chat_history`: {str(len(displayed_chat_history))}"
     )
 
     st.session_state["messages"] = []
 
-    for message in entire_chat_history:
+    for message in displayed_chat_history:
         if "messages" in st.session_state:  # Why streamlit, why???
             if message.type == "human":
                 st.session_state["messages"].append(
@@ -1100,7 +1372,8 @@ def refresh_messages_session_state(ai_instance):
                         "content": message.content,
                         "avatar": "🗣️",
                         "id": message.additional_kwargs["id"],
-                        "in_memory": message in messages_in_memory,
+                        "in_memory": message.additional_kwargs["id"]
+                        in ids_in_memory,
                     }
                 )
             else:
@@ -1110,14 +1383,30 @@ def refresh_messages_session_state(ai_instance):
                         "content": message.content,
                         "avatar": "🤖",
                         "id": message.additional_kwargs["id"],
-                        "in_memory": message in messages_in_memory,
+                        "in_memory": message.additional_kwargs["id"]
+                        in ids_in_memory,
                     }
                 )
 
 
+def show_earlier_messages():
+    st.session_state["chat_history_message_limit"] = (
+        st.session_state.get("chat_history_message_limit", CHAT_HISTORY_PAGE_SIZE)
+        + CHAT_HISTORY_PAGE_SIZE
+    )
+
+
 def show_old_messages(ai_instance):
     refresh_messages_session_state(ai_instance)
 
+    if st.session_state.get("has_earlier_messages", False):
+        st.button(
+            "Show earlier messages",
+            help="Load the previous page of messages in this conversation",
+            on_click=show_earlier_messages,
+            key="show_earlier_messages",
+        )
+
     if "messages" in st.session_state:
         for message in st.session_state["messages"]:
             with st.chat_message(message["role"], avatar=message["avatar"]):
@@ -1,4 +1,6 @@
 import os
+import threading
+
 from src.configuration.assistant_configuration import ApplicationConfigurationLoader
 from src.configuration.voice_configuration import VoiceConfiguration
 
@@ -27,11 +29,80 @@ def get_voice_config_path():
     return voice_config_path
 
 
-def get_app_configuration():
-    """Loads the configuration from the path"""
+class AppConfiguration:
+    """A parsed app configuration, with the lookups that are needed on hot paths precomputed"""
+
+    def __init__(self, path: str, file_version: tuple, data: dict):
+        self.path = path
+        # (mtime, size) of the file this was loaded from
+        self.file_version = file_version
+        self.data = data
+
+        embedding_models = data.get("jarvis_ai", {}).get("embedding_models", {})
+
+        # Model name -> the key in "available", e.g. "OpenAI: text-embedding-3-small"
+        self.embedding_model_keys = {}
+        for key, model_name in embedding_models.get("available", {}).items():
+            self.embedding_model_keys.setdefault(model_name, key)
+
+        # Model name -> dimensions, for every configured model
+        self.embedding_model_dimensions = {
+            model_name: model_config["dimensions"]
+            for model_name, model_config in embedding_models.items()
+            if model_name != "available"
+            and isinstance(model_config, dict)
+            and "dimensions" in model_config
+        }
+
+
+_app_configuration: AppConfiguration = None
+_app_configuration_lock = threading.Lock()
+
+
+def _get_file_version(path: str) -> tuple:
+    stat = os.stat(path)
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_app_configuration_state() -> AppConfiguration:
+    """Gets the app configuration, which is only parsed again when the file (or APP_CONFIG_PATH) changes"""
+    global _app_configuration
+
     app_config_path = get_app_config_path()
+    file_version = _get_file_version(app_config_path)
+
+    configuration = _app_configuration
+    if (
+        configuration is not None
+        and configuration.path == app_config_path
+        and configuration.file_version == file_version
+    ):
+        return configuration
+
+    with _app_configuration_lock:
+        configuration = _app_configuration
+        if (
+            configuration is None
+            or configuration.path != app_config_path
+            or configuration.file_version != file_version
+        ):
+            configuration = AppConfiguration(
+                path=app_config_path,
+                file_version=file_version,
+                data=ApplicationConfigurationLoader.from_file(app_config_path),
+            )
+            _app_configuration = configuration
+
+        return configuration
+
+
+def get_app_configuration():
+    """Loads the configuration from the path.
 
-    return ApplicationConfigurationLoader.from_file(app_config_path)
+    The configuration is shared by everything in the process, so treat it as read-only (copy anything you need to change).
+    """
+    return get_app_configuration_state().data
 
 def get_voice_configuration():
     """Loads the configuration from the path"""
@@ -1,4 +1,5 @@
 import hashlib
+import re
 
 def calculate_sha256(file_path):
     sha256_hash = hashlib.sha256()
@@ -6,4 +7,11 @@ def calculate_sha256(file_path):
         # Read the file in chunks for efficiency
         for chunk in iter(lambda: file.read(4096), b""):
             sha256_hash.update(chunk)
-    return sha256_hash.hexdigest()
\ No newline at end of file
+    return sha256_hash.hexdigest()
+
+
+def calculate_text_hash(text: str) -> str:
+    """Hashes text after normalizing it, so that whitespace-only changes (e.g. from re-extracting a PDF) don't change the hash"""
+    normalized_text = re.sub(r"\s+", " ", (text or "").replace("\00", "")).strip()
+
+    return hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
@@ -0,0 +1,339 @@
+import abc
+import logging
+import os
+import threading
+from typing import Callable, Tuple
+
+import numpy as np
+
+# In-process nearest neighbour search, as an alternative to pgvector's indexes.
+# Small indexes are searched by brute force (one matrix multiply), and once an index has hnsw_threshold
+# embeddings an HNSW graph is built for it- if hnswlib is installed, otherwise it stays brute force.
+# Indexes are saved as .npy files (and the HNSW graph), which are memory-mapped when they are loaded.
+# Removed (and replaced) embeddings are only marked as deleted, and the arrays are compacted once too many
+# of their rows are deleted, so removing a few embeddings doesn't copy the whole index.
+
+# Filters the search to the ids in an array that it returns True for
+IdFilter = Callable[[np.ndarray], np.ndarray]
+
+DEFAULT_HNSW_THRESHOLD = 50000
+DEFAULT_HNSW_M = 16
+DEFAULT_HNSW_EF_CONSTRUCTION = 200
+DEFAULT_HNSW_EF_SEARCH = 100
+
+# When the HNSW graph's results are filtered, it's asked for this many times the results needed
+HNSW_FILTER_OVERFETCH = 4
+
+# The arrays are compacted when more than this fraction of their rows are deleted
+MAX_DELETED_FRACTION = 0.25
+
+EMBEDDINGS_FILE_NAME = "embeddings.npy"
+IDS_FILE_NAME = "ids.npy"
+HNSW_FILE_NAME = "hnsw.bin"
+
+
+class VectorIndex(abc.ABC):
+    """Nearest neighbour search, by cosine distance, over embeddings that each have an integer id"""
+
+    @abc.abstractmethod
+    def add(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Adds the embeddings, replacing any that already have the same ids"""
+
+    @abc.abstractmethod
+    def remove(self, ids: np.ndarray) -> None:
+        """Removes the embeddings with the given ids"""
+
+    @abc.abstractmethod
+    def search(
+        self, embedding: np.ndarray, top_k: int, id_filter: IdFilter = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Gets the ids and cosine distances of the top_k nearest embeddings, nearest first"""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+    return embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+class NumpyVectorIndex(VectorIndex):
+    """A VectorIndex held in (or memory-mapped into) memory, searched by brute force or an HNSW graph"""
+
+    def __init__(
+        self,
+        dimensions: int,
+        hnsw_threshold: int = DEFAULT_HNSW_THRESHOLD,
+        hnsw_m: int = DEFAULT_HNSW_M,
+        hnsw_ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION,
+        hnsw_ef_search: int = DEFAULT_HNSW_EF_SEARCH,
+    ):
+        self.dimensions = dimensions
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+
+        # The first _count rows are in use- the arrays grow by doubling, so adding is amortized by the batch.
+        # _deleted marks the rows that were removed, until the arrays are compacted.
+        self._embeddings = np.zeros((0, dimensions), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._deleted = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._deleted_count = 0
+        self._hnsw = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._count - self._deleted_count
+
+    @property
+    def ids(self) -> np.ndarray:
+        if self._deleted_count == 0:
+            return self._ids[: self._count]
+
+        return self._ids[: self._count][~self._deleted[: self._count]]
+
+    def add(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+
+        embeddings = _normalize(embeddings).reshape(len(ids), self.dimensions)
+
+        with self._lock:
+            self.remove(ids)
+            self._reserve(self._count + len(ids))
+
+            self._embeddings[self._count : self._count + len(ids)] = embeddings
+            self._ids[self._count : self._count + len(ids)] = ids
+            self._deleted[self._count : self._count + len(ids)] = False
+            self._count += len(ids)
+
+            if self._hnsw is not None:
+                self._add_to_hnsw(ids, embeddings)
+            elif len(self) >= self.hnsw_threshold:
+                self._build_hnsw()
+
+    def remove(self, ids: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0 or len(self) == 0:
+            return
+
+        with self._lock:
+            removed = np.isin(self._ids[: self._count], ids)
+            removed &= ~self._deleted[: self._count]
+            if not removed.any():
+                return
+
+            if self._hnsw is not None:
+                for removed_id in self._ids[: self._count][removed]:
+                    self._hnsw.mark_deleted(int(removed_id))
+
+            # The rows stay where they are until there are enough of them to compact
+            self._deleted[: self._count] |= removed
+            self._deleted_count += int(removed.sum())
+
+            if self._deleted_count > self._count * MAX_DELETED_FRACTION:
+                self._compact()
+
+    def search(
+        self, embedding: np.ndarray, top_k: int, id_filter: IdFilter = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if len(self) == 0 or top_k <= 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+            query = _normalize(embedding).reshape(self.dimensions)
+
+            if self._hnsw is not None:
+                result = self._search_hnsw(query, top_k, id_filter)
+                if result is not None:
+                    return result
+
+            return self._search_brute_force(query, top_k, id_filter)
+
+    def _search_brute_force(
+        self, query: np.ndarray, top_k: int, id_filter: IdFilter
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        embeddings = self._embeddings[: self._count]
+        ids = self._ids[: self._count]
+
+        if self._deleted_count > 0 or id_filter is not None:
+            rows = np.flatnonzero(~self._deleted[: self._count])
+            if id_filter is not None:
+                rows = rows[id_filter(ids[rows])]
+
+            embeddings = embeddings[rows]
+            ids = ids[rows]
+
+        if len(ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # The embeddings are normalized, so this is the cosine distance
+        distances = 1.0 - embeddings @ query
+
+        top_k = min(top_k, len(ids))
+        nearest = np.argpartition(distances, top_k - 1)[:top_k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return ids[nearest], distances[nearest]
+
+    def _search_hnsw(self, query: np.ndarray, top_k: int, id_filter: IdFilter):
+        """Searches the HNSW graph, or returns None if the filter leaves too few results (search by brute force instead)"""
+        k = top_k * HNSW_FILTER_OVERFETCH if id_filter is not None else top_k
+        k = min(k, len(self))
+
+        self._hnsw.set_ef(max(self.hnsw_ef_search, k))
+        labels, distances = self._hnsw.knn_query(query, k=k)
+        labels = labels[0].astype(np.int64)
+        distances = distances[0]
+
+        if id_filter is not None:
+            allowed = id_filter(labels)
+            labels = labels[allowed]
+            distances = distances[allowed]
+
+            if len(labels) < top_k and k < len(self):
+                return None
+
+        return labels[:top_k], distances[:top_k]
+
+    def _reserve(self, count: int) -> None:
+        if count <= len(self._embeddings) and self._embeddings.flags.writeable:
+            return
+
+        capacity = max(count, len(self._embeddings) * 2, 1024)
+
+        # Copying also makes a memory-mapped index writable
+        embeddings = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        embeddings[: self._count] = self._embeddings[: self._count]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[: self._count] = self._ids[: self._count]
+        deleted = np.zeros(capacity, dtype=bool)
+        deleted[: self._count] = self._deleted[: self._count]
+
+        self._embeddings = embeddings
+        self._ids = ids
+        self._deleted = deleted
+
+    def _live_embeddings(self) -> np.ndarray:
+        if self._deleted_count == 0:
+            return self._embeddings[: self._count]
+
+        return self._embeddings[: self._count][~self._deleted[: self._count]]
+
+    def _compact(self) -> None:
+        """Drops the deleted rows from the arrays"""
+        kept = ~self._deleted[: self._count]
+        kept_count = int(kept.sum())
+        capacity = max(kept_count, 1024)
+
+        embeddings = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        embeddings[:kept_count] = self._embeddings[: self._count][kept]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:kept_count] = self._ids[: self._count][kept]
+
+        self._embeddings = embeddings
+        self._ids = ids
+        self._deleted = np.zeros(capacity, dtype=bool)
+        self._count = kept_count
+        self._deleted_count = 0
+
+    def _build_hnsw(self) -> None:
+        try:
+            import hnswlib
+        except ImportError:
+            logging.debug("hnswlib is not installed, the local vector index stays brute force")
+            self.hnsw_threshold = float("inf")
+            return
+
+        logging.info(f"Building an HNSW graph for {len(self)} embeddings")
+
+        self._hnsw = hnswlib.Index(space="cosine", dim=self.dimensions)
+        self._hnsw.init_index(
+            max_elements=max(len(self) * 2, 1024),
+            ef_construction=self.hnsw_ef_construction,
+            M=self.hnsw_m,
+            allow_replace_deleted=True,
+        )
+        self._hnsw.add_items(self._live_embeddings(), self.ids)
+
+    def _add_to_hnsw(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        needed = self._hnsw.get_current_count() + len(ids)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(needed * 2)
+
+        self._hnsw.add_items(embeddings, ids, replace_deleted=True)
+
+    def save(self, directory: str) -> None:
+        """Saves the index to a directory, replacing the files so a reader never sees a partial index"""
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            # The deleted rows are left out
+            self._save_file(directory, EMBEDDINGS_FILE_NAME, self._live_embeddings())
+            self._save_file(directory, IDS_FILE_NAME, self.ids)
+
+            hnsw_path = os.path.join(directory, HNSW_FILE_NAME)
+            if self._hnsw is not None:
+                self._hnsw.save_index(hnsw_path + ".tmp")
+                os.replace(hnsw_path + ".tmp", hnsw_path)
+            elif os.path.exists(hnsw_path):
+                os.remove(hnsw_path)
+
+    @staticmethod
+    def _save_file(directory: str, file_name: str, array: np.ndarray) -> None:
+        path = os.path.join(directory, file_name)
+
+        with open(path + ".tmp", "wb") as file:
+            np.save(file, array)
+
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory: str, dimensions: int, **kwargs) -> "NumpyVectorIndex":
+        """Loads a saved index, memory-mapping the embeddings, or returns None if there isn't one"""
+        embeddings_path = os.path.join(directory, EMBEDDINGS_FILE_NAME)
+        ids_path = os.path.join(directory, IDS_FILE_NAME)
+
+        if not os.path.exists(embeddings_path) or not os.path.exists(ids_path):
+            return None
+
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        ids = np.load(ids_path)
+
+        if embeddings.ndim != 2 or embeddings.shape[1] != dimensions or len(
+            embeddings
+        ) != len(ids):
+            logging.warning(f"Ignoring the saved vector index in {directory}, it doesn't match")
+            return None
+
+        index = cls(dimensions, **kwargs)
+        index._embeddings = embeddings
+        index._ids = ids
+        index._deleted = np.zeros(len(ids), dtype=bool)
+        index._count = len(ids)
+
+        hnsw_path = os.path.join(directory, HNSW_FILE_NAME)
+        if index._count >= index.hnsw_threshold:
+            try:
+                import hnswlib
+
+                if os.path.exists(hnsw_path):
+                    index._hnsw = hnswlib.Index(space="cosine", dim=dimensions)
+                    index._hnsw.load_index(
+                        hnsw_path,
+                        max_elements=max(index._count * 2, 1024),
+                        allow_replace_deleted=True,
+                    )
+                else:
+                    index._build_hnsw()
+            except ImportError:
+                index.hnsw_threshold = float("inf")
+
+        return index
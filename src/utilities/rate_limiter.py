@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+class TokenBucketRateLimiter:
+    """Thread-safe token bucket limiting requests per minute and (LLM) tokens per minute.
+
+    Each bucket starts full, and refills continuously at its per-minute rate.
+    A limit of None (or 0) means that dimension isn't limited.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None):
+        self.requests_per_minute = requests_per_minute or None
+        self.tokens_per_minute = tokens_per_minute or None
+
+        self._available_requests = float(self.requests_per_minute or 0)
+        self._available_tokens = float(self.tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Blocks until a request using the given number of tokens is allowed"""
+        if self.tokens_per_minute:
+            # A single request can never use more than the whole bucket
+            tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                self._refill()
+
+                wait_seconds = max(
+                    self._get_wait_seconds(
+                        self._available_requests, 1, self.requests_per_minute
+                    ),
+                    self._get_wait_seconds(
+                        self._available_tokens, tokens, self.tokens_per_minute
+                    ),
+                )
+
+                if wait_seconds <= 0:
+                    if self.requests_per_minute:
+                        self._available_requests -= 1
+                    if self.tokens_per_minute:
+                        self._available_tokens -= tokens
+                    return
+
+            time.sleep(wait_seconds)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed_minutes = (now - self._last_refill) / 60
+        self._last_refill = now
+
+        if self.requests_per_minute:
+            self._available_requests = min(
+                self.requests_per_minute,
+                self._available_requests + elapsed_minutes * self.requests_per_minute,
+            )
+
+        if self.tokens_per_minute:
+            self._available_tokens = min(
+                self.tokens_per_minute,
+                self._available_tokens + elapsed_minutes * self.tokens_per_minute,
+            )
+
+    @staticmethod
+    def _get_wait_seconds(available: float, needed: float, per_minute: int) -> float:
+        if not per_minute or available >= needed:
+            return 0
+
+        return (needed - available) / per_minute * 60
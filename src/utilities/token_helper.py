@@ -1,10 +1,55 @@
+from functools import lru_cache
+from typing import List
+
 import tiktoken
 
-def num_tokens_from_string(string: str, encoding_name: str = "gpt-3.5-turbo") -> int:
-    encoding = tiktoken.encoding_for_model(encoding_name)
-    num_tokens = len(encoding.encode(string))
+# The encoding used for models tiktoken doesn't know about (e.g. local models)
+DEFAULT_ENCODING_NAME = "cl100k_base"
+
+# The model whose encoding is used to count tokens when no model is given
+DEFAULT_TOKEN_MODEL_NAME = "gpt-3.5-turbo"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING_NAME) -> tiktoken.Encoding:
+    """Gets a tiktoken encoding by name, loading each one only once."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def get_encoding_for_model(model_name: str = None) -> tiktoken.Encoding:
+    """Gets the tiktoken encoding for a model, falling back to cl100k_base if tiktoken doesn't know the model."""
+    if model_name:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            pass
+
+    return get_encoding(DEFAULT_ENCODING_NAME)
+
+
+def num_tokens_from_string(
+    string: str, encoding_name: str = DEFAULT_TOKEN_MODEL_NAME
+) -> int:
+    # Note: despite the name, encoding_name is a model name
+    encoding = get_encoding_for_model(encoding_name)
+    num_tokens = len(encoding.encode(string, disallowed_special=()))
     return num_tokens
 
+
+def count_tokens(
+    strings: List[str], model_name: str = DEFAULT_TOKEN_MODEL_NAME
+) -> List[int]:
+    """Counts the tokens in many strings at once (encoded in parallel by tiktoken)."""
+    if not strings:
+        return []
+
+    encoding = get_encoding_for_model(model_name)
+
+    return [
+        len(tokens) for tokens in encoding.encode_batch(strings, disallowed_special=())
+    ]
+
 def num_tokens_from_messages(messages, model="gpt-3.5-turbo-0613"):
     """Return the number of tokens used by a list of messages."""
     try:
@@ -0,0 +1,108 @@
+from bisect import bisect_left
+from typing import List
+
+from langchain.text_splitter import TextSplitter
+
+from src.utilities.token_helper import DEFAULT_TOKEN_MODEL_NAME, get_encoding_for_model
+
+# Splits text into chunks of at most chunk_size tokens, like a RecursiveCharacterTextSplitter with a
+# token counting length function, but each text is only encoded once- the chunks are cut on token
+# offsets, moved back to the nearest paragraph/line/word boundary that fits.
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " "]
+
+
+class TokenAwareTextSplitter(TextSplitter):
+    def __init__(
+        self,
+        chunk_size: int = 4000,
+        chunk_overlap: int = 200,
+        model_name: str = DEFAULT_TOKEN_MODEL_NAME,
+        separators: List[str] = None,
+        **kwargs,
+    ):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+
+        self._encoding = get_encoding_for_model(model_name)
+        # In order of preference
+        self._separators = separators or DEFAULT_SEPARATORS
+
+    def split_text(self, text: str) -> List[str]:
+        tokens = self._encoding.encode(text, disallowed_special=())
+
+        if not tokens:
+            return []
+
+        # The character offset each token starts at
+        text, offsets = self._encoding.decode_with_offsets(tokens)
+        token_count = len(tokens)
+
+        chunks = []
+        start = 0
+        previous_end = 0
+        while start < token_count:
+            end = min(start + self._chunk_size, token_count)
+
+            if end < token_count:
+                # Every chunk has to go past the end of the one before it (not just repeat its overlap),
+                # and a boundary that would leave the chunk less than half full isn't worth it
+                end = self._get_boundary_end(
+                    text,
+                    offsets,
+                    max(start + self._chunk_size // 2, previous_end),
+                    end,
+                )
+
+            chunk_text = text[offsets[start] : offsets[end] if end < token_count else len(text)]
+            if getattr(self, "_strip_whitespace", True):
+                chunk_text = chunk_text.strip()
+            if chunk_text:
+                chunks.append(chunk_text)
+
+            if end >= token_count:
+                break
+
+            start = self._get_overlap_start(text, offsets, start, end)
+            previous_end = end
+
+        return chunks
+
+    def _get_boundary_end(
+        self, text: str, offsets: List[int], min_end: int, end: int
+    ) -> int:
+        """Moves the end of a chunk back (to after min_end) to the token at the last separator in it, in order of preference"""
+        if min_end + 1 >= end:
+            return end
+
+        for separator in self._separators:
+            # Only separators from the token after min_end on, so the chunk can't end at min_end
+            separator_position = text.rfind(
+                separator, offsets[min_end + 1], offsets[end]
+            )
+
+            if separator_position >= 0:
+                # The first token that starts at (or after) the separator
+                return bisect_left(offsets, separator_position, min_end + 1, end)
+
+        # No separator, cut it at the token limit
+        return end
+
+    def _get_overlap_start(
+        self, text: str, offsets: List[int], start: int, end: int
+    ) -> int:
+        """Starts the next chunk up to chunk_overlap tokens before the end of this one, at a word boundary"""
+        overlap_start = max(end - self._chunk_overlap, start + 1)
+
+        if overlap_start < end:
+            for separator in reversed(self._separators):
+                separator_position = text.find(
+                    separator, offsets[overlap_start], offsets[end]
+                )
+
+                if separator_position >= 0:
+                    return max(
+                        bisect_left(offsets, separator_position, overlap_start, end),
+                        start + 1,
+                    )
+
+        return end
@@ -0,0 +1,191 @@
+import random
+import unittest
+from unittest.mock import patch
+from uuid import uuid4
+
+from sqlalchemy import delete, text
+
+from src.db.database.tables import (
+    Document,
+    DocumentCollection,
+    DocumentEmbedding,
+    File,
+)
+from src.db.database.vector_index_utilities import (
+    DEFAULT_VECTOR_INDEX_CONFIGURATION,
+    VECTOR_STORAGE,
+    create_document_embedding_indexes,
+    get_vector_index_name,
+)
+from src.db.models.documents import Documents
+from src.db.models.vector_database import SearchType, VectorDatabase
+
+# Searches an HNSW index shared by two collections. These tests need the database (docker-compose up).
+
+DIMENSIONS = 3
+LARGE_COLLECTION_CHUNKS = 500
+SMALL_FILE_CHUNKS = 5
+
+
+@unittest.skipUnless(VectorDatabase.database_exists(), "The database is not available")
+class TestDocumentSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.documents = Documents()
+        cls.model_name = f"test-model-{uuid4().hex[:8]}"
+        cls.query_embedding = [1.0, 0.0, 0.0]
+
+        random.seed(0)
+
+        with cls.documents.session_context(cls.documents.Session()) as session:
+            cls.large_collection_id = cls._add_collection(session)
+            cls.small_collection_id = cls._add_collection(session)
+
+            # Every chunk of the large collection is nearer to the query than any chunk of the small one,
+            # so an index scan's first candidates all belong to the large collection
+            cls._add_file(
+                session,
+                cls.large_collection_id,
+                LARGE_COLLECTION_CHUNKS,
+                lambda: [1.0, random.uniform(0, 0.1), random.uniform(0, 0.1)],
+            )
+            cls.small_file_id = cls._add_file(
+                session,
+                cls.small_collection_id,
+                SMALL_FILE_CHUNKS,
+                lambda: [random.uniform(0, 0.1), 1.0, random.uniform(0, 0.1)],
+            )
+
+        with cls.documents.Session() as session:
+            create_document_embedding_indexes(
+                session.connection(),
+                cls.model_name,
+                DIMENSIONS,
+                VECTOR_STORAGE,
+                DEFAULT_VECTOR_INDEX_CONFIGURATION,
+            )
+            session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        collection_ids = [cls.large_collection_id, cls.small_collection_id]
+
+        with cls.documents.session_context(cls.documents.Session()) as session:
+            session.execute(
+                text(
+                    f"DROP INDEX IF EXISTS {get_vector_index_name('document_embeddings', 'embedding', cls.model_name)}"
+                )
+            )
+            session.execute(
+                delete(DocumentEmbedding).where(
+                    DocumentEmbedding.collection_id.in_(collection_ids)
+                )
+            )
+            session.execute(
+                delete(Document).where(Document.collection_id.in_(collection_ids))
+            )
+            session.execute(delete(File).where(File.collection_id.in_(collection_ids)))
+            session.execute(
+                delete(DocumentCollection).where(
+                    DocumentCollection.id.in_(collection_ids)
+                )
+            )
+
+    @classmethod
+    def _add_collection(cls, session) -> int:
+        collection = DocumentCollection(
+            collection_name=f"test-{uuid4()}", embedding_name=cls.model_name
+        )
+        session.add(collection)
+        session.flush()
+
+        return collection.id
+
+    @classmethod
+    def _add_file(cls, session, collection_id, chunk_count, get_embedding) -> int:
+        file = File(
+            collection_id=collection_id,
+            file_name=f"test-{uuid4()}.txt",
+            file_hash=uuid4().hex,
+            chunk_size=500,
+            chunk_overlap=50,
+            file_data=b"",
+        )
+        session.add(file)
+        session.flush()
+
+        for chunk_index in range(chunk_count):
+            document = Document(
+                collection_id=collection_id,
+                file_id=file.id,
+                additional_metadata={"page": chunk_index},
+                document_text=f"chunk {chunk_index}",
+                document_name=file.file_name,
+                embedding_model_name=cls.model_name,
+                chunk_index=chunk_index,
+            )
+            session.add(document)
+            session.flush()
+
+            session.add(
+                DocumentEmbedding(
+                    document_id=document.id,
+                    collection_id=collection_id,
+                    kind="text",
+                    embedding_model_name=cls.model_name,
+                    embedding=get_embedding(),
+                )
+            )
+
+        return file.id
+
+    def _search(self, collection_id, target_file_id=None, **kwargs):
+        # A small ef_search and no iterative scan, so an index scan alone would run out of candidates
+        index_configuration = dict(
+            DEFAULT_VECTOR_INDEX_CONFIGURATION,
+            hnsw_ef_search=10,
+            iterative_scan="off",
+        )
+
+        with patch(
+            "src.db.models.documents.get_embedding_model_name",
+            return_value=self.model_name,
+        ), patch(
+            "src.db.models.documents.get_embedding_dimensions",
+            return_value=DIMENSIONS,
+        ), patch(
+            "src.db.models.documents.get_embedding_by_model",
+            return_value=self.query_embedding,
+        ), patch(
+            "src.db.models.documents.get_vector_index_configuration",
+            return_value=index_configuration,
+        ), patch(
+            "src.db.models.documents.is_local_vector_index_enabled",
+            return_value=False,
+        ):
+            return self.documents.search_document_embeddings(
+                search_query="query",
+                search_type=SearchType.Similarity,
+                collection_id=collection_id,
+                target_file_id=target_file_id,
+                top_k=SMALL_FILE_CHUNKS,
+                search_questions=False,
+                **kwargs,
+            )
+
+    def test_single_file_search_returns_top_k(self):
+        results = self._search(self.small_collection_id, self.small_file_id)
+
+        self.assertEqual(len(results), SMALL_FILE_CHUNKS)
+        self.assertTrue(all(r.file_id == self.small_file_id for r in results))
+
+    def test_metadata_filtered_search_returns_top_k(self):
+        results = self._search(
+            self.small_collection_id, page_range=(0, SMALL_FILE_CHUNKS - 1)
+        )
+
+        self.assertEqual(len(results), SMALL_FILE_CHUNKS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from src.documents.document_parsing_pool import DocumentParsingPool
+
+# The worker processes are spawned, so they load files with this module's _load_test_file- what it
+# does depends on the file name.
+
+
+def _load_test_file(file_path: str, converted_file_maps: dict) -> list:
+    if file_path.startswith("hang"):
+        time.sleep(600)
+    elif file_path.startswith("crash"):
+        os._exit(1)
+    elif file_path.startswith("error"):
+        raise ValueError(f"Can't parse {file_path}")
+
+    return [f"contents of {file_path}"]
+
+
+@patch("src.documents.document_parsing_pool._load_file", _load_test_file)
+class TestDocumentParsingPool(unittest.TestCase):
+    def _parse(self, file_paths: list, **kwargs) -> dict:
+        pool = DocumentParsingPool(max_workers=2, **kwargs)
+
+        results = dict(pool.parse_files(file_paths))
+
+        # Every file gets exactly one result
+        self.assertEqual(sorted(results.keys()), sorted(file_paths))
+
+        return results
+
+    def assertParsed(self, results: dict, file_paths: list):
+        for file_path in file_paths:
+            self.assertEqual(results[file_path], [f"contents of {file_path}"])
+
+    def test_parses_files(self):
+        file_paths = [f"file_{i}.txt" for i in range(5)]
+
+        results = self._parse(file_paths)
+
+        self.assertParsed(results, file_paths)
+
+    def test_error_only_fails_that_file(self):
+        results = self._parse(["a.txt", "error.txt", "b.txt"])
+
+        self.assertIsInstance(results["error.txt"], ValueError)
+        self.assertParsed(results, ["a.txt", "b.txt"])
+
+    def test_timeout_only_fails_that_file(self):
+        started = time.monotonic()
+
+        results = self._parse(
+            ["hang.txt", "a.txt", "b.txt", "c.txt"], timeout_seconds=5
+        )
+
+        self.assertIsInstance(results["hang.txt"], TimeoutError)
+        self.assertParsed(results, ["a.txt", "b.txt", "c.txt"])
+        # The hung worker was stopped, not waited for
+        self.assertLess(time.monotonic() - started, 120)
+
+    def test_crash_only_fails_that_file(self):
+        results = self._parse(
+            ["crash.txt", "a.txt", "b.txt", "c.txt"], max_attempts=2
+        )
+
+        self.assertIsInstance(results["crash.txt"], ValueError)
+        self.assertIn("crashed", str(results["crash.txt"]))
+        self.assertParsed(results, ["a.txt", "b.txt", "c.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
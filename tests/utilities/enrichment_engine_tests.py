@@ -0,0 +1,38 @@
+import unittest
+
+from src.ai.utilities.enrichment_engine import (
+    PROMPT_TEMPLATE_TOKENS,
+    estimate_call_tokens,
+)
+from src.configuration.model_configuration import ModelConfiguration
+from src.utilities.token_helper import num_tokens_from_string
+
+
+class TestEstimateCallTokens(unittest.TestCase):
+    def setUp(self):
+        self.model_configuration = ModelConfiguration.default()
+
+    def test_counts_prompt_template_and_completion_tokens(self):
+        text = "The quick brown fox jumps over the lazy dog."
+
+        self.assertEqual(
+            estimate_call_tokens(text, self.model_configuration),
+            num_tokens_from_string(text, self.model_configuration.model)
+            + PROMPT_TEMPLATE_TOKENS
+            + self.model_configuration.max_completion_tokens,
+        )
+
+    def test_special_token_text_is_counted_as_plain_text(self):
+        # Ingested documents can contain anything, including text that looks like a special token
+        text = "Before <|endoftext|> after <|im_start|>"
+
+        estimate = estimate_call_tokens(text, self.model_configuration)
+
+        self.assertGreater(
+            estimate,
+            PROMPT_TEMPLATE_TOKENS + self.model_configuration.max_completion_tokens,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import importlib.util
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from src.utilities.local_vector_index import NumpyVectorIndex
+
+DIMENSIONS = 16
+
+HNSWLIB_INSTALLED = importlib.util.find_spec("hnswlib") is not None
+
+
+def _make_embeddings(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, DIMENSIONS)).astype(np.float32)
+
+
+class TestNumpyVectorIndex(unittest.TestCase):
+    def _create_index(self, count: int = 200, **kwargs) -> tuple:
+        kwargs.setdefault("hnsw_threshold", 10**9)
+        index = NumpyVectorIndex(DIMENSIONS, **kwargs)
+        embeddings = _make_embeddings(count)
+        index.add(np.arange(count), embeddings)
+
+        return index, embeddings
+
+    def test_add_and_search(self):
+        index, embeddings = self._create_index()
+
+        ids, distances = index.search(embeddings[42], top_k=5)
+
+        self.assertEqual(len(index), 200)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids[0], 42)
+        self.assertAlmostEqual(float(distances[0]), 0.0, places=5)
+        # Nearest first
+        self.assertTrue(np.all(np.diff(distances) >= 0))
+
+    def test_add_replaces_the_same_id(self):
+        index, embeddings = self._create_index()
+
+        index.add(np.asarray([42]), embeddings[7:8])
+
+        self.assertEqual(len(index), 200)
+        ids, _ = index.search(embeddings[7], top_k=2)
+        self.assertEqual(set(ids.tolist()), {7, 42})
+        ids, _ = index.search(embeddings[42], top_k=1)
+        self.assertNotEqual(ids[0], 42)
+
+    def test_remove(self):
+        index, embeddings = self._create_index()
+
+        index.remove(np.asarray([42, 43]))
+
+        self.assertEqual(len(index), 198)
+        # Only marked as deleted, the rows aren't copied
+        self.assertEqual(index._count, 200)
+        self.assertNotIn(42, index.ids)
+        ids, _ = index.search(embeddings[42], top_k=198)
+        self.assertEqual(len(ids), 198)
+        self.assertFalse({42, 43} & set(ids.tolist()))
+
+    def test_remove_compacts_once_enough_are_deleted(self):
+        index, embeddings = self._create_index()
+
+        index.remove(np.arange(100))
+
+        self.assertEqual(len(index), 100)
+        self.assertEqual(index._count, 100)
+        self.assertEqual(sorted(index.ids.tolist()), list(range(100, 200)))
+        ids, _ = index.search(embeddings[150], top_k=1)
+        self.assertEqual(ids[0], 150)
+
+    def test_search_with_filter(self):
+        index, embeddings = self._create_index()
+
+        ids, _ = index.search(
+            embeddings[42], top_k=10, id_filter=lambda ids: ids % 2 == 1
+        )
+
+        self.assertEqual(len(ids), 10)
+        self.assertTrue(np.all(ids % 2 == 1))
+
+    def test_save_and_load(self):
+        index, embeddings = self._create_index()
+        index.remove(np.asarray([42]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = NumpyVectorIndex.load(directory, DIMENSIONS, hnsw_threshold=10**9)
+
+            self.assertEqual(len(loaded), 199)
+            ids, _ = loaded.search(embeddings[10], top_k=1)
+            self.assertEqual(ids[0], 10)
+
+            # The loaded (memory-mapped) index can still be changed
+            loaded.add(np.asarray([500]), embeddings[42:43])
+            loaded.remove(np.asarray([10]))
+            ids, _ = loaded.search(embeddings[42], top_k=1)
+            self.assertEqual(ids[0], 500)
+            self.assertEqual(len(loaded), 199)
+
+    def test_stays_brute_force_without_hnswlib(self):
+        with patch.dict(sys.modules, {"hnswlib": None}):
+            index, embeddings = self._create_index(hnsw_threshold=50)
+
+        self.assertIsNone(index._hnsw)
+        ids, _ = index.search(embeddings[42], top_k=1)
+        self.assertEqual(ids[0], 42)
+
+    @unittest.skipUnless(HNSWLIB_INSTALLED, "hnswlib is not installed")
+    def test_hnsw(self):
+        index, embeddings = self._create_index(hnsw_threshold=50)
+
+        self.assertIsNotNone(index._hnsw)
+        ids, _ = index.search(embeddings[42], top_k=1)
+        self.assertEqual(ids[0], 42)
+
+        index.remove(np.asarray([42]))
+        ids, _ = index.search(embeddings[42], top_k=5)
+        self.assertNotIn(42, ids.tolist())
+
+    @unittest.skipUnless(HNSWLIB_INSTALLED, "hnswlib is not installed")
+    def test_hnsw_falls_back_to_brute_force_for_narrow_filters(self):
+        index, embeddings = self._create_index(hnsw_threshold=50)
+
+        # Only 3 of the embeddings pass the filter, so the graph's over-fetched results can't have enough
+        allowed = np.asarray([3, 97, 151])
+        with patch.object(
+            index, "_search_brute_force", wraps=index._search_brute_force
+        ) as search_brute_force:
+            ids, _ = index.search(
+                embeddings[42],
+                top_k=3,
+                id_filter=lambda ids: np.isin(ids, allowed),
+            )
+
+        search_brute_force.assert_called_once()
+        self.assertEqual(sorted(ids.tolist()), allowed.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+
+from src.utilities.rate_limiter import TokenBucketRateLimiter
+
+
+class FakeClock:
+    """Stands in for the time module, sleeping just moves the clock forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        self.slept += seconds
+
+
+class TestTokenBucketRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch("src.utilities.rate_limiter.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_starts_full(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=10)
+
+        for _ in range(10):
+            limiter.acquire()
+
+        self.assertEqual(self.clock.slept, 0)
+
+    def test_empty_bucket_waits_for_refill(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=60)
+
+        for _ in range(60):
+            limiter.acquire()
+        limiter.acquire()
+
+        # One request refills every second
+        self.assertAlmostEqual(self.clock.slept, 1.0)
+
+    def test_bucket_refills_with_elapsed_time(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=60)
+
+        for _ in range(60):
+            limiter.acquire()
+
+        self.clock.now += 30
+        for _ in range(30):
+            limiter.acquire()
+
+        self.assertEqual(self.clock.slept, 0)
+
+    def test_bucket_never_refills_past_full(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=10)
+
+        self.clock.now += 600
+        for _ in range(10):
+            limiter.acquire()
+        limiter.acquire()
+
+        self.assertAlmostEqual(self.clock.slept, 6.0)
+
+    def test_tokens_per_minute(self):
+        limiter = TokenBucketRateLimiter(tokens_per_minute=6000)
+
+        limiter.acquire(tokens=6000)
+        limiter.acquire(tokens=1500)
+
+        # 1500 tokens refill in 15 seconds
+        self.assertAlmostEqual(self.clock.slept, 15.0)
+
+    def test_request_larger_than_bucket_is_capped(self):
+        limiter = TokenBucketRateLimiter(tokens_per_minute=1000)
+
+        limiter.acquire(tokens=5000)
+        limiter.acquire(tokens=5000)
+
+        self.assertAlmostEqual(self.clock.slept, 60.0)
+
+    def test_no_limits(self):
+        limiter = TokenBucketRateLimiter()
+
+        for _ in range(1000):
+            limiter.acquire(tokens=100000)
+
+        self.assertEqual(self.clock.slept, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import random
+import unittest
+
+from src.utilities.token_helper import get_encoding_for_model
+from src.utilities.token_text_splitter import TokenAwareTextSplitter
+
+MODEL_NAME = "gpt-3.5-turbo"
+
+
+def _make_text(paragraphs: int, seed: int = 0) -> str:
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    rng = random.Random(seed)
+
+    return "\n\n".join(
+        "\n".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(3, 25)))
+            for _ in range(rng.randint(1, 4))
+        )
+        for _ in range(paragraphs)
+    )
+
+
+class TestTokenAwareTextSplitter(unittest.TestCase):
+    def setUp(self):
+        self.encoding = get_encoding_for_model(MODEL_NAME)
+
+    def _get_spans(self, text: str, chunks: list) -> list:
+        """Finds where each chunk is in the text, in order"""
+        spans = []
+        search_from = 0
+        for chunk in chunks:
+            start = text.find(chunk, search_from)
+            self.assertGreaterEqual(start, 0, f"Chunk not found in order: {chunk!r}")
+            spans.append((start, start + len(chunk)))
+            search_from = start + 1
+
+        return spans
+
+    def test_chunks_fit_chunk_size(self):
+        text = _make_text(200)
+
+        for chunk_size, chunk_overlap in [(50, 0), (50, 10), (128, 32), (7, 3)]:
+            splitter = TokenAwareTextSplitter(
+                chunk_size=chunk_size, chunk_overlap=chunk_overlap, model_name=MODEL_NAME
+            )
+
+            for chunk in splitter.split_text(text):
+                self.assertLessEqual(
+                    len(self.encoding.encode(chunk, disallowed_special=())), chunk_size
+                )
+
+    def test_chunks_cover_the_whole_text(self):
+        text = _make_text(100, seed=1)
+        splitter = TokenAwareTextSplitter(
+            chunk_size=40, chunk_overlap=10, model_name=MODEL_NAME
+        )
+
+        chunks = splitter.split_text(text)
+        spans = self._get_spans(text, chunks)
+
+        # Only whitespace can be left between (or around) the chunks
+        covered_to = 0
+        for start, end in spans:
+            self.assertEqual(text[covered_to:start].strip(), "")
+            covered_to = max(covered_to, end)
+        self.assertEqual(text[covered_to:].strip(), "")
+
+    def test_chunks_make_forward_progress(self):
+        # No separators, and an overlap of nearly the whole chunk
+        rng = random.Random(2)
+        text = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(5000))
+        splitter = TokenAwareTextSplitter(
+            chunk_size=20, chunk_overlap=19, model_name=MODEL_NAME
+        )
+
+        chunks = splitter.split_text(text)
+        spans = self._get_spans(text, chunks)
+
+        for (previous_start, previous_end), (start, end) in zip(spans, spans[1:]):
+            self.assertGreater(start, previous_start)
+            self.assertGreater(end, previous_end)
+        self.assertEqual(spans[-1][1], len(text))
+
+    def test_special_tokens_are_plain_text(self):
+        splitter = TokenAwareTextSplitter(
+            chunk_size=20, chunk_overlap=0, model_name=MODEL_NAME
+        )
+
+        chunks = splitter.split_text("before <|endoftext|> after")
+
+        self.assertEqual(" ".join(chunks), "before <|endoftext|> after")
+
+    def test_empty_text(self):
+        splitter = TokenAwareTextSplitter(chunk_size=20, chunk_overlap=0)
+
+        self.assertEqual(splitter.split_text(""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()